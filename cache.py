@@ -0,0 +1,117 @@
+import hashlib
+import marshal
+import os
+import tempfile
+import zlib
+from typing import Any, Dict, NamedTuple, Optional
+
+# bump whenever the generated code changes, so stale entries are never hit
+COMPILER_VERSION = "1"
+
+SUFFIX = ".tac"
+
+
+class CacheEntry(NamedTuple):
+    code: str  # three-address code written to the output
+    instructions: list[str]  # instruction listing printed by Compiler.compile
+
+
+class CompileCache:
+    """
+    On-disk cache of compiled programs, keyed by the hash of the source, the compiler version and the options.
+
+    Entries are written to a temporary file and renamed into place, so concurrent builds sharing the
+    directory never read a partial entry. When the directory grows over max_size bytes the least
+    recently used entries are removed. The size is counted from the directory on the first put and then kept
+    by put itself; entries written by other builds are counted again when it evicts.
+    """
+
+    def __init__(self, directory: str, max_size: int = 64 << 20):
+        self.directory = directory
+        self.max_size = max_size
+        # bytes of the entries, None until the first put
+        self.size: Optional[int] = None
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(source: str, options: Optional[Dict[str, Any]] = None) -> str:
+        digest = hashlib.sha256()
+        digest.update(COMPILER_VERSION.encode())
+        digest.update(repr(sorted((options or {}).items())).encode())
+        digest.update(b"\0")
+        digest.update(source.encode())
+        return digest.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        path = self.path(key)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+            entry = CacheEntry(*marshal.loads(zlib.decompress(data)))
+        except FileNotFoundError:
+            return None
+        except (zlib.error, ValueError, EOFError, TypeError):
+            # written by an incompatible interpreter or damaged, compile again
+            return None
+
+        try:
+            # the modification time is the last use for the eviction
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return entry
+
+    def put(self, key: str, entry: CacheEntry):
+        data = zlib.compress(marshal.dumps(tuple(entry)))
+        if self.size is None:
+            self.size = sum(size for _, size, _ in self.entries())
+        path = self.path(key)
+        try:
+            replaced = os.stat(path).st_size
+        except FileNotFoundError:
+            replaced = 0
+
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+        self.size += len(data) - replaced
+        if self.size > self.max_size:
+            self.evict()
+
+    def entries(self) -> list[tuple[float, int, str]]:
+        """
+        Last use, size and path of every entry in the directory.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                # removed by another build
+                pass
+            total -= size
+        self.size = total
@@ -0,0 +1,441 @@
+from typing import Callable, Iterator, Optional
+
+from ir import OPERATOR_SYMBOLS, Label, Op, Quad, Temp
+
+BRANCHES = frozenset((Op.IF_FALSE, Op.IF_TRUE))
+JUMPS = frozenset((Op.GOTO, Op.RETURN)) | BRANCHES
+DECLARATIONS = frozenset((Op.FUNCTION, Op.PROCEDURE))
+DECLARATION_ENDS = frozenset((Op.END_FUNCTION, Op.END_PROCEDURE))
+
+
+class BasicBlock:
+    __slots__ = ("index", "quads", "successors", "predecessors")
+
+    def __init__(self, index: int):
+        self.index = index
+        self.quads: list[Quad] = []
+        self.successors: list[BasicBlock] = []
+        self.predecessors: list[BasicBlock] = []
+
+    @property
+    def label(self) -> Optional[Label]:
+        return self.quads[0].arg1 if self.quads and self.quads[0].op == Op.LABEL else None
+
+    def __repr__(self):
+        return f"BasicBlock({self.index}, {len(self.quads)} quads, -> {[block.index for block in self.successors]})"
+
+
+class Procedure:
+    """
+    Code of a function or procedure, or the top-level code when header is None, as a control flow graph.
+    A function declared inside it stays in its code as the FUNCTION/PROCEDURE header, which does nothing
+    when executed; the declared function is a Procedure of its own.
+    """
+
+    __slots__ = ("header", "end", "blocks")
+
+    def __init__(self, header: Optional[Quad], quads: list[Quad]):
+        self.header = header
+        self.end: Optional[Quad] = None
+        self.blocks = build_blocks(quads)
+
+    @property
+    def quads(self) -> Iterator[Quad]:
+        for block in self.blocks:
+            yield from block.quads
+
+    def rebuild(self):
+        """
+        Split the code in blocks again, after a pass removed instructions or changed jumps.
+        """
+        self.blocks = build_blocks(list(self.quads))
+
+    def __repr__(self):
+        name = self.header.arg1 if self.header is not None else "<top level>"
+        return f"Procedure({name}, {len(self.blocks)} blocks)"
+
+
+def build_blocks(quads: list[Quad]) -> list[BasicBlock]:
+    """
+    Split the code in basic blocks, which start at a label or after a jump, and link them.
+    """
+    blocks: list[BasicBlock] = []
+    block = None
+    for quad in quads:
+        if block is None or quad.op == Op.LABEL:
+            block = BasicBlock(len(blocks))
+            blocks.append(block)
+        block.quads.append(quad)
+        if quad.op in JUMPS:
+            block = None
+
+    link_blocks(blocks)
+    return blocks
+
+
+def link_blocks(blocks: list[BasicBlock]):
+    """
+    Recompute the successors and predecessors of every block from its last instruction.
+    """
+    targets = {block.label: block for block in blocks if block.label is not None}
+    for block in blocks:
+        block.successors = []
+        block.predecessors = []
+
+    for index, block in enumerate(blocks):
+        last = block.quads[-1]
+        following = blocks[index + 1] if index + 1 < len(blocks) else None
+        if last.op == Op.GOTO:
+            successors = [targets[last.arg1]]
+        elif last.op in BRANCHES:
+            successors = [following, targets[last.arg2]]
+        elif last.op == Op.RETURN:
+            successors = []
+        else:
+            successors = [following]
+
+        for successor in successors:
+            if successor is not None and successor not in block.successors:
+                block.successors.append(successor)
+                successor.predecessors.append(block)
+
+
+def split_procedures(code: list[Quad]) -> list[Procedure]:
+    """
+    Control flow graphs of the top-level code, first, and of every function and procedure.
+    """
+    headers: list[Optional[Quad]] = [None]
+    bodies: list[list[Quad]] = [[]]
+    ends: list[Optional[Quad]] = [None]
+    # indexes in headers/bodies of the declarations being read
+    open_declarations = [0]
+    for quad in code:
+        if quad.op in DECLARATIONS:
+            bodies[open_declarations[-1]].append(quad)
+            open_declarations.append(len(bodies))
+            headers.append(quad)
+            bodies.append([])
+            ends.append(None)
+        elif quad.op in DECLARATION_ENDS:
+            ends[open_declarations.pop()] = quad
+        else:
+            bodies[open_declarations[-1]].append(quad)
+
+    procedures = []
+    for header, body, end in zip(headers, bodies, ends):
+        procedure = Procedure(header, body)
+        procedure.end = end
+        procedures.append(procedure)
+    return procedures
+
+
+def join_procedures(procedures: list[Procedure]) -> list[Quad]:
+    """
+    Inverse of split_procedures: the code of the top level with the declared functions back in place.
+    """
+    declared = {id(procedure.header): procedure for procedure in procedures[1:]}
+    code: list[Quad] = []
+
+    pending = [iter(procedures[0].quads)]
+    while pending:
+        quad = next(pending[-1], None)
+        if quad is None:
+            pending.pop()
+            continue
+
+        code.append(quad)
+        if quad.op in DECLARATIONS:
+            # the body, then its end, before going on with the enclosing code
+            procedure = declared[id(quad)]
+            pending.append(iter([procedure.end]))
+            pending.append(iter(procedure.quads))
+
+    return code
+
+
+def jump_target(quad: Quad) -> Optional[Label]:
+    if quad.op == Op.GOTO:
+        return quad.arg1
+    elif quad.op in BRANCHES:
+        return quad.arg2
+    return None
+
+
+def uses(quad: Quad) -> Iterator:
+    """
+    Operands the instruction reads.
+    """
+    op = quad.op
+    if op == Op.CALL:
+        yield from quad.arg2
+    elif op == Op.PRINT or op == Op.PHI:
+        yield from quad.arg1
+    elif op == Op.COPY or op == Op.NOT or op == Op.RETURN or op in BRANCHES:
+        yield quad.arg1
+    elif op in OPERATOR_SYMBOLS:
+        yield quad.arg1
+        yield quad.arg2
+
+
+def substitute(quad: Quad, replace: Callable):
+    """
+    Replace every operand the instruction reads by replace(operand).
+    """
+    op = quad.op
+    if op == Op.CALL:
+        quad.arg2 = tuple(map(replace, quad.arg2))
+    elif op == Op.PRINT or op == Op.PHI:
+        quad.arg1 = tuple(map(replace, quad.arg1))
+    elif op == Op.COPY or op == Op.NOT or op == Op.RETURN or op in BRANCHES:
+        quad.arg1 = replace(quad.arg1)
+    elif op in OPERATOR_SYMBOLS:
+        quad.arg1 = replace(quad.arg1)
+        quad.arg2 = replace(quad.arg2)
+
+
+def liveness(blocks: list[BasicBlock], is_name: Callable) -> tuple[list[set], list[set]]:
+    """
+    Operands for which is_name(operand) is true that are live at the start and at the end of every block.
+    """
+    used: list[set] = []
+    defined: list[set] = []
+    for block in blocks:
+        block_used = set()
+        block_defined = set()
+        for quad in block.quads:
+            for operand in uses(quad):
+                if is_name(operand) and operand not in block_defined:
+                    block_used.add(operand)
+            if is_name(quad.dest):
+                block_defined.add(quad.dest)
+        used.append(block_used)
+        defined.append(block_defined)
+
+    live_in: list[set] = [set() for _ in blocks]
+    live_out: list[set] = [set() for _ in blocks]
+    changed = True
+    while changed:
+        changed = False
+        for block in reversed(blocks):
+            index = block.index
+            out = set()
+            for successor in block.successors:
+                out |= live_in[successor.index]
+            live = used[index] | (out - defined[index])
+            if out != live_out[index] or live != live_in[index]:
+                live_out[index] = out
+                live_in[index] = live
+                changed = True
+
+    return live_in, live_out
+
+
+def temporary_liveness(blocks: list[BasicBlock]) -> tuple[list[set[Temp]], list[set[Temp]]]:
+    """
+    Temporaries live at the start and at the end of every block. Temporaries belong to a single procedure,
+    so calls don't read or write them.
+    """
+    return liveness(blocks, lambda operand: isinstance(operand, Temp))
+
+
+def _immediate_dominators(
+    root: int, successors: list[list[int]], predecessors: list[list[int]]
+) -> list[Optional[int]]:
+    """
+    Cooper, Harvey and Kennedy's iterative algorithm over the nodes in reverse postorder. Nodes unreachable
+    from root get None, and root is its own dominator.
+    """
+    count = len(successors)
+    postorder: list[int] = []
+    visited = [False] * count
+    visited[root] = True
+    stack = [(root, iter(successors[root]))]
+    while stack:
+        node, pending = stack[-1]
+        for successor in pending:
+            if not visited[successor]:
+                visited[successor] = True
+                stack.append((successor, iter(successors[successor])))
+                break
+        else:
+            stack.pop()
+            postorder.append(node)
+
+    position = [-1] * count
+    for index, node in enumerate(postorder):
+        position[node] = index
+
+    idom: list[Optional[int]] = [None] * count
+    idom[root] = root
+    changed = True
+    while changed:
+        changed = False
+        for node in reversed(postorder):
+            if node == root:
+                continue
+            new = None
+            for predecessor in predecessors[node]:
+                if idom[predecessor] is None:
+                    continue
+                if new is None:
+                    new = predecessor
+                    continue
+                # walk up from both until they meet
+                a, b = predecessor, new
+                while a != b:
+                    while position[a] < position[b]:
+                        a = idom[a]
+                    while position[b] < position[a]:
+                        b = idom[b]
+                new = a
+            if idom[node] != new:
+                idom[node] = new
+                changed = True
+
+    return idom
+
+
+class DominatorTree:
+    """
+    Immediate dominators of the blocks of a procedure, or immediate post-dominators when built with
+    post_dominator_tree. dominates() is answered in constant time from the order of a walk of the tree.
+    """
+
+    __slots__ = ("blocks", "parents", "children", "enter", "leave")
+
+    def __init__(self, blocks: list[BasicBlock], parents: list[Optional[int]], roots: list[int]):
+        self.blocks = blocks
+        # index of the immediate dominator of every block, None for the roots and for blocks they don't reach
+        self.parents = parents
+        self.children: list[list[int]] = [[] for _ in blocks]
+        for index, parent in enumerate(parents):
+            if parent is not None:
+                self.children[parent].append(index)
+
+        self.enter = [-1] * len(blocks)
+        self.leave = [-1] * len(blocks)
+        clock = 0
+        for root in roots:
+            stack = [(root, iter(self.children[root]))]
+            self.enter[root] = clock
+            clock += 1
+            while stack:
+                node, pending = stack[-1]
+                child = next(pending, None)
+                if child is None:
+                    stack.pop()
+                    self.leave[node] = clock
+                    clock += 1
+                else:
+                    self.enter[child] = clock
+                    clock += 1
+                    stack.append((child, iter(self.children[child])))
+
+    def immediate(self, block: BasicBlock) -> Optional[BasicBlock]:
+        parent = self.parents[block.index]
+        return None if parent is None else self.blocks[parent]
+
+    def reaches(self, block: BasicBlock) -> bool:
+        return self.enter[block.index] >= 0
+
+    def dominates(self, a: BasicBlock, b: BasicBlock) -> bool:
+        """
+        Whether every path from the root to b goes through a. A block dominates itself.
+        """
+        if a is b:
+            return True
+        enter, leave = self.enter, self.leave
+        return 0 <= enter[a.index] <= enter[b.index] and leave[b.index] <= leave[a.index]
+
+
+def dominator_tree(blocks: list[BasicBlock]) -> DominatorTree:
+    if not blocks:
+        return DominatorTree(blocks, [], [])
+
+    successors = [[successor.index for successor in block.successors] for block in blocks]
+    predecessors = [[predecessor.index for predecessor in block.predecessors] for block in blocks]
+    parents = _immediate_dominators(0, successors, predecessors)
+    parents[0] = None
+    return DominatorTree(blocks, parents, [0])
+
+
+def post_dominator_tree(blocks: list[BasicBlock]) -> DominatorTree:
+    """
+    Dominators of the reversed graph, from a virtual exit that follows every block without successors.
+    The blocks whose immediate post-dominator is the virtual exit are the roots: the ones that exit, and the
+    ones from which several exits can be reached. The blocks that never get to an exit, such as an infinite
+    loop, are not in the tree.
+    """
+    virtual_exit = len(blocks)
+    exits = [block.index for block in blocks if not block.successors]
+    successors = [[predecessor.index for predecessor in block.predecessors] for block in blocks]
+    predecessors = [[successor.index for successor in block.successors] for block in blocks]
+    successors.append(exits)
+    predecessors.append([])
+    for index in exits:
+        predecessors[index].append(virtual_exit)
+
+    parents = _immediate_dominators(virtual_exit, successors, predecessors)
+    roots = [index for index, parent in enumerate(parents[:virtual_exit]) if parent == virtual_exit]
+    parents = [None if parent == virtual_exit else parent for parent in parents[:virtual_exit]]
+    return DominatorTree(blocks, parents, roots)
+
+
+class Loop:
+    """
+    Natural loop: the header, the blocks with a back edge to it, its blocks in order, and the innermost
+    loop around it.
+    """
+
+    __slots__ = ("header", "latches", "blocks", "indexes", "parent")
+
+    def __init__(self, header: BasicBlock, latches: list[BasicBlock], indexes: set[int], blocks: list[BasicBlock]):
+        self.header = header
+        self.latches = latches
+        self.indexes = frozenset(indexes)
+        self.blocks = [blocks[index] for index in sorted(indexes)]
+        self.parent: Optional[Loop] = None
+
+    def __contains__(self, block: BasicBlock) -> bool:
+        return block.index in self.indexes
+
+    def __repr__(self):
+        return f"Loop({self.header.index}, {sorted(self.indexes)})"
+
+
+def natural_loops(blocks: list[BasicBlock], dominators: Optional[DominatorTree] = None) -> list[Loop]:
+    """
+    Loops of the blocks, one per header with every back edge to it, innermost first.
+    """
+    dominators = dominators or dominator_tree(blocks)
+    latches: dict[int, list[BasicBlock]] = {}
+    for block in blocks:
+        if not dominators.reaches(block):
+            continue
+        for successor in block.successors:
+            if dominators.dominates(successor, block):
+                latches.setdefault(successor.index, []).append(block)
+
+    loops = []
+    for header, sources in latches.items():
+        # the blocks that get to a latch without going through the header
+        indexes = {header}
+        pending = [latch for latch in sources if latch.index != header]
+        indexes.update(latch.index for latch in pending)
+        while pending:
+            for predecessor in pending.pop().predecessors:
+                if predecessor.index not in indexes and dominators.reaches(predecessor):
+                    indexes.add(predecessor.index)
+                    pending.append(predecessor)
+        loops.append(Loop(blocks[header], sources, indexes, blocks))
+
+    # from the outermost in, so that the last loop seen around a header is the innermost one
+    loops.sort(key=lambda loop: len(loop.indexes), reverse=True)
+    innermost: dict[int, Loop] = {}
+    for loop in loops:
+        loop.parent = innermost.get(loop.header.index)
+        for index in loop.indexes:
+            innermost[index] = loop
+
+    loops.reverse()
+    return loops
@@ -1,27 +1,114 @@
+from typing import Iterable, Optional, Union
+
+from cache import CacheEntry, CompileCache
+from ir import render
 from lexer import Lexer
+from optimizer import optimize
 from parser import Parser
+from regalloc import allocate
+from sinks import Target, open_sink
 from tac_generator import ThreeAddressCodeGenerator  # Certifique-se de que o nome do arquivo e da classe está correto
 
 
 class Compiler:
-    def __init__(self, code: str):
-        if not code:
+    def __init__(
+        self,
+        code: str = "",
+        filename: Optional[str] = None,
+        cache: Optional[CompileCache] = None,
+        output: Target = "output.txt",
+        dump_instructions: bool = True,
+        reuse_temporaries: bool = False,
+        registers: Optional[int] = None,
+        optimize: Union[bool, Iterable[str]] = False,
+    ):
+        if not code and filename is None:
             raise ValueError("Code cannot be empty!")
+        self.code = code
+        self.filename = filename
+        self.cache = cache
+        # Caminho, stream, gerador ou OutputSink que recebe o código de três endereços
+        self.output = output
+        self.dump_instructions = dump_instructions
+        # Renumera os temporários por liveness, ou os aloca em registradores r0..r{registers - 1}
+        self.reuse_temporaries = reuse_temporaries
+        self.registers = registers
+        # True para todos os passes do otimizador, ou os nomes dos passes a executar
+        self.optimize = optimize
         self.lexer = Lexer(code)
         self.parser = Parser()
         self.tac_generator = ThreeAddressCodeGenerator()  # Cria uma instância da classe ThreeAddressCodeGenerator
 
+    @classmethod
+    def from_file(cls, filename: str) -> "Compiler":
+        # O arquivo é lido sob demanda: os tokens são gerados enquanto o parser os consome
+        return cls(filename=filename)
+
     def compile(self):
-        self.lexer.lex()
-        self.parser.parse(self.lexer.tokens, self.lexer.symbol_table)
+        key = None
+        if self.cache is not None:
+            options = {
+                "dump_instructions": self.dump_instructions,
+                "reuse_temporaries": self.reuse_temporaries,
+                "registers": self.registers,
+                "optimize": self.optimize if isinstance(self.optimize, bool) else tuple(self.optimize),
+            }
+            key = self.cache.key(self.source(), options)
+            entry = self.cache.get(key)
+            if entry is not None:
+                # Programa já compilado: não passa pelo lexer, parser nem gerador
+                self.write([entry.code])
+                self.report(entry.instructions)
+                return
+
+        if self.filename is not None:
+            tokens = self.lexer.stream_file(self.filename)
+        else:
+            self.lexer.lex()
+            tokens = self.lexer.tokens
+
+        self.parser.parse(tokens, self.lexer.symbol_table)
+
+        instructions = []
+        if self.dump_instructions:
+            # A listagem é reconstruída da árvore, só quando pedida
+            instructions_tac = self.tac_generator.extract_instructions(self.parser.tree)
+            instructions = [str(instruction_tac) for instruction_tac in instructions_tac]
+
+        code = self.tac_generator.generate(self.parser.tree)
+        if self.optimize:
+            code = optimize(code, None if self.optimize is True else self.optimize)
+        if self.reuse_temporaries or self.registers is not None:
+            code = allocate(code, self.registers)
+        if key is not None:
+            text = "".join(render(code))
+            self.write([text])
+            self.cache.put(key, CacheEntry(text, instructions))
+        else:
+            self.write(render(code))
+
+        self.report(instructions)
+
+    def write(self, lines: Iterable[str]):
+        sink = open_sink(self.output)
+        sink.writelines(lines)
+        # Só fecha o destino que foi aberto aqui
+        if sink is self.output:
+            sink.flush()
+        else:
+            sink.close()
 
-        # Chama o método extract_instructions e passa self.parser.instructions como argumento
-        instructions_tac = self.tac_generator.extract_instructions(self.parser.instructions)
+    def source(self) -> str:
+        if self.filename is None:
+            return self.code
 
-        self.tac_generator.start()
-        # Imprime as instruções extraídas (se necessário)
-        for i, instruction_tac in enumerate(instructions_tac):
-           print(f"Instrução {i + 1}: {instruction_tac}")
+        with open(self.filename) as file:
+            return file.read()
 
-        print("Successfully compiled!")
+    @staticmethod
+    def report(instructions: list[str]):
+        # Imprime as instruções extraídas de uma vez só (vazio quando dump_instructions é False)
+        lines = [f"Instrução {i + 1}: {instruction_tac}\n" for i, instruction_tac in enumerate(instructions)]
+        lines.append("Successfully compiled!")
+        print("".join(lines))
 
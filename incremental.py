@@ -0,0 +1,161 @@
+import hashlib
+from typing import Any, Dict, Iterator, Optional
+
+from ir import Quad, render
+from lexer import Lexer, TextEdit, TokenBuffer, TokenKind
+from parser import Parser
+from sinks import Target, open_sink
+from syntax_tree import Program, Statement, shift_lines
+from tac_generator import ThreeAddressCodeGenerator
+
+
+class Unit:
+    """
+    Analysed and generated form of a top-level statement, or of a few of them when a declaration has no SEMICOLON.
+    """
+
+    __slots__ = ("fingerprint", "first_line", "names", "environment", "exports", "statements", "code")
+
+    def __init__(
+        self,
+        fingerprint: bytes,
+        first_line: int,
+        names: tuple[int, ...],
+        environment: tuple,
+        exports: list[tuple[int, Dict[str, Any]]],
+        statements: list[Statement],
+        code: list[Quad],
+    ):
+        self.fingerprint = fingerprint
+        self.first_line = first_line
+        # symbol ids used by the unit and what they were bound to before it
+        self.names = names
+        self.environment = environment
+        # global bindings the unit declares
+        self.exports = exports
+        self.statements = statements
+        self.code = code
+
+
+def split_units(tokens: TokenBuffer) -> Iterator[tuple[int, int]]:
+    """
+    Token ranges of the top-level statements: up to a SEMICOLON or the RBRACE that closes a block,
+    unless an ELSE follows it.
+    """
+    kinds = tokens.kinds
+    depth = 0
+    start = 0
+    for index, kind in enumerate(kinds):
+        if kind == TokenKind.LBRACE:
+            depth += 1
+        elif kind == TokenKind.RBRACE:
+            depth -= 1
+            if depth == 0 and (index + 1 == len(kinds) or kinds[index + 1] != TokenKind.ELSE):
+                yield start, index + 1
+                start = index + 1
+        elif kind == TokenKind.SEMICOLON and depth == 0:
+            yield start, index + 1
+            start = index + 1
+
+    if start < len(kinds):
+        yield start, len(kinds)
+
+
+def signature(binding: Optional[Dict[str, Any]]) -> Optional[tuple]:
+    if binding is None:
+        return None
+    return binding["variable_type"], binding.get("parameters")
+
+
+class IncrementalCompiler:
+    """
+    Compiles a program that is edited over time. Top-level statements whose tokens and whose global names
+    (types and parameter lists) are unchanged since the previous compile are not parsed or generated again.
+
+    Labels keep counting from where the previous compile stopped, so the reused code keeps its labels and
+    the numbering can differ from a full compile.
+    """
+
+    def __init__(self, code: str, output: Target = "output.txt"):
+        self.output = output
+        self.lexer = Lexer(code)
+        self.lexer.lex()
+        self.tac_generator = ThreeAddressCodeGenerator()
+        self.units: Dict[bytes, list[Unit]] = {}
+        self.tree: Optional[Program] = None
+        self.reused = 0
+
+    def edit(self, edit: TextEdit):
+        self.lexer.relex(self.lexer.tokens, edit)
+
+    def compile(self) -> Program:
+        tokens = self.lexer.tokens
+        if not len(tokens):
+            raise SyntaxError("Expected a statement, found EOF")
+
+        parser = Parser()
+        parser.symbol_table = self.lexer.symbol_table
+        parser.open_scope()
+        scopes = parser.scopes
+
+        units: Dict[bytes, list[Unit]] = {}
+        used = set()
+        ordered = []
+        self.reused = 0
+        for start, stop in split_units(tokens):
+            digest = hashlib.blake2b(tokens.kinds[start:stop].tobytes(), digest_size=16)
+            digest.update(tokens.value_ids[start:stop].tobytes())
+            fingerprint = digest.digest()
+            first_line = tokens.lines[start]
+
+            unit = None
+            for candidate in self.units.get(fingerprint, ()):
+                if id(candidate) not in used and candidate.environment == tuple(
+                    signature(scopes.lookup(symbol_id)) for symbol_id in candidate.names
+                ):
+                    unit = candidate
+                    break
+
+            if unit is not None:
+                self.reused += 1
+                for symbol_id, binding in unit.exports:
+                    scopes.declare(symbol_id, binding)
+
+                if unit.first_line != first_line:
+                    delta = first_line - unit.first_line
+                    for statement in unit.statements:
+                        shift_lines(statement, delta)
+                    # the lines a redeclaration is reported with
+                    for _, binding in unit.exports:
+                        binding["token"].line += delta
+                    unit.first_line = first_line
+            else:
+                names = tuple(sorted(set(tokens.symbol_ids[start:stop]) - {-1}))
+                environment = tuple(signature(scopes.lookup(symbol_id)) for symbol_id in names)
+
+                declared = len(scopes.declared[0])
+                statements = parser.parse_unit(tokens[start:stop])
+                exports = [(symbol_id, scopes.lookup(symbol_id)) for symbol_id in scopes.declared[0][declared:]]
+
+                generated = len(self.tac_generator.code)
+                self.tac_generator.get_block(statements)
+                code = self.tac_generator.code[generated:]
+                del self.tac_generator.code[generated:]
+                unit = Unit(fingerprint, first_line, names, environment, exports, statements, code)
+
+            used.add(id(unit))
+            units.setdefault(fingerprint, []).append(unit)
+            ordered.append(unit)
+
+        self.units = units
+        self.tree = Program([statement for unit in ordered for statement in unit.statements])
+
+        sink = open_sink(self.output)
+        for unit in ordered:
+            sink.writelines(render(unit.code))
+        if sink is self.output:
+            sink.flush()
+        else:
+            sink.close()
+
+        return self.tree
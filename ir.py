@@ -0,0 +1,213 @@
+from typing import Iterable, Iterator, Optional, Union
+
+
+class Op:
+    """
+    Opcodes of the quadruples. The comments show the fields each one uses.
+    """
+
+    COPY = 0  # dest = arg1
+    # dest = arg1 <op> arg2
+    ADD = 1
+    SUBTRACT = 2
+    MULTIPLY = 3
+    DIVIDE = 4
+    MODULE = 5
+    EQUAL = 6
+    DIFFERENT = 7
+    GREATER = 8
+    GREATER_OR_EQUAL = 9
+    LESS = 10
+    LESS_OR_EQUAL = 11
+    AND = 12
+    OR = 13
+    NOT = 14  # dest = not arg1
+    CALL = 15  # dest = call arg1(*arg2), dest is None when the result is unused
+    PRINT = 16  # print *arg1
+    RETURN = 17  # return arg1
+    LABEL = 18  # arg1:
+    GOTO = 19  # go to arg1
+    IF_FALSE = 20  # ifFalse arg1 go to arg2
+    FUNCTION = 21  # function arg1(*arg2):
+    PROCEDURE = 22  # procedure arg1(*arg2):
+    END_FUNCTION = 23
+    END_PROCEDURE = 24
+    IF_TRUE = 25  # ifTrue arg1 go to arg2
+    PHI = 26  # dest = phi(*arg1), one operand per predecessor of the block; only in SSA form, see ssa.py
+    SHIFT_LEFT = 27  # dest = arg1 << arg2, only generated by the optimizer
+
+
+BINARY_OPERATORS: dict[str, int] = {
+    "+": Op.ADD,
+    "-": Op.SUBTRACT,
+    "*": Op.MULTIPLY,
+    "/": Op.DIVIDE,
+    "%": Op.MODULE,
+    "==": Op.EQUAL,
+    "!=": Op.DIFFERENT,
+    ">": Op.GREATER,
+    ">=": Op.GREATER_OR_EQUAL,
+    "<": Op.LESS,
+    "<=": Op.LESS_OR_EQUAL,
+    "and": Op.AND,
+    "or": Op.OR,
+}
+OPERATOR_SYMBOLS: dict[int, str] = {op: symbol for symbol, op in BINARY_OPERATORS.items()}
+OPERATOR_SYMBOLS[Op.SHIFT_LEFT] = "<<"
+
+
+class Var:
+    """
+    Named variable, function or parameter. There is a single Var per name, so operands compare by identity.
+    """
+
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return f"Var({self.name})"
+
+
+class Temp:
+    """
+    Compiler temporary. Every temporary is a distinct object, until they are renumbered by regalloc.allocate;
+    index is only the number it is printed with, which restarts at every statement.
+    """
+
+    __slots__ = ("index",)
+
+    def __init__(self, index: int):
+        self.index = index
+
+    def __str__(self):
+        return f"t{self.index}"
+
+    def __repr__(self):
+        return f"Temp(t{self.index})"
+
+
+class Label:
+    __slots__ = ("index",)
+
+    def __init__(self, index: int):
+        self.index = index
+
+    def __str__(self):
+        return f"L{self.index}"
+
+    def __repr__(self):
+        return f"Label(L{self.index})"
+
+
+class Const:
+    """
+    Integer or boolean constant, or None for the value of a declaration without initializer.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Union[int, bool, None]):
+        self.value = value
+
+    def __str__(self):
+        if self.value is None:
+            return "undefined"
+        elif isinstance(self.value, bool):
+            return "true" if self.value else "false"
+        return str(self.value)
+
+    def __repr__(self):
+        return f"Const({self})"
+
+
+class Register:
+    """
+    Machine register a temporary was allocated to.
+    """
+
+    __slots__ = ("index",)
+
+    def __init__(self, index: int):
+        self.index = index
+
+    def __str__(self):
+        return f"r{self.index}"
+
+    def __repr__(self):
+        return f"Register(r{self.index})"
+
+
+class SpillSlot:
+    """
+    Memory slot of a temporary that didn't get a register.
+    """
+
+    __slots__ = ("index",)
+
+    def __init__(self, index: int):
+        self.index = index
+
+    def __str__(self):
+        return f"s{self.index}"
+
+    def __repr__(self):
+        return f"SpillSlot(s{self.index})"
+
+
+Operand = Union[Var, Temp, Const, Register, SpillSlot]
+
+
+class Quad:
+    __slots__ = ("op", "dest", "arg1", "arg2")
+
+    def __init__(self, op: int, dest: Optional[Operand] = None, arg1=None, arg2=None):
+        self.op = op
+        self.dest = dest
+        self.arg1 = arg1
+        self.arg2 = arg2
+
+    def __repr__(self):
+        return f"Quad({self.op}, {self.dest!r}, {self.arg1!r}, {self.arg2!r})"
+
+
+def _join(operands: Iterable[Operand]) -> str:
+    return ", ".join(map(str, operands))
+
+
+def _format_call(quad: Quad) -> str:
+    call = f"call {quad.arg1}({_join(quad.arg2)})"
+    return call + "\n" if quad.dest is None else f"{quad.dest} = {call}\n"
+
+
+FORMATS = {
+    Op.COPY: lambda quad: f"{quad.dest} = {quad.arg1}\n",
+    Op.NOT: lambda quad: f"{quad.dest} = not {quad.arg1}\n",
+    Op.CALL: _format_call,
+    Op.PRINT: lambda quad: f"print {_join(quad.arg1)}\n",
+    Op.RETURN: lambda quad: f"return {quad.arg1}\n",
+    Op.LABEL: lambda quad: f"{quad.arg1}:\n",
+    Op.GOTO: lambda quad: f"go to {quad.arg1}\n",
+    Op.IF_FALSE: lambda quad: f"ifFalse {quad.arg1} go to {quad.arg2}\n",
+    Op.IF_TRUE: lambda quad: f"ifTrue {quad.arg1} go to {quad.arg2}\n",
+    Op.PHI: lambda quad: f"{quad.dest} = phi({_join(quad.arg1)})\n",
+    Op.FUNCTION: lambda quad: f"\nfunction {quad.arg1}({_join(quad.arg2)}):\n",
+    Op.PROCEDURE: lambda quad: f"\nprocedure {quad.arg1}({_join(quad.arg2)}):\n",
+    Op.END_FUNCTION: lambda quad: "end_function\n\n",
+    Op.END_PROCEDURE: lambda quad: "end_procedure\n\n",
+}
+for _op, _symbol in OPERATOR_SYMBOLS.items():
+    FORMATS[_op] = lambda quad, symbol=_symbol: f"{quad.dest} = {quad.arg1} {symbol} {quad.arg2}\n"
+
+
+def render(code: Iterable[Quad]) -> Iterator[str]:
+    """
+    Text form of the quadruples, one string per instruction.
+    """
+    formats = FORMATS
+    for quad in code:
+        yield formats[quad.op](quad)
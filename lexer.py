@@ -1,96 +1,558 @@
+import mmap
 import re
-from typing import Any
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+
+class TokenKind:
+    """
+    Integer codes of the token kinds. KIND_NAMES maps a code back to its name.
+    """
+
+    # reserved tokens
+    IF = 0
+    ELSE = 1
+    WHILE = 2
+    INT = 3
+    BOOL = 4
+    TRUE = 5
+    FALSE = 6
+    NOT = 7
+    AND = 8
+    OR = 9
+    PRINT = 10
+    RETURN = 11
+    FUNCTION = 12
+    PROCEDURE = 13
+    BREAK = 14
+    CONTINUE = 15
+    # symbols
+    ARROW = 16
+    EQUAL = 17
+    DIFFERENT = 18
+    GREATER_OR_EQUAL = 19
+    LESS_OR_EQUAL = 20
+    PLUS = 21
+    MINUS = 22
+    MULTIPLY = 23
+    DIVIDE = 24
+    MODULE = 25
+    ASSIGN = 26
+    SEMICOLON = 27
+    COLON = 28
+    LPAREN = 29
+    RPAREN = 30
+    GREATER = 31
+    LESS = 32
+    LBRACE = 33
+    RBRACE = 34
+    # others
+    IDENTIFIER = 35
+    INTEGER = 36
+    # markers of the blocks in the instruction listing
+    BEGINIF = 37
+    ENDIF = 38
+    BEGINELSE = 39
+    ENDELSE = 40
+    BEGINLOOP = 41
+    ENDLOOP = 42
+    BEGINFUNCTION = 43
+    ENDFUNCTION = 44
+    BEGINPROCEDURE = 45
+    ENDPROCEDURE = 46
+
+
+KIND_NAMES: tuple[str, ...] = tuple(
+    sorted(
+        (name for name in vars(TokenKind) if name.isupper()),
+        key=lambda name: getattr(TokenKind, name),
+    )
+)
 
 
 class Token:
-    def __init__(self, token_type, value, line):
-        self.token_type = token_type
+    __slots__ = ("kind", "value", "line", "symbol_id")
+
+    def __init__(self, kind: int, value: str, line: int, symbol_id: Optional[int] = None):
+        self.kind = kind
         self.value = value
         self.line = line
+        self.symbol_id = symbol_id
+
+    @property
+    def token_type(self) -> str:
+        return KIND_NAMES[self.kind]
 
     def __repr__(self):
         return f"Token({self.token_type}, '{self.value}', {self.line})"
 
 
+# reserved words are matched as identifiers and then resolved through this table
+KEYWORDS: dict[str, int] = {
+    "if": TokenKind.IF,
+    "else": TokenKind.ELSE,
+    "while": TokenKind.WHILE,
+    "int": TokenKind.INT,
+    "bool": TokenKind.BOOL,
+    "true": TokenKind.TRUE,
+    "false": TokenKind.FALSE,
+    "not": TokenKind.NOT,
+    "and": TokenKind.AND,
+    "or": TokenKind.OR,
+    "print": TokenKind.PRINT,
+    "return": TokenKind.RETURN,
+    "function": TokenKind.FUNCTION,
+    "procedure": TokenKind.PROCEDURE,
+    "break": TokenKind.BREAK,
+    "continue": TokenKind.CONTINUE,
+}
+
+# the order of the patterns matters
+TOKEN_SPECIFICATION: list[tuple[str, str]] = [
+    # symbols
+    ("ARROW", r"->"),
+    ("EQUAL", r"=="),
+    ("DIFFERENT", r"!="),
+    ("GREATER_OR_EQUAL", r">="),
+    ("LESS_OR_EQUAL", r"<="),
+    ("PLUS", r"\+"),
+    ("MINUS", r"-"),
+    ("MULTIPLY", r"\*"),
+    ("DIVIDE", r"/"),
+    ("MODULE", r"\%"),
+    ("ASSIGN", r"="),
+    ("SEMICOLON", r";"),
+    ("COLON", r","),
+    ("LPAREN", r"\("),
+    ("RPAREN", r"\)"),
+    ("GREATER", r">"),
+    ("LESS", r"<"),
+    ("LBRACE", r"\{"),
+    ("RBRACE", r"\}"),
+    # others
+    ("IDENTIFIER", r"\b[a-zA-Z_][a-zA-Z0-9_]*\b"),
+    ("INTEGER", r"\b[0-9]+\b"),
+    # layout
+    ("NEWLINE", r"\n"),
+    ("SKIP", r"[^\S\n]+"),
+    ("MISMATCH", r"."),
+]
+
+MASTER_PATTERN = re.compile(
+    "|".join(f"(?P<{name}>{pattern})" for name, pattern in TOKEN_SPECIFICATION)
+)
+# same scanner over raw bytes, used when lexing memory-mapped files
+MASTER_PATTERN_BYTES = re.compile(MASTER_PATTERN.pattern.encode())
+
+GROUP_KINDS: dict[str, int] = {
+    name: getattr(TokenKind, name)
+    for name, _ in TOKEN_SPECIFICATION
+    if hasattr(TokenKind, name)
+}
+
+
+class Symbol:
+    __slots__ = ("id", "name", "variable_type", "variable_value", "scope", "line", "occurrences")
+
+    def __init__(self, symbol_id: int, name: str, line: int):
+        self.id = symbol_id
+        self.name = name
+        self.variable_type = None
+        self.variable_value = None
+        self.scope = None
+        self.line = line
+        self.occurrences = array("I")
+
+    def __repr__(self):
+        return f"Symbol({self.id}, '{self.name}', {self.variable_type})"
+
+
+class SymbolTable:
+    """
+    Interned identifiers: one Symbol per distinct name, holding the lines where the name occurs.
+    """
+
+    def __init__(self):
+        self.symbols: list[Symbol] = []
+        self._ids: dict[str, int] = {}
+
+    def intern(self, name: str, line: int) -> int:
+        symbol_id = self._ids.get(name)
+        if symbol_id is None:
+            symbol_id = self._ids[name] = len(self.symbols)
+            self.symbols.append(Symbol(symbol_id, name, line))
+
+        self.symbols[symbol_id].occurrences.append(line)
+        return symbol_id
+
+    def merge(self, other: "SymbolTable", line_offset: int = 0) -> list[int]:
+        """
+        Add the symbols and occurrences of another table, returning the new id of each of its symbols.
+        """
+        symbol_ids = []
+        for symbol in other.symbols:
+            symbol_id = self._ids.get(symbol.name)
+            if symbol_id is None:
+                symbol_id = self._ids[symbol.name] = len(self.symbols)
+                self.symbols.append(Symbol(symbol_id, symbol.name, symbol.line + line_offset))
+
+            occurrences = self.symbols[symbol_id].occurrences
+            if line_offset:
+                occurrences.extend(line + line_offset for line in symbol.occurrences)
+            else:
+                occurrences.extend(symbol.occurrences)
+            symbol_ids.append(symbol_id)
+
+        return symbol_ids
+
+    def shift_lines(self, after_line: int, delta: int):
+        for symbol in self.symbols:
+            if symbol.line > after_line:
+                symbol.line += delta
+            occurrences = symbol.occurrences
+            if occurrences and max(occurrences) > after_line:
+                symbol.occurrences = array(
+                    "I", (line + delta if line > after_line else line for line in occurrences)
+                )
+
+    def lookup(self, name: str) -> Optional[Symbol]:
+        symbol_id = self._ids.get(name)
+        return self.symbols[symbol_id] if symbol_id is not None else None
+
+    def values(self) -> list[Symbol]:
+        return self.symbols
+
+    def __getitem__(self, symbol_id: int) -> Symbol:
+        return self.symbols[symbol_id]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._ids
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __iter__(self) -> Iterator[Symbol]:
+        return iter(self.symbols)
+
+
+class TokenBuffer:
+    """
+    Compact struct-of-arrays token store. Kinds, lines and columns are kept in arrays and values are interned,
+    so a token costs a few bytes instead of a full object; indexing returns a Token view.
+    """
+
+    def __init__(self):
+        self.kinds = array("B")
+        self.lines = array("I")
+        self.columns = array("I")
+        self.value_ids = array("I")
+        self.symbol_ids = array("i")
+        self.values: list[str] = []
+        self._value_index: dict[str, int] = {}
+
+    def intern_value(self, value: str) -> int:
+        value_id = self._value_index.get(value)
+        if value_id is None:
+            value_id = self._value_index[value] = len(self.values)
+            self.values.append(value)
+
+        return value_id
+
+    def append(self, kind: int, value: str, line: int, column: int = 0, symbol_id: Optional[int] = None):
+        value_id = self.intern_value(value)
+
+        self.kinds.append(kind)
+        self.lines.append(line)
+        self.columns.append(column)
+        self.value_ids.append(value_id)
+        self.symbol_ids.append(-1 if symbol_id is None else symbol_id)
+
+    def extend(self, other: "TokenBuffer", symbol_ids: list[int]):
+        """
+        Append the tokens of another buffer, translating its value ids and, through symbol_ids, its symbol ids.
+        """
+        value_ids = [self.intern_value(value) for value in other.values]
+        symbol_ids = symbol_ids + [-1]
+
+        self.kinds.extend(other.kinds)
+        self.lines.extend(other.lines)
+        self.columns.extend(other.columns)
+        self.value_ids.extend(map(value_ids.__getitem__, other.value_ids))
+        self.symbol_ids.extend(map(symbol_ids.__getitem__, other.symbol_ids))
+
+    def splice(
+        self,
+        start: int,
+        stop: int,
+        entries: Iterable[tuple[int, str, int, int, Optional[int]]],
+        line_delta: int = 0,
+    ):
+        """
+        Replace the tokens in [start, stop) by (kind, value, line, column, symbol_id) entries,
+        moving the lines of the tokens after them by line_delta.
+        """
+        replacement = TokenBuffer()
+        replacement.values = self.values
+        replacement._value_index = self._value_index
+        for entry in entries:
+            replacement.append(*entry)
+
+        if line_delta:
+            self.lines[stop:] = array("I", (line + line_delta for line in self.lines[stop:]))
+
+        self.kinds[start:stop] = replacement.kinds
+        self.lines[start:stop] = replacement.lines
+        self.columns[start:stop] = replacement.columns
+        self.value_ids[start:stop] = replacement.value_ids
+        self.symbol_ids[start:stop] = replacement.symbol_ids
+
+    def token(self, index: int) -> Token:
+        symbol_id = self.symbol_ids[index]
+        return Token(
+            self.kinds[index],
+            self.values[self.value_ids[index]],
+            self.lines[index],
+            None if symbol_id < 0 else symbol_id,
+        )
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.token(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("token index out of range")
+        return self.token(index)
+
+    def __iter__(self) -> Iterator[Token]:
+        values = self.values
+        for kind, value_id, line, symbol_id in zip(
+            self.kinds, self.value_ids, self.lines, self.symbol_ids
+        ):
+            yield Token(kind, values[value_id], line, None if symbol_id < 0 else symbol_id)
+
+
+class TokenStream:
+    """
+    Bounded lookahead over any iterable of tokens, so the parser can consume a lazy token generator.
+    """
+
+    def __init__(self, tokens: Iterable[Token], lookahead: int = 2):
+        self._tokens = iter(tokens)
+        self._buffer: deque[Token] = deque()
+        self.lookahead = lookahead
+        self.last: Optional[Token] = None
+
+    def peek(self, offset: int = 0) -> Optional[Token]:
+        if offset >= self.lookahead:
+            raise IndexError(f"Lookahead is limited to {self.lookahead} tokens")
+
+        while len(self._buffer) <= offset:
+            token = next(self._tokens, None)
+            if token is None:
+                return None
+            self._buffer.append(token)
+
+        return self._buffer[offset]
+
+    def advance(self) -> Optional[Token]:
+        buffer = self._buffer
+        if buffer:
+            self.last = buffer.popleft()
+            if buffer:
+                return buffer[0]
+
+        token = next(self._tokens, None)
+        if token is not None:
+            buffer.append(token)
+        return token
+
+
+class TextEdit(NamedTuple):
+    """
+    Replacement of the text between two positions. Lines start at 1 and columns at 0.
+    """
+
+    start_line: int
+    start_column: int
+    end_line: int
+    end_column: int
+    text: str
+
+
 class Lexer:
     def __init__(self, code: str):
         self.code = code
         self.current_line = 0
-        self.tokens: list[Token] = []
-        self.symbol_table: dict[Token, dict[str, Any]] = {}
-        # the order of the patterns matters
-        self.patterns: list[tuple[str, str]] = [
-            # reserved tokens
-            (r"\bif\b", "IF"),
-            (r"\belse\b", "ELSE"),
-            (r"\bwhile\b", "WHILE"),
-            (r"\bint\b", "INT"),
-            (r"\bbool\b", "BOOL"),
-            (r"\btrue\b", "TRUE"),
-            (r"\bfalse\b", "FALSE"),
-            (r"\bnot\b", "NOT"),
-            (r"\band\b", "AND"),
-            (r"\bor\b", "OR"),
-            (r"\bprint\b", "PRINT"),
-            (r"\breturn\b", "RETURN"),
-            (r"\bfunction\b", "FUNCTION"),
-            (r"\bprocedure\b", "PROCEDURE"),
-            (r"\bbreak\b", "BREAK"),
-            (r"\bcontinue\b", "CONTINUE"),
-            # symbols
-            (r"->", "ARROW"),
-            (r"==", "EQUAL"),
-            (r"!=", "DIFFERENT"),
-            (r">=", "GREATER_OR_EQUAL"),
-            (r"<=", "LESS_OR_EQUAL"),
-            (r"\+", "PLUS"),
-            (r"-", "MINUS"),
-            (r"\*", "MULTIPLY"),
-            (r"/", "DIVIDE"),
-            (r"\%", "MODULE"),
-            (r"=", "ASSIGN"),
-            (r";", "SEMICOLON"),
-            (r",", "COLON"),
-            (r"\(", "LPAREN"),
-            (r"\)", "RPAREN"),
-            (r">", "GREATER"),
-            (r"<", "LESS"),
-            (r"\{", "LBRACE"),
-            (r"\}", "RBRACE"),
-            # others
-            (r"\b[a-zA-Z_][a-zA-Z0-9_]*\b", "IDENTIFIER"),
-            (r"\b[0-9]+\b", "INTEGER"),
-        ]
-
-    def lex(self):
-        self.code = self.code.split("\n")
-
-        for line in self.code:
-            self.current_line += 1
-            line = line.strip()
-
-            while line:
-                matched = False
-                for pattern, token_type in self.patterns:
-                    match = re.match(pattern, line)
-                    if match:
-                        matched = True
-                        value = match.group(0)
-                        token = Token(
-                            token_type=token_type, value=value, line=self.current_line
-                        )
-                        self.tokens.append(token)
-
-                        if token_type == "IDENTIFIER":
-                            self.symbol_table[token] = {
-                                "variable_type": None,
-                                "variable_value": None,
-                                "scope": None,
-                                "line": self.current_line,
-                            }
-
-                        line = line[len(value) :].strip()
-                        break
-
-                if not matched:
-                    raise ValueError(f"Invalid syntax in line {self.current_line}")
+        self.tokens = TokenBuffer()
+        self.symbol_table = SymbolTable()
+
+    @property
+    def code(self) -> str:
+        if self._code is None:
+            self._code = "\n".join(self._lines)
+        return self._code
+
+    @code.setter
+    def code(self, code: str):
+        self._code = code
+        self._lines = None
+
+    @property
+    def lines(self) -> list[str]:
+        if self._lines is None:
+            self._lines = self._code.split("\n")
+        return self._lines
+
+    def lex(self, first_line: int = 1):
+        append = self.tokens.append
+
+        for kind, value, line, column, symbol_id in self.scan(
+            self.code, MASTER_PATTERN, decode=False, first_line=first_line
+        ):
+            append(kind, value, line, column, symbol_id)
+
+    def lex_parallel(self, workers: Optional[int] = None, chunk_size: int = 1 << 20):
+        """
+        Lex the source in chunks split at line boundaries on a process pool. Each worker returns a compact
+        TokenBuffer with lines already numbered for its chunk, and the buffers and symbol tables are merged in order.
+        """
+        code = self.code
+        if workers == 1 or len(code) <= chunk_size:
+            self.lex()
+            return
+
+        chunks = []
+        start = 0
+        first_line = 1
+        while start < len(code):
+            end = code.find("\n", start + chunk_size)
+            end = len(code) if end == -1 else end + 1
+            chunks.append((code[start:end], first_line))
+            first_line += code.count("\n", start, end)
+            start = end
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(_lex_chunk, *zip(*chunks))
+
+            for tokens, symbol_table in results:
+                symbol_ids = self.symbol_table.merge(symbol_table)
+                self.tokens.extend(tokens, symbol_ids)
+
+    def relex(self, tokens: TokenBuffer, edit: TextEdit) -> TokenBuffer:
+        """
+        Apply an edit to the source and lex again only the lines it touches. Tokens never span lines, so the
+        tokens around those lines are kept as they are and only have their lines moved when the edit adds or
+        removes lines.
+        """
+        lines = self.lines
+        if not 1 <= edit.start_line <= edit.end_line <= len(lines):
+            raise ValueError(f"Invalid edit range: lines {edit.start_line} to {edit.end_line}")
+
+        text = (
+            lines[edit.start_line - 1][: edit.start_column]
+            + edit.text
+            + lines[edit.end_line - 1][edit.end_column :]
+        )
+        new_lines = text.split("\n")
+        line_delta = len(new_lines) - (edit.end_line - edit.start_line + 1)
+
+        edited_symbols = SymbolTable()
+        entries = list(
+            self.scan(text, MASTER_PATTERN, decode=False, first_line=edit.start_line, symbol_table=edited_symbols)
+        )
+
+        start = bisect_left(tokens.lines, edit.start_line)
+        stop = bisect_right(tokens.lines, edit.end_line)
+        for index in range(start, stop):
+            symbol_id = tokens.symbol_ids[index]
+            if symbol_id >= 0:
+                self.symbol_table[symbol_id].occurrences.remove(tokens.lines[index])
+
+        if line_delta:
+            self.symbol_table.shift_lines(edit.end_line, line_delta)
+        symbol_ids = self.symbol_table.merge(edited_symbols)
+
+        tokens.splice(
+            start,
+            stop,
+            (
+                (kind, value, line, column, None if symbol_id is None else symbol_ids[symbol_id])
+                for kind, value, line, column, symbol_id in entries
+            ),
+            line_delta,
+        )
+
+        lines[edit.start_line - 1 : edit.end_line] = new_lines
+        self._code = None
+
+        return tokens
+
+    def tokenize(self) -> Iterator[Token]:
+        for kind, value, line, _, symbol_id in self.scan(self.code, MASTER_PATTERN, decode=False):
+            yield Token(kind, value, line, symbol_id)
+
+    def stream_file(self, filename: str) -> Iterator[Token]:
+        """
+        Lazily yield the tokens of a file through a memory map, without holding its lines or tokens in memory.
+        """
+        with open(filename, "rb") as file:
+            if file.seek(0, 2) == 0:
+                return
+
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                for kind, value, line, _, symbol_id in self.scan(buffer, MASTER_PATTERN_BYTES, decode=True):
+                    yield Token(kind, value, line, symbol_id)
+
+    def scan(
+        self,
+        buffer,
+        pattern: re.Pattern,
+        decode: bool,
+        first_line: int = 1,
+        symbol_table: Optional[SymbolTable] = None,
+    ) -> Iterator[tuple[int, str, int, int, Optional[int]]]:
+        """
+        Yield (kind, value, line, column, symbol_id) for every token of the buffer.
+        """
+        self.current_line = first_line
+        line_start = 0
+        keywords = KEYWORDS
+        group_kinds = GROUP_KINDS
+        identifier = TokenKind.IDENTIFIER
+        intern = (symbol_table if symbol_table is not None else self.symbol_table).intern
+
+        for match in pattern.finditer(buffer):
+            group = match.lastgroup
+
+            if group == "SKIP":
+                continue
+            if group == "NEWLINE":
+                self.current_line += 1
+                line_start = match.end()
+                continue
+            if group == "MISMATCH":
+                raise ValueError(f"Invalid syntax in line {self.current_line}")
+
+            value = match.group()
+            if decode:
+                value = value.decode()
+            kind = group_kinds[group]
+            if kind == identifier:
+                kind = keywords.get(value, identifier)
+
+            symbol_id = intern(value, self.current_line) if kind == identifier else None
+
+            yield kind, value, self.current_line, match.start() - line_start, symbol_id
+
+
+def _lex_chunk(code: str, first_line: int) -> tuple[TokenBuffer, SymbolTable]:
+    lexer = Lexer(code)
+    lexer.lex(first_line)
+    return lexer.tokens, lexer.symbol_table
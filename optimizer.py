@@ -0,0 +1,951 @@
+from heapq import heappop, heappush
+from itertools import count
+from typing import Callable, Iterable, Optional
+
+from cfg import (
+    BRANCHES,
+    DECLARATIONS,
+    BasicBlock,
+    DominatorTree,
+    Loop,
+    Procedure,
+    build_blocks,
+    dominator_tree,
+    join_procedures,
+    jump_target,
+    natural_loops,
+    split_procedures,
+    substitute,
+    temporary_liveness,
+    uses,
+)
+from ir import OPERATOR_SYMBOLS, Const, Label, Op, Quad, Temp, Var
+from regalloc import allocate
+from ssa import Version, from_ssa, to_ssa
+
+# value of a constant operand: (type, value), so that True and 1 are different
+Value = tuple[type, object]
+
+_constants: dict[Value, Const] = {}
+
+
+def constant(value) -> Const:
+    key = (type(value), value)
+    const = _constants.get(key)
+    if const is None:
+        const = _constants[key] = Const(value)
+    return const
+
+
+def fold(op: int, left: Value, right: Value) -> Optional[Value]:
+    """
+    Result of a binary operation on two constants, or None when it's better left to run time.
+    """
+    left_type, a = left
+    right_type, b = right
+    if left_type is int and right_type is int:
+        if op == Op.ADD:
+            return int, a + b
+        elif op == Op.SUBTRACT:
+            return int, a - b
+        elif op == Op.MULTIPLY:
+            return int, a * b
+        # rounding of negative operands is up to the target, so only fold the unambiguous cases
+        elif op == Op.DIVIDE and a >= 0 and b > 0:
+            return int, a // b
+        elif op == Op.MODULE and a >= 0 and b > 0:
+            return int, a % b
+        elif op == Op.SHIFT_LEFT and b >= 0:
+            return int, a << b
+        elif op == Op.GREATER:
+            return bool, a > b
+        elif op == Op.GREATER_OR_EQUAL:
+            return bool, a >= b
+        elif op == Op.LESS:
+            return bool, a < b
+        elif op == Op.LESS_OR_EQUAL:
+            return bool, a <= b
+
+    if left_type is right_type:
+        if op == Op.EQUAL:
+            return bool, a == b
+        elif op == Op.DIFFERENT:
+            return bool, a != b
+
+    if left_type is bool and right_type is bool:
+        if op == Op.AND:
+            return bool, a and b
+        elif op == Op.OR:
+            return bool, a or b
+
+    return None
+
+
+def value(operand, state: dict) -> Optional[Value]:
+    if isinstance(operand, Const):
+        return None if operand.value is None else (type(operand.value), operand.value)
+    elif isinstance(operand, (Var, Temp)):
+        return state.get(operand)
+    return None
+
+
+def evaluate(quad: Quad, state: dict) -> Optional[Value]:
+    """
+    Constant value the instruction assigns to its destination, if it has one.
+    """
+    op = quad.op
+    if op == Op.COPY:
+        return value(quad.arg1, state)
+    elif op == Op.NOT:
+        operand = value(quad.arg1, state)
+        return (bool, not operand[1]) if operand is not None and operand[0] is bool else None
+    elif op in OPERATOR_SYMBOLS:
+        left = value(quad.arg1, state)
+        right = value(quad.arg2, state)
+        if left is not None and right is not None:
+            return fold(op, left, right)
+        # false and x, true or x
+        if op == Op.AND and (left == (bool, False) or right == (bool, False)):
+            return bool, False
+        if op == Op.OR and (left == (bool, True) or right == (bool, True)):
+            return bool, True
+    return None
+
+
+def transfer(quad: Quad, state: dict):
+    if quad.op == Op.CALL:
+        # the callee can assign any variable it sees
+        for operand in [operand for operand in state if isinstance(operand, Var)]:
+            del state[operand]
+
+    if quad.dest is not None:
+        result = evaluate(quad, state)
+        if result is None:
+            state.pop(quad.dest, None)
+        else:
+            state[quad.dest] = result
+
+
+def constants_on_entry(procedure: Procedure) -> list[Optional[dict]]:
+    """
+    Forward data flow: the variables and temporaries with a known constant value at the start of every
+    block, None for blocks that are never reached.
+    """
+    blocks = procedure.blocks
+    entries: list[Optional[dict]] = [None] * len(blocks)
+    exits: list[Optional[dict]] = [None] * len(blocks)
+    live_out = temporary_liveness(blocks)[1]
+
+    # indexes of the blocks to visit again, the first ones first
+    pending = list(range(len(blocks)))
+    queued = set(pending)
+    while pending:
+        index = heappop(pending)
+        queued.discard(index)
+        block = blocks[index]
+        state = meet(block, exits)
+        if state is None:
+            continue
+
+        entries[index] = dict(state)
+        for quad in block.quads:
+            transfer(quad, state)
+        # the temporaries dead at the end of the block don't need to get to the next ones
+        live = live_out[index]
+        state = {operand: known for operand, known in state.items() if not isinstance(operand, Temp) or operand in live}
+        if state != exits[index]:
+            exits[index] = state
+            for successor in block.successors:
+                if successor.index not in queued:
+                    queued.add(successor.index)
+                    heappush(pending, successor.index)
+
+    return entries
+
+
+def meet(block: BasicBlock, exits: list[Optional[dict]]) -> Optional[dict]:
+    if block.index == 0:
+        # nothing is known when the procedure starts
+        return {}
+
+    state = None
+    for predecessor in block.predecessors:
+        predecessor_state = exits[predecessor.index]
+        if predecessor_state is None:
+            continue
+        if state is None:
+            state = dict(predecessor_state)
+        else:
+            state = {operand: known for operand, known in state.items() if predecessor_state.get(operand) == known}
+    return state
+
+
+def simplify_logic(quad: Quad):
+    """
+    x and true, x or false -> x
+    """
+    neutral = True if quad.op == Op.AND else False
+    for operand, other in ((quad.arg1, quad.arg2), (quad.arg2, quad.arg1)):
+        if isinstance(operand, Const) and operand.value is neutral:
+            quad.op, quad.arg1, quad.arg2 = Op.COPY, other, None
+            return
+
+
+def propagate_constants(procedure: Procedure) -> bool:
+    """
+    Replace variables and temporaries with a known value by the constant, fold operations on constants and
+    resolve branches on constant conditions.
+    """
+    changed = False
+    rebuild = False
+    for block, state in zip(procedure.blocks, constants_on_entry(procedure)):
+        if state is None:
+            continue
+
+        def replace(operand):
+            known = state.get(operand) if isinstance(operand, (Var, Temp)) else None
+            return operand if known is None else constant(known[1])
+
+        quads = []
+        for quad in block.quads:
+            original = (quad.op, quad.arg1, quad.arg2)
+            substitute(quad, replace)
+
+            if quad.op in BRANCHES and isinstance(quad.arg1, Const):
+                rebuild = True
+                if bool(quad.arg1.value) != (quad.op == Op.IF_TRUE):
+                    continue
+                quad.op, quad.arg1, quad.arg2 = Op.GOTO, quad.arg2, None
+            elif quad.dest is not None and quad.op != Op.CALL:
+                result = evaluate(quad, state)
+                if result is not None:
+                    quad.op, quad.arg1, quad.arg2 = Op.COPY, constant(result[1]), None
+                elif quad.op == Op.AND or quad.op == Op.OR:
+                    simplify_logic(quad)
+
+            changed = changed or (quad.op, quad.arg1, quad.arg2) != original
+            transfer(quad, state)
+            quads.append(quad)
+
+        block.quads = quads
+
+    if rebuild:
+        procedure.rebuild()
+    return changed or rebuild
+
+
+COMMUTATIVE = frozenset((Op.ADD, Op.MULTIPLY, Op.EQUAL, Op.DIFFERENT, Op.AND, Op.OR))
+# a > b is b < a, a >= b is b <= a
+MIRRORED = {Op.GREATER: Op.LESS, Op.GREATER_OR_EQUAL: Op.LESS_OR_EQUAL}
+
+
+def number_block(block: BasicBlock) -> bool:
+    """
+    Local value numbering: an operation on the same values as an earlier one in the block becomes a copy of
+    the operand that still holds its result, and temporaries holding the same value as an earlier temporary
+    are replaced by it.
+    """
+    # operand, or (type, value) of a constant -> value number
+    numbers: dict = {}
+    # value number -> operands it was assigned to, in order; an operand that was assigned again is stale
+    holders: dict[int, list] = {}
+    # (op, value number, value number) -> value number of the result
+    expressions: dict[tuple, int] = {}
+    counter = count()
+
+    def number(operand) -> int:
+        key = (type(operand.value), operand.value) if isinstance(operand, Const) else operand
+        known = numbers.get(key)
+        if known is None:
+            known = numbers[key] = next(counter)
+            holders[known] = [operand]
+        return known
+
+    def holder(known: Optional[int], kind: type = object):
+        for operand in holders.get(known, ()):
+            if isinstance(operand, kind) and numbers.get(operand) == known:
+                return operand
+        return None
+
+    def define(operand, known: int):
+        numbers[operand] = known
+        holders.setdefault(known, []).append(operand)
+
+    def replace(operand):
+        if isinstance(operand, Temp):
+            return holder(numbers.get(operand), Temp) or operand
+        return operand
+
+    changed = False
+    quads = []
+    for quad in block.quads:
+        original = (quad.arg1, quad.arg2)
+        substitute(quad, replace)
+        changed = changed or (quad.arg1, quad.arg2) != original
+
+        op = quad.op
+        if op in OPERATOR_SYMBOLS or op == Op.NOT:
+            left = number(quad.arg1)
+            right = number(quad.arg2) if op != Op.NOT else None
+            if op in COMMUTATIVE and left > right:
+                left, right = right, left
+            elif op in MIRRORED:
+                op, left, right = MIRRORED[op], right, left
+
+            known = expressions.get((op, left, right))
+            existing = holder(known)
+            if existing is None:
+                known = expressions[(op, left, right)] = next(counter)
+            elif existing is quad.dest:
+                # it already holds the value
+                changed = True
+                continue
+            else:
+                quad.op, quad.arg1, quad.arg2 = Op.COPY, existing, None
+                changed = True
+            define(quad.dest, known)
+        elif op == Op.COPY:
+            define(quad.dest, number(quad.arg1))
+        elif op == Op.CALL:
+            # the callee can assign any variable it sees
+            for operand in [operand for operand in numbers if isinstance(operand, Var)]:
+                del numbers[operand]
+            if quad.dest is not None:
+                define(quad.dest, next(counter))
+        quads.append(quad)
+
+    block.quads = quads
+    return changed
+
+
+def number_values(procedure: Procedure) -> bool:
+    changed = False
+    for block in procedure.blocks:
+        changed = number_block(block) or changed
+    return changed
+
+
+def remove_unreachable(procedure: Procedure) -> bool:
+    """
+    Drop the blocks control never gets to, such as the code after a go to or a return. The header of a
+    function declared there stays, since the function can still be called.
+    """
+    if not procedure.blocks:
+        return False
+
+    reached = {0}
+    pending = [procedure.blocks[0]]
+    while pending:
+        for successor in pending.pop().successors:
+            if successor.index not in reached:
+                reached.add(successor.index)
+                pending.append(successor)
+
+    if len(reached) == len(procedure.blocks):
+        return False
+
+    for block in procedure.blocks:
+        if block.index not in reached:
+            block.quads = [quad for quad in block.quads if quad.op in DECLARATIONS]
+    procedure.rebuild()
+    return True
+
+
+def remove_unused_labels(procedure: Procedure) -> bool:
+    targets = {jump_target(quad) for quad in procedure.quads}
+
+    changed = False
+    for block in procedure.blocks:
+        label = block.label
+        if label is not None and label not in targets:
+            del block.quads[0]
+            changed = True
+    return changed
+
+
+def variables_of(procedure: Procedure) -> set[Var]:
+    return {operand for quad in procedure.quads for operand in (quad.dest, *uses(quad)) if isinstance(operand, Var)}
+
+
+def read_before_written(quad: Quad, live: set, variables: set):
+    """
+    Live operands before the instruction, from the live ones after it, updated in place.
+    """
+    if quad.dest is not None:
+        live.discard(quad.dest)
+    if quad.op == Op.CALL:
+        # the callee can read any variable it sees
+        live |= variables
+    for operand in uses(quad):
+        if isinstance(operand, (Var, Temp)):
+            live.add(operand)
+
+
+def live_operands(procedure: Procedure) -> tuple[list[set], list[set]]:
+    """
+    Backward data flow: the variables and temporaries read after the start and after the end of every
+    block. Variables are shared by name with the other procedures, so all of them are live when a function
+    or procedure returns.
+    """
+    variables = variables_of(procedure)
+    returning = variables if procedure.header is not None else set()
+
+    live_in: list[set] = [set() for _ in procedure.blocks]
+    live_out: list[set] = [set() for _ in procedure.blocks]
+    changed = True
+    while changed:
+        changed = False
+        for block in reversed(procedure.blocks):
+            if block.successors:
+                live = set().union(*(live_in[successor.index] for successor in block.successors))
+            else:
+                live = set(returning)
+            live_out[block.index] = set(live)
+            for quad in reversed(block.quads):
+                read_before_written(quad, live, variables)
+            if live != live_in[block.index]:
+                live_in[block.index] = live
+                changed = True
+
+    return live_in, live_out
+
+
+def remove_dead_stores(procedure: Procedure) -> bool:
+    """
+    Drop the instructions whose result is never read. A call whose result is unused stays, without it.
+    """
+    variables = variables_of(procedure)
+    changed = False
+    while True:
+        removed = False
+        for block, live in zip(procedure.blocks, live_operands(procedure)[1]):
+            quads = []
+            for quad in reversed(block.quads):
+                if quad.dest is not None and quad.dest not in live:
+                    if quad.op != Op.CALL:
+                        removed = True
+                        continue
+                    quad.dest = None
+                read_before_written(quad, live, variables)
+                quads.append(quad)
+            quads.reverse()
+            block.quads = quads
+
+        if not removed:
+            return changed
+        changed = True
+
+
+def eliminate_dead_code(procedure: Procedure) -> bool:
+    changed = remove_unreachable(procedure)
+    changed = remove_dead_stores(procedure) or changed
+    if remove_unused_labels(procedure) or changed:
+        # blocks may be empty now, or continue into the next one
+        procedure.rebuild()
+        return True
+    return False
+
+
+def propagate_copies(procedure: Procedure) -> bool:
+    """
+    In SSA form, replace every version assigned a copy by what it copies, and every phi whose operands are
+    all the same value by that value; then drop the instructions without effect whose version is never
+    read. Only variables of procedures without calls are in SSA form; others stay as they are.
+    """
+    # the blocks control never gets to would keep their variables and temporaries
+    unreachable = remove_unreachable(procedure)
+    variables = to_ssa(procedure)
+    # version -> what it holds
+    copies: dict[Version, object] = {}
+
+    def resolve(operand):
+        while operand in copies:
+            operand = copies[operand]
+        return operand
+
+    definitions: dict[Version, Quad] = {}
+    for quad in procedure.quads:
+        if isinstance(quad.dest, Version):
+            definitions[quad.dest] = quad
+            # a variable that isn't a version can change before the copy is read: an unpromoted one anywhere, a
+            # promoted one when the procedure copies the last versions back to it
+            if quad.op == Op.COPY and isinstance(quad.arg1, (Version, Const)):
+                copies[quad.dest] = quad.arg1
+
+    changed = True
+    while changed:
+        changed = False
+        for version, quad in definitions.items():
+            if quad.op != Op.PHI or version in copies:
+                continue
+            operands = [operand for operand in map(resolve, quad.arg1) if operand is not version]
+            # constants are the same if their values are
+            values = {
+                (type(operand.value), operand.value) if isinstance(operand, Const) else operand for operand in operands
+            }
+            if len(values) == 1:
+                copies[version] = operands[0]
+                changed = True
+
+    # number of instructions reading every version
+    readers: dict[Version, int] = {}
+    for quad in procedure.quads:
+        substitute(quad, resolve)
+        for operand in uses(quad):
+            if isinstance(operand, Version):
+                readers[operand] = readers.get(operand, 0) + 1
+
+    removed = set()
+    pending = [version for version in definitions if version in copies or not readers.get(version)]
+    while pending:
+        version = pending.pop()
+        quad = definitions[version]
+        if id(quad) in removed or quad.op == Op.CALL or (version not in copies and readers.get(version)):
+            continue
+        removed.add(id(quad))
+        for operand in uses(quad):
+            if isinstance(operand, Version):
+                readers[operand] -= 1
+                if not readers[operand] and operand in definitions:
+                    pending.append(operand)
+
+    for block in procedure.blocks:
+        block.quads = [quad for quad in block.quads if id(quad) not in removed]
+    for quad in procedure.quads:
+        if quad.op == Op.CALL and isinstance(quad.dest, Version) and not readers.get(quad.dest):
+            quad.dest = None
+
+    from_ssa(procedure, variables)
+    return bool(unreachable or copies or removed)
+
+
+def invariant_code(
+    loop: Loop, dominators: DominatorTree, live_in: list[set], moved: set[int]
+) -> list[Quad]:
+    """
+    Instructions of the loop that compute the same value in every iteration and can run once before it, in
+    an order where every one comes after those it reads. An instruction is moved when its result is assigned
+    only there in the loop, isn't read in the loop before being assigned, and is either dead after the loop
+    or assigned before every exit. A division moves only by a non-zero constant, since the loop may not run.
+    A call in the loop can assign any variable, so then only temporaries move, computed from constants and
+    temporaries.
+    """
+    calls = False
+    # operand -> instructions assigning it in the loop
+    assignments: dict = {}
+    for block in loop.blocks:
+        for quad in block.quads:
+            if id(quad) in moved:
+                continue
+            calls = calls or quad.op == Op.CALL
+            if quad.dest is not None:
+                assignments.setdefault(quad.dest, []).append(quad)
+
+    exiting = [block for block in loop.blocks if any(successor not in loop for successor in block.successors)]
+    live_after = set()
+    for block in exiting:
+        for successor in block.successors:
+            if successor not in loop:
+                live_after |= live_in[successor.index]
+
+    def invariant(operand) -> bool:
+        if isinstance(operand, Const):
+            return True
+        if isinstance(operand, Var) and calls:
+            return False
+        return operand not in assignments
+
+    hoisted: list[Quad] = []
+    changed = True
+    while changed:
+        changed = False
+        for block in loop.blocks:
+            for quad in block.quads:
+                op = quad.op
+                dest = quad.dest
+                if id(quad) in moved or not (op == Op.COPY or op == Op.NOT or op in OPERATOR_SYMBOLS):
+                    continue
+                if len(assignments[dest]) > 1 or dest in live_in[loop.header.index]:
+                    continue
+                if isinstance(dest, Var) and calls:
+                    continue
+                if not all(invariant(operand) for operand in uses(quad)):
+                    continue
+                if (op == Op.DIVIDE or op == Op.MODULE) and not (isinstance(quad.arg2, Const) and quad.arg2.value):
+                    continue
+                if dest in live_after and not all(dominators.dominates(block, other) for other in exiting):
+                    continue
+
+                moved.add(id(quad))
+                hoisted.append(quad)
+                # what reads it is invariant now
+                del assignments[dest]
+                changed = True
+
+    return hoisted
+
+
+def has_preheader(loop: Loop, blocks: list[BasicBlock]) -> bool:
+    """
+    Whether the loop is entered only by falling into its header, so that code placed right before the label
+    of the header runs once before the loop.
+    """
+    header = loop.header
+    previous = blocks[header.index - 1] if header.index > 0 else None
+    return (
+        previous is not None
+        and [block for block in header.predecessors if block not in loop] == [previous]
+        and jump_target(previous.quads[-1]) is not header.label
+    )
+
+
+def hoist_invariants(procedure: Procedure) -> bool:
+    """
+    Loop-invariant code motion: move the invariant instructions of every loop to a preheader, the code
+    right before the label of its header. That needs the loop to be entered only by falling into the
+    header, as a while loop is; other loops are left alone. Outer loops go first, so that an instruction
+    leaves every loop it is invariant in.
+    """
+    blocks = procedure.blocks
+    dominators = dominator_tree(blocks)
+    live_in = live_operands(procedure)[0]
+
+    moved: set[int] = set()
+    preheaders: dict[int, list[Quad]] = {}
+    for loop in reversed(natural_loops(blocks, dominators)):
+        if not has_preheader(loop, blocks):
+            continue
+        hoisted = invariant_code(loop, dominators, live_in, moved)
+        if hoisted:
+            preheaders[loop.header.index] = hoisted
+
+    if not moved:
+        return False
+
+    code = []
+    for block in blocks:
+        code.extend(preheaders.get(block.index, ()))
+        code.extend(quad for quad in block.quads if id(quad) not in moved)
+    procedure.blocks = build_blocks(code)
+    return True
+
+
+def increment(quad: Quad, operand) -> Optional[int]:
+    """
+    c for operand + c, c + operand and operand - c (as -c), c an integer constant.
+    """
+    left, right = quad.arg1, quad.arg2
+    if quad.op == Op.ADD and right is operand:
+        left, right = right, left
+    if (quad.op == Op.ADD or quad.op == Op.SUBTRACT) and left is operand and integer(right) is not None:
+        return right.value if quad.op == Op.ADD else -right.value
+    return None
+
+
+def integer(operand) -> Optional[int]:
+    if isinstance(operand, Const) and type(operand.value) is int:
+        return operand.value
+    return None
+
+
+def induction_variables(loop: Loop) -> dict:
+    """
+    Basic induction variables of the loop: operand -> (the only instruction assigning it in the loop, what it
+    adds every time). i = i + c counts, and so does t = i + c; i = t with both in the same block. A call in
+    the loop can assign any variable, so then only temporaries are.
+    """
+    calls = False
+    # operand -> instructions assigning it in the loop
+    assignments: dict = {}
+    # id of an instruction -> (index of its block, position in it)
+    positions: dict[int, tuple[int, int]] = {}
+    for block in loop.blocks:
+        for position, quad in enumerate(block.quads):
+            calls = calls or quad.op == Op.CALL
+            if quad.dest is not None:
+                assignments.setdefault(quad.dest, []).append(quad)
+                positions[id(quad)] = (block.index, position)
+
+    variables = {}
+    for operand, quads in assignments.items():
+        if len(quads) > 1 or not isinstance(operand, (Var, Temp)) or (isinstance(operand, Var) and calls):
+            continue
+        quad = quads[0]
+        step = increment(quad, operand)
+        if step is None and quad.op == Op.COPY and len(assignments.get(quad.arg1, ())) == 1:
+            source = assignments[quad.arg1][0]
+            source_block, source_position = positions[id(source)]
+            block_index, position = positions[id(quad)]
+            if source_block == block_index and source_position < position:
+                step = increment(source, operand)
+        if step is not None:
+            variables[operand] = (quad, step)
+    return variables
+
+
+def reduce_induction(procedure: Procedure) -> bool:
+    """
+    Strength reduction of induction variables: in a loop with a preheader, every d = i * k, i a basic
+    induction variable and k an integer constant, becomes a copy of a temporary computed as i * k before the
+    loop and increased by step * k right after i is. Inner loops go first.
+    """
+    blocks = procedure.blocks
+    reduced: set[int] = set()
+    preheaders: dict[int, list[Quad]] = {}
+    # id of the instruction assigning an induction variable -> instructions updating its products
+    updates: dict[int, list[Quad]] = {}
+    for loop in natural_loops(blocks):
+        if not has_preheader(loop, blocks):
+            continue
+        variables = induction_variables(loop)
+        # (induction variable, k) -> temporary holding the product
+        products: dict[tuple, Temp] = {}
+        for block in loop.blocks:
+            for quad in block.quads:
+                if quad.op != Op.MULTIPLY or id(quad) in reduced:
+                    continue
+                operand, factor = quad.arg1, integer(quad.arg2)
+                if factor is None:
+                    operand, factor = quad.arg2, integer(quad.arg1)
+                if factor is None or operand not in variables:
+                    continue
+
+                product = products.get((operand, factor))
+                if product is None:
+                    product = products[(operand, factor)] = Temp(0)
+                    update, step = variables[operand]
+                    preheaders.setdefault(loop.header.index, []).append(
+                        Quad(Op.MULTIPLY, product, operand, constant(factor))
+                    )
+                    updates.setdefault(id(update), []).append(
+                        Quad(Op.ADD, product, product, constant(step * factor))
+                    )
+                quad.op, quad.arg1, quad.arg2 = Op.COPY, product, None
+                reduced.add(id(quad))
+
+    if not reduced:
+        return False
+
+    code = []
+    for block in blocks:
+        code.extend(preheaders.get(block.index, ()))
+        for quad in block.quads:
+            code.append(quad)
+            code.extend(updates.get(id(quad), ()))
+    procedure.blocks = build_blocks(code)
+    return True
+
+
+# x op x -> true for these, false for the others
+REFLEXIVE = {
+    Op.EQUAL: True,
+    Op.LESS_OR_EQUAL: True,
+    Op.GREATER_OR_EQUAL: True,
+    Op.DIFFERENT: False,
+    Op.LESS: False,
+    Op.GREATER: False,
+}
+
+
+def rewrite(quad: Quad, op: int, arg1, arg2=None) -> bool:
+    quad.op, quad.arg1, quad.arg2 = op, arg1, arg2
+    return True
+
+
+def simplify_operation(quad: Quad) -> bool:
+    """
+    Algebraic identities and strength reduction on a binary operation: x * 1, x + 0, x - 0, x / 1 -> x,
+    x * 0, x - x, x % 1 -> 0, x * 2^k -> x << k, comparisons of x with itself, x and x, x or x -> x,
+    x == true, x != false -> x and x == false, x != true -> not x.
+    """
+    op, left, right = quad.op, quad.arg1, quad.arg2
+    if op == Op.MULTIPLY or op == Op.ADD:
+        # the constant on the right
+        if integer(left) is not None:
+            left, right = right, left
+    factor = integer(right)
+    same = left is right and isinstance(left, (Var, Temp))
+
+    if op == Op.MULTIPLY and factor is not None:
+        if factor == 1:
+            return rewrite(quad, Op.COPY, left)
+        if factor == 0:
+            return rewrite(quad, Op.COPY, constant(0))
+        if factor > 0 and factor & (factor - 1) == 0:
+            return rewrite(quad, Op.SHIFT_LEFT, left, constant(factor.bit_length() - 1))
+    elif (op == Op.ADD or op == Op.SUBTRACT) and factor == 0:
+        return rewrite(quad, Op.COPY, left)
+    elif op == Op.SUBTRACT and same:
+        return rewrite(quad, Op.COPY, constant(0))
+    elif op == Op.DIVIDE and factor == 1:
+        return rewrite(quad, Op.COPY, left)
+    elif op == Op.MODULE and factor == 1:
+        return rewrite(quad, Op.COPY, constant(0))
+    elif op in REFLEXIVE and same:
+        return rewrite(quad, Op.COPY, constant(REFLEXIVE[op]))
+    elif (op == Op.AND or op == Op.OR) and same:
+        return rewrite(quad, Op.COPY, left)
+    elif op == Op.EQUAL or op == Op.DIFFERENT:
+        if isinstance(left, Const) and type(left.value) is bool:
+            left, right = right, left
+        if isinstance(right, Const) and type(right.value) is bool:
+            # x == true and x != false are x
+            if right.value == (op == Op.EQUAL):
+                return rewrite(quad, Op.COPY, left)
+            return rewrite(quad, Op.NOT, left)
+    return False
+
+
+def simplify_algebra(procedure: Procedure) -> bool:
+    """
+    Simplify the operations of every block with simplify_operation, and not not b into b while b still
+    holds the value that was negated. Division and modulo by powers of two stay: rounding of negative
+    operands is up to the target.
+    """
+    changed = False
+    for block in procedure.blocks:
+        # dest of a not in the block -> its operand
+        negations: dict = {}
+        for quad in block.quads:
+            if quad.op == Op.NOT and quad.arg1 in negations:
+                changed = rewrite(quad, Op.COPY, negations[quad.arg1])
+            elif quad.op in OPERATOR_SYMBOLS:
+                changed = simplify_operation(quad) or changed
+
+            dest = quad.dest
+            if quad.op == Op.CALL or dest is not None:
+                # the callee can assign any variable it sees
+                negations = {
+                    negated: operand
+                    for negated, operand in negations.items()
+                    if not (negated is dest or operand is dest)
+                    and not (quad.op == Op.CALL and (isinstance(negated, Var) or isinstance(operand, Var)))
+                }
+            if quad.op == Op.NOT and isinstance(quad.arg1, (Var, Temp)) and quad.arg1 is not dest:
+                negations[dest] = quad.arg1
+    return changed
+
+
+def retarget(quad: Quad, label: Label):
+    if quad.op == Op.GOTO:
+        quad.arg1 = label
+    else:
+        quad.arg2 = label
+
+
+def simplify_jumps(code: list[Quad]) -> tuple[list[Quad], bool]:
+    """
+    One round of jump threading over the code of a procedure: adjacent labels become one, jumps to a label
+    followed by a go to jump to its target instead, ifFalse c go to L1; go to L2; L1: becomes
+    ifTrue c go to L2; L1: (and the other way around), and jumps to the next instruction are removed.
+    """
+    # merged label -> the first label of its group
+    aliases: dict[Label, Label] = {}
+    # label -> target of the go to right after it
+    forwards: dict[Label, Label] = {}
+    for index, quad in enumerate(code):
+        if quad.op != Op.LABEL:
+            continue
+        previous = code[index - 1] if index > 0 else None
+        if previous is not None and previous.op == Op.LABEL:
+            aliases[quad.arg1] = aliases.get(previous.arg1, previous.arg1)
+        following = code[index + 1] if index + 1 < len(code) else None
+        if following is not None and following.op == Op.GOTO:
+            forwards[aliases.get(quad.arg1, quad.arg1)] = following.arg1
+
+    def resolve(label: Label) -> Label:
+        label = aliases.get(label, label)
+        seen = set()
+        # a go to that jumps to itself is an infinite loop, and stays one
+        while label in forwards and label not in seen:
+            seen.add(label)
+            label = aliases.get(forwards[label], forwards[label])
+        return label
+
+    changed = bool(aliases)
+    merged = []
+    for quad in code:
+        target = jump_target(quad)
+        if target is not None:
+            resolved = resolve(target)
+            if resolved is not target:
+                retarget(quad, resolved)
+                changed = True
+        if quad.op != Op.LABEL or quad.arg1 not in aliases:
+            merged.append(quad)
+
+    simplified = []
+    index = 0
+    while index < len(merged):
+        quad = merged[index]
+        following = merged[index + 1] if index + 1 < len(merged) else None
+        after = merged[index + 2] if index + 2 < len(merged) else None
+        if (
+            quad.op in BRANCHES
+            and following is not None
+            and following.op == Op.GOTO
+            and after is not None
+            and after.op == Op.LABEL
+            and after.arg1 is quad.arg2
+        ):
+            quad.op = Op.IF_TRUE if quad.op == Op.IF_FALSE else Op.IF_FALSE
+            quad.arg2 = following.arg1
+            simplified.append(quad)
+            index += 2
+            changed = True
+        elif following is not None and following.op == Op.LABEL and following.arg1 is jump_target(quad):
+            index += 1
+            changed = True
+        else:
+            simplified.append(quad)
+            index += 1
+
+    return simplified, changed
+
+
+def thread_jumps(procedure: Procedure) -> bool:
+    """
+    Simplify the jumps until nothing changes, removing the code and labels they no longer reach.
+    """
+    changed = False
+    while True:
+        code, simplified = simplify_jumps(list(procedure.quads))
+        procedure.blocks = build_blocks(code)
+        simplified = remove_unreachable(procedure) or simplified
+        if remove_unused_labels(procedure):
+            procedure.rebuild()
+            simplified = True
+        if not simplified:
+            return changed
+        changed = True
+
+
+# name -> pass, in the order optimize() runs them by default; a list of names runs in its own order
+PASSES: dict[str, Callable[[Procedure], bool]] = {
+    "constants": propagate_constants,
+    "values": number_values,
+    "copies": propagate_copies,
+    "loops": hoist_invariants,
+    "induction": reduce_induction,
+    "algebra": simplify_algebra,
+    "dead_code": eliminate_dead_code,
+    "jumps": thread_jumps,
+}
+
+
+def optimize(code: list[Quad], passes: Optional[Iterable[str]] = None) -> list[Quad]:
+    """
+    Run the passes, all of them by default, over every procedure of the code. Temporaries are renumbered
+    at the end, since a pass may make a temporary live across statements.
+    """
+    selected = list(PASSES) if passes is None else list(passes)
+    for name in selected:
+        if name not in PASSES:
+            raise ValueError(f"Unknown optimization pass '{name}'")
+
+    procedures = split_procedures(code)
+    for procedure in procedures:
+        for name in selected:
+            PASSES[name](procedure)
+
+    return allocate(join_procedures(procedures))
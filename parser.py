@@ -1,619 +1,786 @@
-from typing import Any, Dict
-from lexer import Token
+from typing import Any, Dict, Iterable, NamedTuple, Optional
+from lexer import KIND_NAMES, SymbolTable, Token, TokenKind, TokenStream
+from scopes import ScopeStack
+from syntax_tree import (
+    Assign,
+    BinOp,
+    Break,
+    Call,
+    Continue,
+    Expression,
+    ExprStatement,
+    FunctionDecl,
+    If,
+    Literal,
+    Name,
+    Param,
+    Print,
+    ProcedureDecl,
+    Program,
+    Return,
+    Statement,
+    UnaryOp,
+    VarDecl,
+    While,
+)
 
 
 Type = str  # Type alias for better readability, can be either "INT" or "BOOL"
 
+# type of names and calls that could not be resolved in recovery mode, never reported again
+ERROR_TYPE = "ERROR"
+
+# contexts a statement can appear in
+TOP_LEVEL = 0
+IN_FUNCTION = 1
+IN_LOOP = 2
+
+BOOLEAN_LITERALS = frozenset((TokenKind.TRUE, TokenKind.FALSE))
+LOGICAL_OPERATORS = frozenset((TokenKind.AND, TokenKind.OR))
+ARITHMETIC_OPERATORS = frozenset(
+    (
+        TokenKind.PLUS,
+        TokenKind.MINUS,
+        TokenKind.MULTIPLY,
+        TokenKind.DIVIDE,
+        TokenKind.MODULE,
+    )
+)
+
+# binding power of the binary operators, all left associative. NOT is a prefix of a single factor
+# and binds tighter than any of them
+PRECEDENCE = {
+    TokenKind.OR: 1,
+    TokenKind.AND: 2,
+    TokenKind.EQUAL: 3,
+    TokenKind.DIFFERENT: 3,
+    TokenKind.GREATER: 3,
+    TokenKind.GREATER_OR_EQUAL: 3,
+    TokenKind.LESS: 3,
+    TokenKind.LESS_OR_EQUAL: 3,
+    TokenKind.PLUS: 4,
+    TokenKind.MINUS: 4,
+    TokenKind.MULTIPLY: 5,
+    TokenKind.DIVIDE: 5,
+    TokenKind.MODULE: 5,
+}
+
+# tokens that close a list of statements
+BLOCK_END = frozenset((TokenKind.RBRACE,))
+CONDITIONAL_END = frozenset((TokenKind.RBRACE, TokenKind.ELSE))
+FUNCTION_END = frozenset((TokenKind.RBRACE, TokenKind.RETURN))
+
 
 class SemanticError(Exception):
     pass
 
 
+class ParseError(SyntaxError):
+    def __init__(self, message: str, line: Optional[int], expected: Optional[str], found: Optional[str]):
+        super().__init__(message)
+        self.line = line
+        self.expected = expected
+        self.found = found
+
+
+class Diagnostic(NamedTuple):
+    kind: str  # "syntax" or "semantic"
+    line: Optional[int]
+    expected: Optional[str]
+    found: Optional[str]
+    message: str
+
+
 class Parser:
     """
-    Syntactic and semantic analysis of the program. And also create three address code.
+    Syntactic and semantic analysis of the program. Builds the abstract syntax tree in self.tree.
+
+    With recover=True errors don't stop the analysis: they are collected in self.diagnostics and the
+    parser resumes after the statement that failed.
     """
 
-    def __init__(self):
+    def __init__(self, recover: bool = False):
+        self.recover = recover
+        self.diagnostics: list[Diagnostic] = []
         self.index = 0
         self.tokens = None
         self.symbol_table = None
         self.current_token = None
         self.current_scope = -1
-        self.scopes = []
-        self.instructions = []
+        self.scopes = ScopeStack()
+        self.tree: Optional[Program] = None
+
+        statements = {
+            TokenKind.INT: self.declaration_and_assignment,
+            TokenKind.BOOL: self.declaration_and_assignment,
+            TokenKind.PRINT: self.print_statement,
+            TokenKind.FUNCTION: self.function_or_procedure,
+            TokenKind.PROCEDURE: self.function_or_procedure,
+            TokenKind.IF: self.if_statement,
+            TokenKind.WHILE: self.while_loop,
+            TokenKind.IDENTIFIER: self.identifier_statement,
+        }
+        self.dispatch = {
+            TOP_LEVEL: statements,
+            IN_FUNCTION: statements,
+            IN_LOOP: {
+                **statements,
+                TokenKind.BREAK: self.break_statement,
+                TokenKind.CONTINUE: self.continue_statement,
+            },
+        }
+        self.context = TOP_LEVEL
+        self.handlers = self.dispatch[TOP_LEVEL]
 
-    def parse(self, tokens: list[Token], symbol_table: Dict[Token, Dict[str, Any]]):
-        self.tokens = tokens
+    def parse(self, tokens: Iterable[Token], symbol_table: SymbolTable) -> Program:
+        self.tokens = TokenStream(tokens)
         self.symbol_table = symbol_table
-        self.current_token = self.tokens[self.index]
-        self.program()
+        self.current_token = self.tokens.peek()
+
+        if self.current_token is None:
+            raise SyntaxError("Expected a statement, found EOF")
+
+        self.tree = self.program()
 
         if self.current_token is not None:
             self.error()
 
-    def program(self):
-        self.current_scope = 0
-        self.scopes.insert(self.current_scope, {})
+        return self.tree
 
-        self.start_of_program()
-        while self.current_token is not None:
-            self.start_of_program()
-
-        self.scopes.pop(self.current_scope)
-
-    def start_of_program(self):
-        if self.current_token.token_type in ["INT", "BOOL"]:
-            self.declaration_and_assignment()
-        elif self.current_token.token_type == "PRINT":
-            self.print_statement()
-        elif self.current_token.token_type in ["FUNCTION", "PROCEDURE"]:
-            self.function_or_procedure()
-        elif self.current_token.token_type == "IF":
-            self.if_statement()
-        elif self.current_token.token_type == "WHILE":
-            self.while_loop()
-        elif self.current_token.token_type == "IDENTIFIER":
-            if self.tokens[self.index + 1].token_type == "LPAREN":
-                self.function_or_procedure_call()
-                self.match("SEMICOLON")
-            elif self.tokens[self.index + 1].token_type == "ASSIGN":
-                self.assignment_statement()
-            else:
-                self.expression()
-                self.match("SEMICOLON")
-        else:
+    def parse_unit(self, tokens: Iterable[Token]) -> list[Statement]:
+        """
+        Parse more top-level statements in the scope left by the previous ones. The caller opens the
+        global scope and sets the symbol table.
+        """
+        self.tokens = TokenStream(tokens)
+        self.current_token = self.tokens.peek()
+
+        return self.statement_list(TOP_LEVEL, frozenset())
+
+    def program(self) -> Program:
+        self.open_scope()
+
+        body = self.statement_list(TOP_LEVEL, frozenset())
+
+        self.close_scope()
+        return Program(body)
+
+    def statement(self) -> Statement:
+        handler = self.handlers.get(self.current_token.kind)
+        if handler is None:
             self.error()
 
-    def start_of_while(self):
-        if self.current_token.token_type in ["INT", "BOOL"]:
-            self.declaration_and_assignment()
-        elif self.current_token.token_type == "PRINT":
-            self.print_statement()
-        elif self.current_token.token_type in ["FUNCTION", "PROCEDURE"]:
-            self.function_or_procedure()
-        elif self.current_token.token_type == "IF":
-            self.if_statement_while()
-        elif self.current_token.token_type == "WHILE":
-            self.while_loop()
-        elif self.current_token.token_type == "BREAK":
-            self.break_statement()
-        elif self.current_token.token_type == "CONTINUE":
-            self.continue_statement()
-        elif self.current_token.token_type == "IDENTIFIER":
-            if self.tokens[self.index + 1].token_type == "LPAREN":
-                self.function_or_procedure_call()
-                self.match("SEMICOLON")
-            elif self.tokens[self.index + 1].token_type == "ASSIGN":
-                self.assignment_statement()
-            else:
-                self.expression()
-                self.match("SEMICOLON")
+        return handler()
+
+    def statement_list(self, context: int, end: frozenset) -> list[Statement]:
+        """
+        Parse statements valid in the given context until one of the end tokens or EOF.
+        """
+        outer_context, outer_handlers = self.context, self.handlers
+        self.context, self.handlers = context, self.dispatch[context]
+
+        if self.recover:
+            body = self.recovering_statement_list(end)
         else:
-            self.error()
+            body = []
+            statement = self.statement
+            while self.current_token is not None and self.current_token.kind not in end:
+                body.append(statement())
+
+        self.context, self.handlers = outer_context, outer_handlers
+        return body
+
+    def recovering_statement_list(self, end: frozenset) -> list[Statement]:
+        context, handlers, depth = self.context, self.handlers, self.scopes.depth
+
+        body = []
+        while self.current_token is not None and self.current_token.kind not in end:
+            start = self.index
+            try:
+                body.append(self.statement())
+                continue
+            except ParseError as error:
+                self.diagnostics.append(Diagnostic("syntax", error.line, error.expected, error.found, str(error)))
+
+            # unwind what the failed statement left open
+            self.context, self.handlers = context, handlers
+            while self.scopes.depth > depth:
+                self.close_scope()
+            self.synchronize(start)
+
+        return body
+
+    def synchronize(self, start: int):
+        """
+        Skip past the next SEMICOLON or block, or up to the RBRACE that closes the enclosing block.
+        """
+        depth = 0
+        while self.current_token is not None:
+            kind = self.current_token.kind
+            if kind == TokenKind.SEMICOLON and depth == 0:
+                self.consume_token()
+                return
+            elif kind == TokenKind.LBRACE:
+                depth += 1
+            elif kind == TokenKind.RBRACE:
+                if depth == 0:
+                    break
+                depth -= 1
+                if depth == 0:
+                    self.consume_token()
+                    return
+            self.consume_token()
+
+        # always make progress, even on a stray RBRACE
+        if self.index == start and self.current_token is not None:
+            self.consume_token()
+
+    def identifier_statement(self) -> Statement:
+        line = self.current_token.line
+        if self.lookahead() == TokenKind.LPAREN:
+            call = self.function_or_procedure_call()
+            self.match(TokenKind.SEMICOLON)
+            return ExprStatement(call, line)
+        elif self.lookahead() == TokenKind.ASSIGN:
+            return self.assignment_statement()
+        else:
+            expression = self.expression()
+            self.match(TokenKind.SEMICOLON)
+            return ExprStatement(expression, line)
 
-    def declaration_and_assignment(self):
+    def declaration_and_assignment(self) -> VarDecl:
         variable_type = self.current_token.token_type
         self.tipo()
         variable_token = self.current_token
-        self.instructions.append(self.current_token)
         self.identifier()
 
         # check if the variable has already been declared in the current scope or in the parent scopes
-        for scope in self.scopes:
-            for token in scope.keys():
-                if token.value == variable_token.value:
-                    raise SemanticError(
-                        f"Variable '{variable_token.value}' in line {variable_token.line} "
-                        f"already declared in line {token.line}"
-                    )
-
-        if self.current_token.token_type == "ASSIGN":
-            self.instructions.append(self.current_token)
-            self.match("ASSIGN")
-            expression_type = self.expression()
-            self.check_types(variable_type, expression_type)
-
-        if self.current_token.token_type == "SEMICOLON":
-            self.match("SEMICOLON")
-
-        self.scopes[self.current_scope][variable_token] = {
-            "variable_type": variable_type,
-            "scope": self.current_scope,
-        }
+        declaration = self.find_declaration(variable_token)
+        if declaration is not None:
+            self.semantic_error(
+                f"Variable '{variable_token.value}' in line {variable_token.line} "
+                f"already declared in line {declaration['token'].line}",
+                variable_token.line,
+            )
+
+        value = None
+        if self.at(TokenKind.ASSIGN):
+            self.match(TokenKind.ASSIGN)
+            try:
+                value = self.expression()
+            except ParseError:
+                # declare it anyway, so that its uses aren't reported as undeclared after recovering
+                self.declare(variable_token, ERROR_TYPE)
+                raise
+            self.check_types(variable_type, value.type, variable_token.line)
 
-    def assignment_statement(self):
+        if self.at(TokenKind.SEMICOLON):
+            self.match(TokenKind.SEMICOLON)
+
+        self.declare(variable_token, variable_type)
+
+        return VarDecl(
+            variable_token.value, variable_token.symbol_id, variable_type, value, variable_token.line
+        )
+
+    def assignment_statement(self) -> Assign:
         variable_token = self.current_token
-        self.instructions.append(self.current_token)
         self.identifier()
         variable_type = self.get_variable_type(variable_token)
-        self.instructions.append(self.current_token)
-        self.match("ASSIGN")
-        expression_type = self.expression()
-        self.check_types(variable_type, expression_type)
-        self.match("SEMICOLON")
-
-    def expression(self) -> Type:
-        return self.boolean_expression()
-
-    def boolean_expression(self) -> Type:
-        expression_type = self.arithmetic_expression()
-        while self.current_token.token_type in [
-            "EQUAL",
-            "DIFFERENT",
-            "GREATER",
-            "GREATER_OR_EQUAL",
-            "LESS",
-            "LESS_OR_EQUAL",
-            "AND",
-            "OR",
-        ]:
-            operator = self.current_token.token_type
-            self.instructions.append(self.current_token)
-            self.match(operator)
-
-            right_operand_type = self.arithmetic_expression()
-
-            if expression_type != right_operand_type:
-                raise SemanticError(
-                    f"Type mismatch: Cannot perform {operator} operation between {expression_type} and "
-                    f"{right_operand_type} at line {self.current_token.line}"
-                )
+        self.match(TokenKind.ASSIGN)
+        value = self.expression()
+        self.check_types(variable_type, value.type, variable_token.line)
+        self.match(TokenKind.SEMICOLON)
+
+        return Assign(variable_token.value, variable_token.symbol_id, value, variable_token.line)
+
+    def expression(self) -> Expression:
+        """
+        Precedence climbing over explicit stacks, so nesting depth isn't limited by the Python stack.
+        """
+        operands = []
+        # pending LPAREN, NOT and binary operator tokens
+        operators = []
+        open_parens = 0
+        precedence_of = PRECEDENCE.get
+
+        while True:
+            # prefixes of the next factor
+            token = self.current_token
+            while token is not None and (token.kind == TokenKind.LPAREN or token.kind == TokenKind.NOT):
+                if token.kind == TokenKind.LPAREN:
+                    open_parens += 1
+                operators.append(token)
+                self.consume_token()
+                token = self.current_token
+
+            operands.append(self.primary())
+
+            while True:
+                # a factor is complete, apply the NOTs in front of it
+                while operators and operators[-1].kind == TokenKind.NOT:
+                    self.reduce_not(operators.pop(), operands)
+
+                token = self.current_token
+                if open_parens and token is not None and token.kind == TokenKind.RPAREN:
+                    while operators[-1].kind != TokenKind.LPAREN:
+                        self.reduce_binary(operators.pop(), operands)
+                    operators.pop()
+                    open_parens -= 1
+                    self.consume_token()
+                else:
+                    break
 
-            if operator in ["AND", "OR"]:
-                if expression_type != "BOOL":
-                    raise SemanticError(
-                        f"Invalid operation: {operator} operation not supported on "
-                        f"type {expression_type} at line {self.current_token.line}"
-                    )
-
-                if right_operand_type != "BOOL":
-                    raise SemanticError(
-                        f"Invalid operation: {operator} operation not supported "
-                        f"on type {right_operand_type} at line {self.current_token.line}"
-                    )
-
-            expression_type = "BOOL"
-
-        return expression_type
-
-    def arithmetic_expression(self) -> Type:
-        expression_type = self.factor()
-        while self.current_token.token_type in [
-            "PLUS",
-            "MINUS",
-            "MULTIPLY",
-            "DIVIDE",
-            "MODULE",
-        ]:
-            operator = self.current_token.token_type
-            self.instructions.append(self.current_token)
-            self.match(operator)
-            right_operand_type = self.factor()
-
-            if expression_type != right_operand_type:
-                raise SemanticError(
-                    f"Type mismatch: Cannot perform {operator} operation between {expression_type} and "
-                    f"{right_operand_type} at line {self.current_token.line}"
-                )
+            precedence = precedence_of(token.kind) if token is not None else None
+            if precedence is None:
+                break
+
+            while operators and precedence_of(operators[-1].kind, 0) >= precedence:
+                self.reduce_binary(operators.pop(), operands)
+
+            operators.append(token)
+            self.consume_token()
+
+        if open_parens:
+            self.match(TokenKind.RPAREN)
+
+        while operators:
+            self.reduce_binary(operators.pop(), operands)
+
+        return operands[0]
+
+    def primary(self) -> Expression:
+        token = self.current_token
+        if token is None:
+            self.unexpected_eof("expression")
+        kind = token.kind
+
+        if kind == TokenKind.IDENTIFIER:
+            if self.lookahead() == TokenKind.LPAREN:
+                return self.function_or_procedure_call()
+
+            self.consume_token()
+            return Name(token.value, token.symbol_id, self.get_variable_type(token), token.line)
+        elif kind == TokenKind.INTEGER:
+            self.consume_token()
+            return Literal(int(token.value), "INT", token.line)
+        elif kind in BOOLEAN_LITERALS:
+            self.consume_token()
+            return Literal(kind == TokenKind.TRUE, "BOOL", token.line)
+
+        self.error()
+
+    def reduce_binary(self, operator_token: Token, operands: list[Expression]):
+        right_operand = operands.pop()
+        left_operand = operands.pop()
+        operator = operator_token.token_type
+        expression_type = left_operand.type
+        right_operand_type = right_operand.type
+
+        if expression_type != right_operand_type:
+            self.semantic_error(
+                f"Type mismatch: Cannot perform {operator} operation between {expression_type} and "
+                f"{right_operand_type} at line {operator_token.line}",
+                operator_token.line,
+                expression_type,
+                right_operand_type,
+            )
 
-            expression_type = "INT"
-
-        return expression_type
-
-    def factor(self) -> Type:
-        expression_type = None
-
-        if self.current_token.token_type == "LPAREN":
-            self.instructions.append(self.current_token)
-            self.match("LPAREN")
-            expression_type = self.expression()
-            self.instructions.append(self.current_token)
-            self.match("RPAREN")
-        elif self.current_token.token_type == "IDENTIFIER":
-            if self.tokens[self.index + 1].token_type == "LPAREN":
-                expression_type = self.function_or_procedure_call()
-
-            else:
-                variable_token = self.current_token
-                self.instructions.append(self.current_token)
-                self.identifier()
-                expression_type = self.get_variable_type(variable_token)
-
-        elif self.current_token.token_type == "INTEGER":
-            self.instructions.append(self.current_token)
-            self.number()
-            expression_type = "INT"
-        elif self.current_token.token_type in ["TRUE", "FALSE"]:
-            self.instructions.append(self.current_token)
-            self.boolean()
-            expression_type = "BOOL"
-        elif self.current_token.token_type == "NOT":
-            self.instructions.append(self.current_token)
-            self.match("NOT")
-            expression_type = self.factor()
+        if operator_token.kind in LOGICAL_OPERATORS:
             if expression_type != "BOOL":
-                raise SemanticError(
-                    f"Invalid operation: NOT operation not supported on type {expression_type} "
-                    f"at line {self.current_token.line}"
+                self.semantic_error(
+                    f"Invalid operation: {operator} operation not supported on "
+                    f"type {expression_type} at line {operator_token.line}",
+                    operator_token.line,
+                    "BOOL",
+                    expression_type,
                 )
-        else:
-            self.error()
 
-        return expression_type
-
-    def print_statement(self):
-        self.instructions.append(self.current_token)
-        self.match("PRINT")
-        self.instructions.append(self.current_token)
-        self.match("LPAREN")
-        if self.current_token.token_type != "RPAREN":
-            self.argument_list()
-        self.instructions.append(self.current_token)
-        self.match("RPAREN")
-        self.match("SEMICOLON")
-
-    def function_or_procedure(self):
-        self.current_scope += 1
-        self.scopes.insert(self.current_scope, {})
-
-        if self.current_token.token_type == "FUNCTION":
-            self.instructions.append(self.current_token)
-            self.match("FUNCTION")
+            if right_operand_type != "BOOL":
+                self.semantic_error(
+                    f"Invalid operation: {operator} operation not supported "
+                    f"on type {right_operand_type} at line {operator_token.line}",
+                    operator_token.line,
+                    "BOOL",
+                    right_operand_type,
+                )
+
+        result_type = "INT" if operator_token.kind in ARITHMETIC_OPERATORS else "BOOL"
+        operands.append(BinOp(operator_token.value, left_operand, right_operand, result_type, operator_token.line))
+
+    def reduce_not(self, operator_token: Token, operands: list[Expression]):
+        operand = operands.pop()
+        if operand.type != "BOOL":
+            self.semantic_error(
+                f"Invalid operation: NOT operation not supported on type {operand.type} "
+                f"at line {operator_token.line}",
+                operator_token.line,
+                "BOOL",
+                operand.type,
+            )
+        operands.append(UnaryOp(operator_token.value, operand, "BOOL", operator_token.line))
+
+    def print_statement(self) -> Print:
+        line = self.current_token.line
+        self.match(TokenKind.PRINT)
+        self.match(TokenKind.LPAREN)
+        arguments = []
+        if not self.at(TokenKind.RPAREN):
+            arguments = self.argument_list()
+        self.match(TokenKind.RPAREN)
+        self.match(TokenKind.SEMICOLON)
+
+        return Print(arguments, line)
+
+    def function_or_procedure(self) -> Statement:
+        self.open_scope()
+
+        line = self.current_token.line
+        if self.current_token.kind == TokenKind.FUNCTION:
+            self.match(TokenKind.FUNCTION)
             variable_token = self.current_token
-            self.instructions.append(self.current_token)
             self.identifier()
 
-            for scope in self.scopes:
-                for token in scope.keys():
-                    if token.value == variable_token.value:
-                        raise SemanticError(
-                            f"Function '{variable_token.value}' in line {variable_token.line} "
-                            f"already declared in line {token.line}"
-                        )
-
-            self.instructions.append(self.current_token)
-            self.match("LPAREN")
-
-            list_of_parameters = []
-            if self.current_token.token_type != "RPAREN":
-                list_of_parameters = self.parameters()
-
-            self.instructions.append(self.current_token)
-            self.match("RPAREN")
-            self.match("ARROW")
-            variable_type = self.current_token.token_type
-            self.tipo()
-            temp_token = Token("BEGINFUNCTION", "begin_function", self.current_token.line)
-            self.instructions.append(temp_token)
-            self.match("LBRACE")
-
-            self.function_or_procedure_scope()
-            self.return_statement()
-            temp_token = Token("ENDFUNCTION", "end_function", self.current_token.line)
-            self.instructions.append(temp_token)
-            self.match("RBRACE")
-            self.scopes[self.current_scope - 1][variable_token] = {
-                "variable_type": variable_type,
-                "scope": self.current_scope - 1,
-                "parameters": list_of_parameters,
-            }
-        elif self.current_token.token_type == "PROCEDURE":
-            self.instructions.append(self.current_token)
-            self.match("PROCEDURE")
+            declaration = self.find_declaration(variable_token)
+            if declaration is not None:
+                self.semantic_error(
+                    f"Function '{variable_token.value}' in line {variable_token.line} "
+                    f"already declared in line {declaration['token'].line}",
+                    variable_token.line,
+                )
+
+            self.match(TokenKind.LPAREN)
+
+            parameters = []
+            if not self.at(TokenKind.RPAREN):
+                parameters = self.parameters()
+
+            self.match(TokenKind.RPAREN)
+            self.match(TokenKind.ARROW)
+            variable_type = self.tipo().token_type
+            self.match(TokenKind.LBRACE)
+
+            body = self.function_or_procedure_scope()
+            return_statement = self.return_statement()
+            end_line = self.match(TokenKind.RBRACE).line
+            self.close_scope()
+            self.declare(variable_token, variable_type, [parameter.variable_type for parameter in parameters])
+
+            return FunctionDecl(
+                variable_token.value,
+                variable_token.symbol_id,
+                parameters,
+                variable_type,
+                body,
+                return_statement,
+                line,
+                end_line,
+            )
+        elif self.current_token.kind == TokenKind.PROCEDURE:
+            self.match(TokenKind.PROCEDURE)
             variable_token = self.current_token
-            self.instructions.append(self.current_token)
             self.identifier()
 
-            for scope in self.scopes:
-                for token in scope.keys():
-                    if token.value == variable_token.value:
-                        raise SemanticError(
-                            f"Procedure '{variable_token.value}' in line {variable_token.line} "
-                            f"already declared in line {token.line}"
-                        )
-
-            self.instructions.append(self.current_token)
-            self.match("LPAREN")
-
-            list_of_parameters = []
-            if self.current_token.token_type != "RPAREN":
-                list_of_parameters = self.parameters()
-
-            self.instructions.append(self.current_token)
-            self.match("RPAREN")
-            temp_token = Token("BEGINPROCEDURE", "begin_procedure", self.current_token.line)
-            self.instructions.append(temp_token)
-            self.match("LBRACE")
-            self.function_or_procedure_scope()
-            temp_token = Token("ENDPROCEDURE", "end_procedure", self.current_token.line)
-            self.instructions.append(temp_token)
-            self.match("RBRACE")
-            self.scopes[self.current_scope - 1][variable_token] = {
-                "variable_type": None,
-                "scope": self.current_scope - 1,
-                "parameters": list_of_parameters,
-            }
-
-        self.scopes.pop(self.current_scope)
-        self.current_scope -= 1
-
-    def function_or_procedure_scope(self):
-        while self.current_token.token_type not in ["RBRACE", "RETURN"]:
-            self.start_of_program()
-
-    def function_or_procedure_call(self) -> Type:
+            declaration = self.find_declaration(variable_token)
+            if declaration is not None:
+                self.semantic_error(
+                    f"Procedure '{variable_token.value}' in line {variable_token.line} "
+                    f"already declared in line {declaration['token'].line}",
+                    variable_token.line,
+                )
+
+            self.match(TokenKind.LPAREN)
+
+            parameters = []
+            if not self.at(TokenKind.RPAREN):
+                parameters = self.parameters()
+
+            self.match(TokenKind.RPAREN)
+            self.match(TokenKind.LBRACE)
+            body = self.function_or_procedure_scope()
+            end_line = self.match(TokenKind.RBRACE).line
+            self.close_scope()
+            self.declare(variable_token, None, [parameter.variable_type for parameter in parameters])
+
+            return ProcedureDecl(variable_token.value, variable_token.symbol_id, parameters, body, line, end_line)
+        else:
+            self.error()
+
+    def function_or_procedure_scope(self) -> list[Statement]:
+        return self.statement_list(IN_FUNCTION, FUNCTION_END)
+
+    def function_or_procedure_call(self) -> Call:
         variable_token = self.current_token
-        self.instructions.append(self.current_token)
         self.identifier()
 
-        list_of_parameters = None
-        for scope in self.scopes:
-            for token in scope.keys():
-                if token.value == variable_token.value:
-                    list_of_parameters = scope[token]["parameters"]
-                    break
+        declaration = self.find_declaration(variable_token)
+        list_of_parameters = declaration.get("parameters") if declaration is not None else None
 
         if list_of_parameters is None:
-            raise SemanticError(
-                f"Function '{variable_token.value}' in line {variable_token.line} not declared"
+            self.semantic_error(
+                f"Function '{variable_token.value}' in line {variable_token.line} not declared",
+                variable_token.line,
             )
 
-        self.instructions.append(self.current_token)
-        self.match("LPAREN")
+        self.match(TokenKind.LPAREN)
 
         list_of_arguments = []
-        if self.current_token.token_type != "RPAREN":
+        if not self.at(TokenKind.RPAREN):
             list_of_arguments = self.argument_list()
-        self.instructions.append(self.current_token)
-        self.match("RPAREN")
+        self.match(TokenKind.RPAREN)
+
+        if list_of_parameters is None:
+            # only reachable in recovery mode, the missing declaration was already reported
+            return Call(
+                variable_token.value, variable_token.symbol_id, list_of_arguments, ERROR_TYPE, variable_token.line
+            )
 
         if len(list_of_parameters) != len(list_of_arguments):
-            raise SemanticError(
+            self.semantic_error(
                 f"Invalid number of arguments in function '{variable_token.value}' at line {variable_token.line}. "
-                f"Expected {len(list_of_parameters)} parameters, found {len(list_of_arguments)}"
+                f"Expected {len(list_of_parameters)} parameters, found {len(list_of_arguments)}",
+                variable_token.line,
+                str(len(list_of_parameters)),
+                str(len(list_of_arguments)),
             )
 
-        for i in range(len(list_of_parameters)):
-            if list_of_parameters[i] != list_of_arguments[i]:
-                raise SemanticError(
-                    f"Type mismatch: Cannot assign {list_of_arguments[i]} to {list_of_parameters[i]} "
-                    f"parameter in function '{variable_token.value}' at line {variable_token.line}"
+        for parameter_type, argument in zip(list_of_parameters, list_of_arguments):
+            if parameter_type != argument.type:
+                self.semantic_error(
+                    f"Type mismatch: Cannot assign {argument.type} to {parameter_type} "
+                    f"parameter in function '{variable_token.value}' at line {variable_token.line}",
+                    variable_token.line,
+                    parameter_type,
+                    argument.type,
                 )
 
         expression_type = self.get_variable_type(variable_token)
 
-        return expression_type
+        return Call(
+            variable_token.value, variable_token.symbol_id, list_of_arguments, expression_type, variable_token.line
+        )
 
-    def parameters(self) -> list[Type]:
+    def parameters(self) -> list[Param]:
         list_of_parameters = []
-        variable_type = self.current_token.token_type
-        list_of_parameters.append(variable_type)
+        variable_type = self.tipo().token_type
 
-        self.tipo()
         variable_token = self.current_token
-        self.instructions.append(self.current_token)
         self.identifier()
-        self.scopes[self.current_scope][variable_token] = {
-            "variable_type": variable_type,
-            "scope": self.current_scope,
-        }
+        self.declare(variable_token, variable_type)
+        list_of_parameters.append(
+            Param(variable_token.value, variable_token.symbol_id, variable_type, variable_token.line)
+        )
 
-        while self.current_token.token_type == "COLON":
-            self.instructions.append(self.current_token)
-            self.match("COLON")
-            variable_type = self.current_token.token_type
-            list_of_parameters.append(variable_type)
+        while self.at(TokenKind.COLON):
+            self.match(TokenKind.COLON)
+            variable_type = self.tipo().token_type
 
-            self.tipo()
             variable_token = self.current_token
-            self.instructions.append(self.current_token)
             self.identifier()
-            self.scopes[self.current_scope][variable_token] = {
-                "variable_type": variable_type,
-                "scope": self.current_scope,
-            }
+            self.declare(variable_token, variable_type)
+            list_of_parameters.append(
+                Param(variable_token.value, variable_token.symbol_id, variable_type, variable_token.line)
+            )
 
         return list_of_parameters
 
-    def argument_list(self) -> list[Type]:
+    def argument_list(self) -> list[Expression]:
         list_of_arguments = [self.expression()]
 
-        while self.current_token.token_type == "COLON":
-            self.instructions.append(self.current_token)
-            self.match("COLON")
+        while self.at(TokenKind.COLON):
+            self.match(TokenKind.COLON)
             list_of_arguments.append(self.expression())
 
         return list_of_arguments
 
-    def return_statement(self):
-        self.instructions.append(self.current_token)
-        self.match("RETURN")
-        self.expression()
-        self.match("SEMICOLON")
-
-    def if_statement(self):
-        self.instructions.append(self.current_token)
-        self.match("IF")
-        self.instructions.append(self.current_token)
-        self.match("LPAREN")
-        expression_type = self.boolean_expression()
-        if expression_type != "BOOL":
-            raise SemanticError(
-                f"Type mismatch: Cannot use {expression_type} in IF statement at line {self.current_token.line}"
+    def return_statement(self) -> Return:
+        line = self.match(TokenKind.RETURN).line
+        value = self.expression()
+        self.match(TokenKind.SEMICOLON)
+
+        return Return(value, line)
+
+    def if_statement(self) -> If:
+        line = self.current_token.line
+        self.match(TokenKind.IF)
+        self.match(TokenKind.LPAREN)
+        condition = self.expression()
+        if condition.type != "BOOL":
+            self.semantic_error(
+                f"Type mismatch: Cannot use {condition.type} in IF statement at line {line}",
+                line,
+                "BOOL",
+                condition.type,
             )
-        self.instructions.append(self.current_token)
-        self.match("RPAREN")
-        temp_token = Token("BEGINIF", "begin_if", self.current_token.line)
-        self.instructions.append(temp_token)
-        self.match("LBRACE")
-        self.conditional_scope()
-        temp_token = Token("ENDIF", "end_if", self.current_token.line)
-        self.instructions.append(temp_token)
-        self.match("RBRACE")
-
-        if self.current_token is not None and self.current_token.token_type == "ELSE":
-            self.instructions.append(self.current_token)
-            self.match("ELSE")
-            temp_token = Token("BEGINELSE", "begin_else", self.current_token.line)
-            self.instructions.append(temp_token)
-            self.match("LBRACE")
-            self.conditional_scope()
-            temp_token = Token("ENDELSE", "end_else", self.current_token.line)
-            self.instructions.append(temp_token)
-            self.match("RBRACE")
-
-    def if_statement_while(self):
-        self.instructions.append(self.current_token)
-        self.match("IF")
-        self.instructions.append(self.current_token)
-        self.match("LPAREN")
-        expression_type = self.boolean_expression()
-        if expression_type != "BOOL":
-            raise SemanticError(
-                f"Type mismatch: Cannot use {expression_type} in IF statement at line {self.current_token.line}"
+        self.match(TokenKind.RPAREN)
+        self.match(TokenKind.LBRACE)
+        body = self.conditional_scope()
+        end_line = self.match(TokenKind.RBRACE).line
+
+        orelse = None
+        else_line = None
+        if self.at(TokenKind.ELSE):
+            else_line = self.match(TokenKind.ELSE).line
+            self.match(TokenKind.LBRACE)
+            orelse = self.conditional_scope()
+            end_line = self.match(TokenKind.RBRACE).line
+
+        return If(condition, body, orelse, line, else_line, end_line)
+
+    def conditional_scope(self) -> list[Statement]:
+        self.open_scope()
+        body = self.statement_list(self.context, CONDITIONAL_END)
+        self.close_scope()
+
+        return body
+
+    def while_loop(self) -> While:
+        line = self.current_token.line
+        self.match(TokenKind.WHILE)
+        self.match(TokenKind.LPAREN)
+        condition = self.expression()
+        if condition.type != "BOOL":
+            self.semantic_error(
+                f"Type mismatch: Cannot use {condition.type} in WHILE statement at line {line}",
+                line,
+                "BOOL",
+                condition.type,
             )
-        self.instructions.append(self.current_token)
-        self.match("RPAREN")
-        temp_token = Token("BEGINIF", "begin_if", self.current_token.line)
-        self.instructions.append(temp_token)
-        self.match("LBRACE")
-        self.conditional_scope_while()
-        temp_token = Token("ENDIF", "end_if", self.current_token.line)
-        self.instructions.append(temp_token)
-        self.match("RBRACE")
-
-        if self.current_token is not None and self.current_token.token_type == "ELSE":
-            self.instructions.append(self.current_token)
-            self.match("ELSE")
-            temp_token = Token("BEGINELSE", "begin_else", self.current_token.line)
-            self.instructions.append(temp_token)
-            self.match("LBRACE")
-            self.conditional_scope_while()
-            temp_token = Token("ENDELSE", "end_else", self.current_token.line)
-            self.instructions.append(temp_token)
-            self.match("RBRACE")
-
-    def conditional_scope(self):
-        self.current_scope += 1
-        self.scopes.insert(self.current_scope, {})
-
-        while (
-            self.current_token.token_type != "RBRACE"
-            and self.current_token.token_type != "ELSE"
-        ):
-            self.start_of_program()
-
-        self.scopes.pop(self.current_scope)
-        self.current_scope -= 1
-
-    def conditional_scope_while(self):
-        self.current_scope += 1
-        self.scopes.insert(self.current_scope, {})
-
-        while (
-            self.current_token.token_type != "RBRACE"
-            and self.current_token.token_type != "ELSE"
-        ):
-            self.start_of_while()
-
-        self.scopes.pop(self.current_scope)
-        self.current_scope -= 1
-
-    def while_loop(self):
-        self.instructions.append(self.current_token)
-        self.match("WHILE")
-        self.instructions.append(self.current_token)
-        self.match("LPAREN")
-        expression_type = self.boolean_expression()
-        if expression_type != "BOOL":
-            raise SemanticError(
-                f"Type mismatch: Cannot use {expression_type} in WHILE statement at line {self.current_token.line}"
-            )
-        self.instructions.append(self.current_token)
-        self.match("RPAREN")
-        temp_token = Token("BEGINLOOP", "begin_loop", self.current_token.line)
-        self.instructions.append(temp_token)
-        self.match("LBRACE")
-        self.loop_scope()
-        temp_token = Token("ENDLOOP", "end_loop", self.current_token.line)
-        self.instructions.append(temp_token)
-        self.match("RBRACE")
-
-    def break_statement(self):
-        self.instructions.append(self.current_token)
-        self.match("BREAK")
-        self.match("SEMICOLON")
-
-    def continue_statement(self):
-        self.instructions.append(self.current_token)
-        self.match("CONTINUE")
-        self.match("SEMICOLON")
-
-    def loop_scope(self):
-        self.current_scope += 1
-        self.scopes.insert(self.current_scope, {})
-
-        while self.current_token.token_type != "RBRACE":
-            self.start_of_while()
-
-        self.scopes.pop(self.current_scope)
-        self.current_scope -= 1
+        self.match(TokenKind.RPAREN)
+        self.match(TokenKind.LBRACE)
+        body = self.loop_scope()
+        end_line = self.match(TokenKind.RBRACE).line
+
+        return While(condition, body, line, end_line)
+
+    def break_statement(self) -> Break:
+        line = self.current_token.line
+        self.match(TokenKind.BREAK)
+        self.match(TokenKind.SEMICOLON)
+
+        return Break(line)
+
+    def continue_statement(self) -> Continue:
+        line = self.current_token.line
+        self.match(TokenKind.CONTINUE)
+        self.match(TokenKind.SEMICOLON)
+
+        return Continue(line)
+
+    def loop_scope(self) -> list[Statement]:
+        self.open_scope()
+        body = self.statement_list(IN_LOOP, BLOCK_END)
+        self.close_scope()
+
+        return body
 
     def identifier(self):
-        self.match("IDENTIFIER")
+        self.match(TokenKind.IDENTIFIER)
 
     def number(self):
-        self.match("INTEGER")
+        self.match(TokenKind.INTEGER)
 
     def boolean(self):
-        self.match("TRUE" if self.current_token.token_type == "TRUE" else "FALSE")
+        self.match(TokenKind.TRUE if self.at(TokenKind.TRUE) else TokenKind.FALSE)
 
-    def tipo(self):
-        self.match("INT" if self.current_token.token_type == "INT" else "BOOL")
+    def tipo(self) -> Token:
+        return self.match(TokenKind.INT if self.at(TokenKind.INT) else TokenKind.BOOL)
 
     def consume_token(self):
         self.index += 1
-        if self.index < len(self.tokens):
-            self.current_token = self.tokens[self.index]
-        else:
-            self.current_token = None
-
-    def match(self, expected_token):
-        if self.current_token:
-            if self.current_token.token_type == expected_token:
-                self.consume_token()
-            else:
-                raise SyntaxError(
-                    f"Expected {expected_token}, found {self.current_token} at line {self.current_token.line}"
-                )
-        else:
-            raise SyntaxError(
-                f"Expected {expected_token}, found EOF at line {self.tokens[-1].line}"
+        self.current_token = self.tokens.advance()
+
+    def at(self, kind: int) -> bool:
+        return self.current_token is not None and self.current_token.kind == kind
+
+    def lookahead(self) -> Optional[int]:
+        next_token = self.tokens.peek(1)
+        return next_token.kind if next_token is not None else None
+
+    def match(self, expected_token: int) -> Token:
+        token = self.current_token
+        if token is None:
+            self.unexpected_eof(KIND_NAMES[expected_token])
+        if token.kind != expected_token:
+            raise ParseError(
+                f"Expected {KIND_NAMES[expected_token]}, found {token} at line {token.line}",
+                token.line,
+                KIND_NAMES[expected_token],
+                KIND_NAMES[token.kind],
             )
 
+        self.consume_token()
+        return token
+
+    def unexpected_eof(self, expected: str):
+        line = self.tokens.last.line
+        raise ParseError(f"Expected {expected}, found EOF at line {line}", line, expected, "EOF")
+
+    def open_scope(self):
+        self.scopes.push()
+        self.current_scope = self.scopes.depth
+
+    def close_scope(self):
+        self.scopes.pop()
+        self.current_scope = self.scopes.depth
+
+    def find_declaration(self, variable_token: Token) -> Optional[Dict[str, Any]]:
+        return self.scopes.lookup(variable_token.symbol_id)
+
+    def declare(
+        self,
+        variable_token: Token,
+        variable_type: Optional[Type],
+        parameters: Optional[list[Type]] = None,
+    ):
+        declaration = {
+            "token": variable_token,
+            "variable_type": variable_type,
+            "scope": self.current_scope,
+        }
+        if parameters is not None:
+            declaration["parameters"] = parameters
+        self.scopes.declare(variable_token.symbol_id, declaration)
+
+        symbol = self.symbol_table[variable_token.symbol_id]
+        symbol.variable_type = variable_type
+        symbol.scope = self.current_scope
+
     def get_variable_type(self, variable_token: Token) -> Type:
-        for scope in self.scopes:
-            for token in scope.keys():
-                if token.value == variable_token.value:
-                    return scope[token]["variable_type"]
+        declaration = self.find_declaration(variable_token)
+        if declaration is not None:
+            return declaration["variable_type"]
 
-        raise SemanticError(
-            f"Variable '{variable_token.value}' used before declaration at line {variable_token.line}"
+        self.semantic_error(
+            f"Variable '{variable_token.value}' used before declaration at line {variable_token.line}",
+            variable_token.line,
         )
+        return ERROR_TYPE
 
-    @staticmethod
-    def check_types(left_type: Type, right_type: Type):
+    def check_types(self, left_type: Type, right_type: Type, line: int):
         if left_type == "INT" and right_type != "INT":
-            raise SemanticError(
-                f"Type mismatch: Cannot assign {right_type} to INT variable"
+            self.semantic_error(
+                f"Type mismatch: Cannot assign {right_type} to INT variable", line, left_type, right_type
             )
         elif left_type == "BOOL" and right_type != "BOOL":
-            raise SemanticError(
-                f"Type mismatch: Cannot assign {right_type} to BOOL variable"
+            self.semantic_error(
+                f"Type mismatch: Cannot assign {right_type} to BOOL variable", line, left_type, right_type
             )
 
+    def semantic_error(
+        self, message: str, line: int, expected: Optional[Type] = None, found: Optional[Type] = None
+    ):
+        if not self.recover:
+            raise SemanticError(message)
+
+        # an unresolved name was reported where it appeared, don't report everything using it
+        if ERROR_TYPE not in (expected, found):
+            self.diagnostics.append(Diagnostic("semantic", line, expected, found, message))
+
     def error(self):
-        raise SyntaxError(
-            f"Syntax error at line {self.current_token.line} on token {self.current_token}"
+        raise ParseError(
+            f"Syntax error at line {self.current_token.line} on token {self.current_token}",
+            self.current_token.line,
+            None,
+            KIND_NAMES[self.current_token.kind],
         )
@@ -0,0 +1,126 @@
+from heapq import heappop, heappush
+from typing import Optional, Union
+
+from cfg import Procedure, join_procedures, split_procedures, temporary_liveness, uses
+from ir import Op, Quad, Register, SpillSlot, Temp
+
+
+def live_intervals(procedure: Procedure) -> dict[Temp, list[int]]:
+    """
+    First and last position, in the order of the blocks, where every temporary is live.
+    """
+    live_in, live_out = temporary_liveness(procedure.blocks)
+    intervals: dict[Temp, list[int]] = {}
+
+    def extend(temporary: Temp, position: int):
+        interval = intervals.get(temporary)
+        if interval is None:
+            intervals[temporary] = [position, position]
+        elif position < interval[0]:
+            interval[0] = position
+        elif position > interval[1]:
+            interval[1] = position
+
+    position = 0
+    for block in procedure.blocks:
+        block_start = position
+        for quad in block.quads:
+            for operand in uses(quad):
+                if isinstance(operand, Temp):
+                    extend(operand, position)
+            if isinstance(quad.dest, Temp):
+                extend(quad.dest, position)
+            position += 1
+
+        for temporary in live_in[block.index]:
+            extend(temporary, block_start)
+        for temporary in live_out[block.index]:
+            extend(temporary, position - 1)
+
+    return intervals
+
+
+def linear_scan(
+    intervals: dict[Temp, list[int]], registers: Optional[int] = None
+) -> dict[Temp, Union[int, SpillSlot]]:
+    """
+    Give every temporary the lowest register free over its interval. A temporary read by an instruction
+    frees its register for the result of that same instruction. With a limited number of registers,
+    the interval that ends last is spilled when none is free.
+    """
+    locations: dict[Temp, Union[int, SpillSlot]] = {}
+    free: list[int] = list(range(registers)) if registers is not None else []
+    used = 0
+    spills = 0
+    # (end, order, temporary) of the temporaries holding a register
+    active: list[tuple[int, int, Temp]] = []
+
+    ordered = sorted(intervals.items(), key=lambda item: item[1][0])
+    for order, (temporary, (start, end)) in enumerate(ordered):
+        while active and active[0][0] <= start:
+            heappush(free, locations[heappop(active)[2]])
+
+        if free:
+            register = heappop(free)
+        elif registers is None:
+            register = used
+            used += 1
+        else:
+            furthest = max(active, default=None)
+            if furthest is None or furthest[0] <= end:
+                locations[temporary] = SpillSlot(spills)
+                spills += 1
+                continue
+
+            active.remove(furthest)
+            register = locations[furthest[2]]
+            locations[furthest[2]] = SpillSlot(spills)
+            spills += 1
+            active.sort()
+
+        locations[temporary] = register
+        heappush(active, (end, order, temporary))
+
+    return locations
+
+
+def rename(quad: Quad, locations: dict):
+    get = locations.get
+    quad.dest = get(quad.dest, quad.dest)
+    for field in ("arg1", "arg2"):
+        value = getattr(quad, field)
+        if isinstance(value, tuple):
+            setattr(quad, field, tuple(get(operand, operand) for operand in value))
+        else:
+            setattr(quad, field, get(value, value))
+
+
+def is_self_copy(quad: Quad) -> bool:
+    return quad.op == Op.COPY and quad.dest is quad.arg1 and isinstance(quad.dest, (Temp, Register))
+
+
+def allocate(code: list[Quad], registers: Optional[int] = None) -> list[Quad]:
+    """
+    Renumber the temporaries of every procedure so that a number is reused as soon as its temporary is dead,
+    the temporaries that share a number becoming a single Temp. With a number of registers, temporaries
+    become registers r0 to r{registers - 1} instead, and the ones that don't fit get spill slots s0, s1, ...
+    """
+    machine_registers = [Register(index) for index in range(registers or 0)]
+    procedures = split_procedures(code)
+    for procedure in procedures:
+        locations = linear_scan(live_intervals(procedure), registers)
+        if registers is None:
+            renumbered: dict[int, Temp] = {}
+            operands = {
+                temporary: renumbered.setdefault(index, Temp(index)) for temporary, index in locations.items()
+            }
+        else:
+            operands = {
+                temporary: location if isinstance(location, SpillSlot) else machine_registers[location]
+                for temporary, location in locations.items()
+            }
+        for quad in procedure.quads:
+            rename(quad, operands)
+
+    # a copy between temporaries that ended up in the same place does nothing
+    return [quad for quad in join_procedures(procedures) if not is_self_copy(quad)]
@@ -0,0 +1,42 @@
+from typing import Any, Dict, Hashable, Optional
+
+
+class ScopeStack:
+    """
+    Scoped symbol table. Every name maps to a stack of bindings and every open scope keeps the names it declared,
+    so lookup, declaration and closing a scope don't depend on how many symbols are declared.
+    """
+
+    def __init__(self):
+        self.bindings: Dict[Hashable, list[Dict[str, Any]]] = {}
+        self.declared: list[list[Hashable]] = []
+
+    @property
+    def depth(self) -> int:
+        return len(self.declared) - 1
+
+    def push(self):
+        self.declared.append([])
+
+    def pop(self):
+        bindings = self.bindings
+        for name in self.declared.pop():
+            stack = bindings[name]
+            stack.pop()
+            if not stack:
+                del bindings[name]
+
+    def declare(self, name: Hashable, binding: Dict[str, Any]):
+        stack = self.bindings.get(name)
+        if stack is None:
+            self.bindings[name] = [binding]
+        else:
+            stack.append(binding)
+        self.declared[-1].append(name)
+
+    def lookup(self, name: Hashable) -> Optional[Dict[str, Any]]:
+        stack = self.bindings.get(name)
+        return stack[-1] if stack else None
+
+    def __contains__(self, name: Hashable) -> bool:
+        return name in self.bindings
@@ -0,0 +1,122 @@
+import os
+from abc import ABC, abstractmethod
+from collections import abc
+from typing import Generator, TextIO, Union
+
+
+class OutputSink(ABC):
+    """
+    Destination of the generated code. Text is collected and handed to emit() in batches of about
+    buffer_size characters, so writing many short lines costs a few large writes.
+    """
+
+    def __init__(self, buffer_size: int = 1 << 16):
+        self.buffer_size = buffer_size
+        self.buffer: list[str] = []
+        self.buffered = 0
+
+    def write(self, text: str):
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        if self.buffer:
+            self.emit("".join(self.buffer))
+            self.buffer.clear()
+            self.buffered = 0
+
+    @abstractmethod
+    def emit(self, text: str):
+        pass
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self) -> "OutputSink":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class FileSink(OutputSink):
+    """
+    Writes to a file, created or truncated when the sink is opened.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike], buffer_size: int = 1 << 16):
+        super().__init__(buffer_size)
+        self.file = open(path, "w")
+
+    def emit(self, text: str):
+        self.file.write(text)
+
+    def close(self):
+        super().close()
+        self.file.close()
+
+
+class StreamSink(OutputSink):
+    """
+    Writes to an open text stream such as an io.StringIO or sys.stdout, which is left open.
+    """
+
+    def __init__(self, stream: TextIO, buffer_size: int = 1 << 16):
+        super().__init__(buffer_size)
+        self.stream = stream
+
+    def emit(self, text: str):
+        self.stream.write(text)
+
+    def close(self):
+        super().close()
+        self.stream.flush()
+
+
+class LineSink(OutputSink):
+    """
+    Sends every line, without its line break, to a generator that is already started.
+    """
+
+    def __init__(self, consumer: Generator[None, str, None]):
+        super().__init__(0)
+        self.consumer = consumer
+        self.partial = ""
+
+    def emit(self, text: str):
+        lines = (self.partial + text).split("\n")
+        self.partial = lines.pop()
+        for line in lines:
+            self.consumer.send(line)
+
+    def close(self):
+        super().close()
+        if self.partial:
+            self.consumer.send(self.partial)
+            self.partial = ""
+
+
+Target = Union[str, os.PathLike, TextIO, Generator[None, str, None], OutputSink]
+
+
+def open_sink(target: Target) -> OutputSink:
+    """
+    Sink for a file path, a text stream, a started generator or a sink, which is returned as it is.
+    """
+    if isinstance(target, OutputSink):
+        return target
+    elif isinstance(target, (str, os.PathLike)):
+        return FileSink(target)
+    elif isinstance(target, abc.Generator):
+        return LineSink(target)
+    elif hasattr(target, "write"):
+        return StreamSink(target)
+
+    raise TypeError(f"Cannot write the generated code to {target!r}")
+
@@ -0,0 +1,329 @@
+from typing import Optional, Union
+
+from cfg import JUMPS, BasicBlock, DominatorTree, Procedure, dominator_tree, liveness, substitute, uses
+from ir import Op, Quad, Temp, Var
+
+
+class Version:
+    """
+    Value of a variable or temporary in SSA form, assigned by a single instruction. The value a variable
+    has when the procedure starts is version 0, copied from the Var by the first instructions, when the
+    procedure reads it; otherwise it is the Var itself, which nothing assigns before the procedure returns.
+    """
+
+    __slots__ = ("original", "number")
+
+    def __init__(self, original: Union[Var, Temp], number: int):
+        self.original = original
+        self.number = number
+
+    def __str__(self):
+        return f"{self.original}.{self.number}"
+
+    def __repr__(self):
+        return f"Version({self})"
+
+
+Name = Union[Var, Temp, Version]
+
+
+def dominance_frontiers(blocks: list[BasicBlock], dominators: DominatorTree) -> list[set[int]]:
+    """
+    Blocks where the dominance of every block ends, found from the join points as in Cooper, Harvey and
+    Kennedy.
+    """
+    frontiers: list[set[int]] = [set() for _ in blocks]
+    parents = dominators.parents
+    for block in blocks:
+        if len(block.predecessors) < 2 or not dominators.reaches(block):
+            continue
+        for predecessor in block.predecessors:
+            runner = predecessor.index
+            while runner is not None and runner != parents[block.index] and dominators.reaches(blocks[runner]):
+                frontiers[runner].add(block.index)
+                runner = parents[runner]
+    return frontiers
+
+
+def promoted_variables(procedure: Procedure) -> list[Var]:
+    """
+    Variables that can be put in SSA form. A call can read or assign any variable, so none of them is in
+    a procedure that calls another.
+    """
+    variables: dict[Var, None] = {}
+    for quad in procedure.quads:
+        if quad.op == Op.CALL:
+            return []
+        for operand in (quad.dest, *uses(quad)):
+            if isinstance(operand, Var):
+                variables[operand] = None
+    return list(variables)
+
+
+def insert_before_jump(block: BasicBlock, quads: list[Quad]):
+    if block.quads and block.quads[-1].op in JUMPS:
+        block.quads[-1:-1] = quads
+    else:
+        block.quads.extend(quads)
+
+
+def to_ssa(procedure: Procedure) -> list[Var]:
+    """
+    Put the temporaries of the procedure, and its variables when it calls nothing, in SSA form: phi
+    instructions are placed where the dominance of an assignment ends and the name is still live, and every
+    assignment gets a new Version. The procedure starts copying every variable it reads before assigning to
+    its version 0, and a function or procedure copies the last version of each variable back to it before
+    returning, so the Var itself is only assigned at the end. Returns the promoted variables.
+
+    The operands of a phi follow block.predecessors, so the blocks must not be rebuilt before from_ssa.
+    Every block must be reached from the first one, since the others are not renamed.
+    """
+    variables = promoted_variables(procedure)
+    if procedure.blocks and variables:
+        # a variable assigned before it is read keeps the Var as its first value, never read but by the phis
+        # of the paths that don't assign it, and the copies back to the Var itself
+        entry = liveness(procedure.blocks, set(variables).__contains__)[0][0]
+    else:
+        entry = set()
+    entries = [Quad(Op.COPY, variable, variable) for variable in variables if variable in entry]
+    if procedure.blocks and entries:
+        procedure.blocks[0].quads[0:0] = entries
+        if procedure.blocks[0].predecessors:
+            # the first block is the target of a jump: the copies get a block of their own, for the phi
+            # operands of the values the procedure starts with
+            procedure.rebuild()
+
+    blocks = procedure.blocks
+    # the caller sees the variables: they are copied back when the procedure returns
+    returns = []
+    if procedure.header is not None:
+        for block in blocks:
+            if not block.successors:
+                copies = [Quad(Op.COPY, variable, variable) for variable in variables]
+                insert_before_jump(block, copies)
+                returns.extend(copies)
+
+    dominators = dominator_tree(blocks)
+    frontiers = dominance_frontiers(blocks, dominators)
+    renamed = set(variables)
+
+    def is_name(operand) -> bool:
+        return isinstance(operand, Temp) or operand in renamed
+
+    live_in = liveness(blocks, is_name)[0]
+    # name -> the blocks assigning it
+    assignments: dict[Name, list[int]] = {}
+    for block in blocks:
+        for quad in block.quads:
+            if is_name(quad.dest):
+                assignments.setdefault(quad.dest, []).append(block.index)
+
+    phis: list[list[Quad]] = [[] for _ in blocks]
+    for name, sites in assignments.items():
+        placed = set()
+        pending = list(sites)
+        while pending:
+            for index in frontiers[pending.pop()]:
+                if index not in placed and name in live_in[index]:
+                    placed.add(index)
+                    phis[index].append(Quad(Op.PHI, name, [name] * len(blocks[index].predecessors)))
+                    pending.append(index)
+
+    for block in blocks:
+        if phis[block.index]:
+            start = 1 if block.label is not None else 0
+            block.quads[start:start] = phis[block.index]
+
+    rename(procedure, dominators, variables, entries, returns)
+    return variables
+
+
+def rename(
+    procedure: Procedure, dominators: DominatorTree, variables: list[Var], entries: list[Quad], returns: list[Quad]
+):
+    """
+    Give every assignment a new version and make every instruction read the version visible there, walking
+    the dominator tree. The copies in entries assign version 0, and the ones in returns keep assigning the
+    variable itself.
+    """
+    blocks = procedure.blocks
+    renamed = set(variables)
+    # name -> its versions in the blocks dominating the current one, the last one being visible
+    stacks: dict[Name, list[Name]] = {variable: [variable] for variable in variables}
+    numbers: dict[str, int] = {}
+    kept = set(map(id, returns))
+    initial = set(map(id, entries))
+
+    def current(operand):
+        stack = stacks.get(operand)
+        return stack[-1] if stack else operand
+
+    pending: list = [blocks[0]] if blocks else []
+    while pending:
+        block = pending.pop()
+        if isinstance(block, list):
+            # leaving a block: forget the versions it assigned
+            for name in block:
+                stacks[name].pop()
+            continue
+
+        assigned = []
+        for quad in block.quads:
+            if quad.op != Op.PHI:
+                substitute(quad, current)
+            dest = quad.dest
+            if (isinstance(dest, Temp) or dest in renamed) and id(quad) not in kept:
+                if id(quad) in initial:
+                    quad.dest = Version(dest, 0)
+                else:
+                    # numbered by printed name, since temporaries of different statements print the same
+                    number = numbers[str(dest)] = numbers.get(str(dest), 0) + 1
+                    quad.dest = Version(dest, number)
+                stacks.setdefault(dest, []).append(quad.dest)
+                assigned.append(dest)
+
+        for successor in block.successors:
+            position = successor.predecessors.index(block)
+            for quad in successor.quads:
+                if quad.op == Op.PHI:
+                    quad.arg1[position] = current(quad.arg1[position])
+
+        pending.append(assigned)
+        pending.extend(blocks[child] for child in reversed(dominators.children[block.index]))
+
+    for quad in procedure.quads:
+        if quad.op == Op.PHI:
+            quad.arg1 = tuple(quad.arg1)
+
+
+def from_ssa(procedure: Procedure, variables: list[Var]):
+    """
+    Take the procedure out of SSA form. Every phi becomes a copy to a new name at the end of each
+    predecessor and a copy from it where the phi was. Then a version takes the name of its variable when
+    their values are never live at the same time, and so do the names connected by a copy, so that most
+    copies copy a name to itself and are dropped. Versions go first: a copy between two variables would
+    otherwise give a version the name of the other variable, and the copies of its phi would read that one
+    on paths where the program never assigned it. The versions left get new temporaries.
+    """
+    blocks = procedure.blocks
+    promoted = set(variables)
+    for block in blocks:
+        phis = [quad for quad in block.quads if quad.op == Op.PHI]
+        if not phis:
+            continue
+
+        copies = []
+        for phi in phis:
+            original = phi.dest.original
+            if original in promoted and original in phi.arg1:
+                # the variable still has its first value on some paths, and every other path assigned it: the
+                # phi moves through the variable, and those paths copy nothing
+                moved = original
+            else:
+                moved = Version(original, 0)
+            for predecessor, operand in zip(block.predecessors, phi.arg1):
+                if operand is not moved:
+                    insert_before_jump(predecessor, [Quad(Op.COPY, moved, operand)])
+            copies.append(Quad(Op.COPY, phi.dest, moved))
+        start = 1 if block.label is not None else 0
+        block.quads = block.quads[:start] + copies + [quad for quad in block.quads[start:] if quad.op != Op.PHI]
+
+    def is_name(operand) -> bool:
+        return isinstance(operand, (Version, Temp)) or operand in promoted
+
+    interference = interference_graph(blocks, is_name)
+
+    parents: dict[Name, Name] = {}
+    members: dict[Name, list[Name]] = {}
+    # class -> the names interfering with any of its members
+    neighbours: dict[Name, set[Name]] = {}
+    # class -> its variable, if any
+    owners: dict[Name, Optional[Var]] = {}
+
+    def find(name: Name) -> Name:
+        if name not in parents:
+            parents[name] = name
+            members[name] = [name]
+            neighbours[name] = set(interference.get(name, ()))
+            owners[name] = name if isinstance(name, Var) else None
+        root = name
+        while parents[root] is not root:
+            root = parents[root]
+        while parents[name] is not root:
+            parents[name], name = root, parents[name]
+        return root
+
+    def coalesce(a: Name, b: Name):
+        a, b = find(a), find(b)
+        if a is b or (owners[a] is not None and owners[b] is not None):
+            return
+        if len(members[a]) < len(members[b]):
+            a, b = b, a
+        conflicts = neighbours[a]
+        if any(member in conflicts for member in members[b]):
+            return
+        parents[b] = a
+        members[a].extend(members.pop(b))
+        if len(conflicts) < len(neighbours[b]):
+            conflicts, neighbours[b] = neighbours[b], conflicts
+        conflicts |= neighbours.pop(b)
+        neighbours[a] = conflicts
+        owners[a] = owners[a] or owners[b]
+
+    for name in list(interference):
+        if isinstance(name, Version) and name.original in promoted:
+            coalesce(name, name.original)
+    for block in blocks:
+        for quad in block.quads:
+            if quad.op == Op.COPY and is_name(quad.dest) and is_name(quad.arg1):
+                coalesce(quad.dest, quad.arg1)
+
+    names: dict[Name, Union[Var, Temp]] = {}
+
+    def final(operand):
+        if not is_name(operand):
+            return operand
+        root = find(operand)
+        name = names.get(root)
+        if name is None:
+            name = names[root] = owners[root] or Temp(0)
+        return name
+
+    for block in blocks:
+        quads = []
+        for quad in block.quads:
+            substitute(quad, final)
+            quad.dest = final(quad.dest)
+            if quad.op != Op.COPY or quad.dest is not quad.arg1:
+                quads.append(quad)
+        block.quads = quads
+    procedure.rebuild()
+
+
+def interference_graph(blocks: list[BasicBlock], is_name) -> dict[Name, set[Name]]:
+    """
+    Names assigned while another one is live, in both directions. A copy doesn't make its two names
+    interfere, since they hold the same value. The names live when the procedure starts were all assigned
+    before it, so they interfere with each other. Every name is in the graph.
+    """
+    live_in, live_out = liveness(blocks, is_name)
+    graph: dict[Name, set[Name]] = {}
+    if blocks:
+        for name in live_in[0]:
+            graph[name] = live_in[0] - {name}
+    for block in blocks:
+        live = set(live_out[block.index])
+        for quad in reversed(block.quads):
+            dest = quad.dest
+            if is_name(dest):
+                neighbours = graph.setdefault(dest, set())
+                for other in live:
+                    if other is not dest and not (quad.op == Op.COPY and other is quad.arg1):
+                        neighbours.add(other)
+                        graph.setdefault(other, set()).add(dest)
+                live.discard(dest)
+            for operand in uses(quad):
+                if is_name(operand):
+                    live.add(operand)
+                    graph.setdefault(operand, set())
+    return graph
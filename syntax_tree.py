@@ -0,0 +1,262 @@
+from typing import Iterator, Optional, Union
+
+Type = str  # "INT" or "BOOL"
+
+
+class Node:
+    __slots__ = ("line",)
+
+    def __repr__(self):
+        fields = ", ".join(
+            f"{name}={getattr(self, name)!r}"
+            for cls in reversed(type(self).__mro__)
+            for name in getattr(cls, "__slots__", ())
+            if not name.endswith("line")
+        )
+        return f"{type(self).__name__}({fields})"
+
+
+def walk(node: Node) -> Iterator[Node]:
+    """
+    Yield the node and every node below it, without recursion.
+    """
+    pending = [node]
+    while pending:
+        node = pending.pop()
+        yield node
+        for cls in type(node).__mro__:
+            for name in getattr(cls, "__slots__", ()):
+                value = getattr(node, name, None)
+                if isinstance(value, Node):
+                    pending.append(value)
+                elif isinstance(value, list):
+                    pending.extend(item for item in value if isinstance(item, Node))
+
+
+def shift_lines(node: Node, delta: int):
+    """
+    Move the node and every node below it delta lines, with the lines of their else and closing brace.
+    """
+    for descendant in walk(node):
+        for cls in type(descendant).__mro__:
+            for name in getattr(cls, "__slots__", ()):
+                line = getattr(descendant, name, None) if name.endswith("line") else None
+                if line is not None:
+                    setattr(descendant, name, line + delta)
+
+
+# expressions
+
+
+class Expression(Node):
+    __slots__ = ("type",)
+
+
+class Literal(Expression):
+    __slots__ = ("value",)
+
+    def __init__(self, value: Union[int, bool], type: Type, line: int):
+        self.value = value
+        self.type = type
+        self.line = line
+
+
+class Name(Expression):
+    __slots__ = ("name", "symbol_id")
+
+    def __init__(self, name: str, symbol_id: int, type: Type, line: int):
+        self.name = name
+        self.symbol_id = symbol_id
+        self.type = type
+        self.line = line
+
+
+class BinOp(Expression):
+    __slots__ = ("operator", "left", "right")
+
+    def __init__(self, operator: str, left: Expression, right: Expression, type: Type, line: int):
+        self.operator = operator
+        self.left = left
+        self.right = right
+        self.type = type
+        self.line = line
+
+
+class UnaryOp(Expression):
+    __slots__ = ("operator", "operand")
+
+    def __init__(self, operator: str, operand: Expression, type: Type, line: int):
+        self.operator = operator
+        self.operand = operand
+        self.type = type
+        self.line = line
+
+
+class Call(Expression):
+    __slots__ = ("name", "symbol_id", "arguments")
+
+    def __init__(self, name: str, symbol_id: int, arguments: list[Expression], type: Optional[Type], line: int):
+        self.name = name
+        self.symbol_id = symbol_id
+        self.arguments = arguments
+        self.type = type
+        self.line = line
+
+
+# statements
+
+
+class Statement(Node):
+    __slots__ = ()
+
+
+class VarDecl(Statement):
+    __slots__ = ("name", "symbol_id", "variable_type", "value")
+
+    def __init__(self, name: str, symbol_id: int, variable_type: Type, value: Optional[Expression], line: int):
+        self.name = name
+        self.symbol_id = symbol_id
+        self.variable_type = variable_type
+        self.value = value
+        self.line = line
+
+
+class Assign(Statement):
+    __slots__ = ("name", "symbol_id", "value")
+
+    def __init__(self, name: str, symbol_id: int, value: Expression, line: int):
+        self.name = name
+        self.symbol_id = symbol_id
+        self.value = value
+        self.line = line
+
+
+class ExprStatement(Statement):
+    __slots__ = ("expression",)
+
+    def __init__(self, expression: Expression, line: int):
+        self.expression = expression
+        self.line = line
+
+
+class Print(Statement):
+    __slots__ = ("arguments",)
+
+    def __init__(self, arguments: list[Expression], line: int):
+        self.arguments = arguments
+        self.line = line
+
+
+class Return(Statement):
+    __slots__ = ("value",)
+
+    def __init__(self, value: Expression, line: int):
+        self.value = value
+        self.line = line
+
+
+class Break(Statement):
+    __slots__ = ()
+
+    def __init__(self, line: int):
+        self.line = line
+
+
+class Continue(Statement):
+    __slots__ = ()
+
+    def __init__(self, line: int):
+        self.line = line
+
+
+class If(Statement):
+    __slots__ = ("condition", "body", "orelse", "else_line", "end_line")
+
+    def __init__(
+        self,
+        condition: Expression,
+        body: list[Statement],
+        orelse: Optional[list[Statement]],
+        line: int,
+        else_line: Optional[int],
+        end_line: int,
+    ):
+        self.condition = condition
+        self.body = body
+        self.orelse = orelse
+        self.line = line
+        # lines of the else and of the closing brace, for the instruction listing
+        self.else_line = else_line
+        self.end_line = end_line
+
+
+class While(Statement):
+    __slots__ = ("condition", "body", "end_line")
+
+    def __init__(self, condition: Expression, body: list[Statement], line: int, end_line: int):
+        self.condition = condition
+        self.body = body
+        self.line = line
+        self.end_line = end_line
+
+
+class Param(Node):
+    __slots__ = ("name", "symbol_id", "variable_type")
+
+    def __init__(self, name: str, symbol_id: int, variable_type: Type, line: int):
+        self.name = name
+        self.symbol_id = symbol_id
+        self.variable_type = variable_type
+        self.line = line
+
+
+class FunctionDecl(Statement):
+    __slots__ = ("name", "symbol_id", "parameters", "return_type", "body", "return_statement", "end_line")
+
+    def __init__(
+        self,
+        name: str,
+        symbol_id: int,
+        parameters: list[Param],
+        return_type: Type,
+        body: list[Statement],
+        return_statement: Return,
+        line: int,
+        end_line: int,
+    ):
+        self.name = name
+        self.symbol_id = symbol_id
+        self.parameters = parameters
+        self.return_type = return_type
+        self.body = body
+        self.return_statement = return_statement
+        self.line = line
+        self.end_line = end_line
+
+
+class ProcedureDecl(Statement):
+    __slots__ = ("name", "symbol_id", "parameters", "body", "end_line")
+
+    def __init__(
+        self,
+        name: str,
+        symbol_id: int,
+        parameters: list[Param],
+        body: list[Statement],
+        line: int,
+        end_line: int,
+    ):
+        self.name = name
+        self.symbol_id = symbol_id
+        self.parameters = parameters
+        self.body = body
+        self.line = line
+        self.end_line = end_line
+
+
+class Program(Node):
+    __slots__ = ("body",)
+
+    def __init__(self, body: list[Statement], line: int = 1):
+        self.body = body
+        self.line = line
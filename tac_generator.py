@@ -1,475 +1,379 @@
-from lexer import Token
+from itertools import groupby
+from operator import attrgetter
+from typing import Iterator, Optional
+
+from ir import BINARY_OPERATORS, Const, Label, Op, Operand, Quad, Temp, Var, render
+from lexer import KEYWORDS, Token, TokenKind
+from parser import PRECEDENCE
+from sinks import FileSink, OutputSink
+from syntax_tree import (
+    Assign,
+    BinOp,
+    Break,
+    Call,
+    Continue,
+    Expression,
+    ExprStatement,
+    FunctionDecl,
+    If,
+    Literal,
+    Name,
+    Print,
+    ProcedureDecl,
+    Program,
+    Return,
+    Statement,
+    UnaryOp,
+    VarDecl,
+    While,
+)
+
+# text of the tokens of the instruction listing, other than names and literals
+TOKEN_TEXTS: dict[int, str] = {
+    **{kind: word for word, kind in KEYWORDS.items()},
+    TokenKind.EQUAL: "==",
+    TokenKind.DIFFERENT: "!=",
+    TokenKind.GREATER_OR_EQUAL: ">=",
+    TokenKind.LESS_OR_EQUAL: "<=",
+    TokenKind.GREATER: ">",
+    TokenKind.LESS: "<",
+    TokenKind.PLUS: "+",
+    TokenKind.MINUS: "-",
+    TokenKind.MULTIPLY: "*",
+    TokenKind.DIVIDE: "/",
+    TokenKind.MODULE: "%",
+    TokenKind.ASSIGN: "=",
+    TokenKind.COLON: ",",
+    TokenKind.LPAREN: "(",
+    TokenKind.RPAREN: ")",
+    TokenKind.BEGINIF: "begin_if",
+    TokenKind.ENDIF: "end_if",
+    TokenKind.BEGINELSE: "begin_else",
+    TokenKind.ENDELSE: "end_else",
+    TokenKind.BEGINLOOP: "begin_loop",
+    TokenKind.ENDLOOP: "end_loop",
+    TokenKind.BEGINFUNCTION: "begin_function",
+    TokenKind.ENDFUNCTION: "end_function",
+    TokenKind.BEGINPROCEDURE: "begin_procedure",
+    TokenKind.ENDPROCEDURE: "end_procedure",
+}
+OPERATOR_KINDS: dict[str, int] = {text: kind for kind, text in TOKEN_TEXTS.items() if kind in PRECEDENCE}
+
+
+def source_tokens(tree: Program) -> Iterator[Token]:
+    """
+    Tokens of the program for the instruction listing, rebuilt from the tree: names, keywords, operators
+    and the BEGIN/END markers of the blocks, without types, arrows and semicolons. Parentheses are only
+    shown where precedence needs them.
+    """
+
+    def token(kind: int, line: int) -> Token:
+        return Token(kind, TOKEN_TEXTS[kind], line)
+
+    def separated(nodes: list, line: int) -> list:
+        items = []
+        for node in nodes:
+            if items:
+                items.append(token(TokenKind.COLON, line))
+            items.append(node)
+        return items
+
+    def grouped(node: Expression, precedence: int) -> list:
+        if isinstance(node, BinOp) and PRECEDENCE[OPERATOR_KINDS[node.operator]] < precedence:
+            return [token(TokenKind.LPAREN, node.line), node, token(TokenKind.RPAREN, node.line)]
+        return [node]
+
+    # tokens and nodes still to list, the next one last
+    pending: list = list(reversed(tree.body))
+    while pending:
+        node = pending.pop()
+        if isinstance(node, Token):
+            yield node
+            continue
+
+        line = node.line
+        if isinstance(node, Name):
+            yield Token(TokenKind.IDENTIFIER, node.name, line)
+            continue
+        elif isinstance(node, Literal):
+            if isinstance(node.value, bool):
+                yield token(TokenKind.TRUE if node.value else TokenKind.FALSE, line)
+            else:
+                yield Token(TokenKind.INTEGER, str(node.value), line)
+            continue
+
+        if isinstance(node, BinOp):
+            kind = OPERATOR_KINDS[node.operator]
+            precedence = PRECEDENCE[kind]
+            # all operators are left associative
+            items = [*grouped(node.left, precedence), token(kind, line), *grouped(node.right, precedence + 1)]
+        elif isinstance(node, UnaryOp):
+            items = [token(TokenKind.NOT, line), *grouped(node.operand, max(PRECEDENCE.values()) + 1)]
+        elif isinstance(node, Call):
+            items = [
+                Token(TokenKind.IDENTIFIER, node.name, line),
+                token(TokenKind.LPAREN, line),
+                *separated(node.arguments, line),
+                token(TokenKind.RPAREN, line),
+            ]
+        elif isinstance(node, (VarDecl, Assign)):
+            items = [Token(TokenKind.IDENTIFIER, node.name, line)]
+            if node.value is not None:
+                items += [token(TokenKind.ASSIGN, line), node.value]
+        elif isinstance(node, ExprStatement):
+            items = [node.expression]
+        elif isinstance(node, Print):
+            items = [
+                token(TokenKind.PRINT, line),
+                token(TokenKind.LPAREN, line),
+                *separated(node.arguments, line),
+                token(TokenKind.RPAREN, line),
+            ]
+        elif isinstance(node, Return):
+            items = [token(TokenKind.RETURN, line), node.value]
+        elif isinstance(node, Break):
+            items = [token(TokenKind.BREAK, line)]
+        elif isinstance(node, Continue):
+            items = [token(TokenKind.CONTINUE, line)]
+        elif isinstance(node, If):
+            items = [
+                token(TokenKind.IF, line),
+                token(TokenKind.LPAREN, line),
+                node.condition,
+                token(TokenKind.RPAREN, line),
+                token(TokenKind.BEGINIF, line),
+                *node.body,
+            ]
+            if node.orelse is None:
+                items.append(token(TokenKind.ENDIF, node.end_line))
+            else:
+                items += [
+                    token(TokenKind.ENDIF, node.else_line),
+                    token(TokenKind.ELSE, node.else_line),
+                    token(TokenKind.BEGINELSE, node.else_line),
+                    *node.orelse,
+                    token(TokenKind.ENDELSE, node.end_line),
+                ]
+        elif isinstance(node, While):
+            items = [
+                token(TokenKind.WHILE, line),
+                token(TokenKind.LPAREN, line),
+                node.condition,
+                token(TokenKind.RPAREN, line),
+                token(TokenKind.BEGINLOOP, line),
+                *node.body,
+                token(TokenKind.ENDLOOP, node.end_line),
+            ]
+        else:
+            function = isinstance(node, FunctionDecl)
+            parameters = [Token(TokenKind.IDENTIFIER, parameter.name, parameter.line) for parameter in node.parameters]
+            items = [
+                token(TokenKind.FUNCTION if function else TokenKind.PROCEDURE, line),
+                Token(TokenKind.IDENTIFIER, node.name, line),
+                token(TokenKind.LPAREN, line),
+                *separated(parameters, line),
+                token(TokenKind.RPAREN, line),
+                token(TokenKind.BEGINFUNCTION if function else TokenKind.BEGINPROCEDURE, line),
+                *node.body,
+                *([node.return_statement] if function else []),
+                token(TokenKind.ENDFUNCTION if function else TokenKind.ENDPROCEDURE, node.end_line),
+            ]
+        pending.extend(reversed(items))
 
 
 class ThreeAddressCodeGenerator:
     def __init__(self):
-        self.index = 0
-        self.tokens = None
-        self.current_token = None
         self.instructions = []
+        # generated quadruples
+        self.code: list[Quad] = []
+        self.names: dict[str, Var] = {}
+        self.constants: dict[tuple[type, object], Const] = {}
         self.labels = 0
-
-    def extract_instructions(self, tokens: list[Token]):
-        self.tokens = tokens
-        max_line = max(self.tokens, key=lambda x: x.line).line
-        self.current_token = self.tokens[self.index]
-
-        for i in range(1, max_line+1):
-            aux_list = []
-            while self.current_token is not None and self.current_token.line == i:
-                aux_list.append(self.current_token)
-                self.consume_token()
-            if aux_list:
-                self.instructions.append(aux_list)
-
+        self.temporaries = 0
+        # (start label, end label) of the loops enclosing the current statement
+        self.loops = []
+        self.statements = {
+            VarDecl: self.get_declaration,
+            Assign: self.get_attribution,
+            ExprStatement: self.get_expression_statement,
+            Print: self.get_print,
+            Return: self.get_return,
+            Break: self.get_break,
+            Continue: self.get_continue,
+            If: self.get_if,
+            While: self.get_while,
+            FunctionDecl: self.get_function,
+            ProcedureDecl: self.get_function,
+        }
+
+    def extract_instructions(self, tree: Program):
+        # the tokens come in source order, so the tokens of a line are next to each other
+        self.instructions.extend(list(group) for _, group in groupby(source_tokens(tree), key=attrgetter("line")))
         return self.instructions
 
-    def consume_token(self):
-        self.index += 1
-        if self.index < len(self.tokens):
-            self.current_token = self.tokens[self.index]
-        else:
-            self.current_token = None
-
-    def start(self):
-        arq = open("output.txt", 'w')
-        i = 0
-        while i < len(self.instructions):
-            if len(self.instructions[i]) > 1 and self.instructions[i][1].token_type == 'ASSIGN':
-                self.get_attribution(self.instructions[i], arq)
-            elif len(self.instructions[i]) > 1 and self.instructions[i][1].token_type == 'LPAREN' and self.instructions[i][0].token_type == 'IDENTIFIER':
-                self.get_declaration(self.instructions[i], arq)
-            elif len(self.instructions[i]) > 1 and self.instructions[i][0].token_type in ['FUNCTION', 'PROCEDURE']:
-                self.get_function(self.instructions[i], arq)
-            elif self.instructions[i][0].token_type in ['ENDFUNCTION', 'ENDPROCEDURE']:
-                self.get_endfunction(self.instructions[i], arq)
-            elif self.instructions[i][0].token_type == 'RETURN':
-                self.get_return(self.instructions[i], arq)
-            elif self.instructions[i][0].token_type == 'PRINT':
-                self.get_print(self.instructions[i], arq)
-            elif self.instructions[i][0].token_type == 'IF':
-                aux = i
-                else_end = aux
-                while aux < len(self.instructions) and self.instructions[aux][0].token_type != 'ENDIF':
-                    aux = aux + 1
-
-                if len(self.instructions[aux]) > 1 and self.instructions[aux][1].token_type == 'ELSE':
-                    while else_end < len(self.instructions) and self.instructions[else_end][0].token_type != 'ENDELSE':
-                        else_end += 1
-                self.get_if(i, aux, arq)
-                i = else_end
-
-            elif self.instructions[i][0].token_type == 'WHILE':
-                while_scope = 1
-                aux = i
-                while while_scope != 0:
-                    if self.instructions[aux][0].token_type == 'BEGINLOOP':
-                        while_scope += 1
-                    elif self.instructions[aux][0].token_type == 'ENDLOOP':
-                        while_scope -= 1
-                    aux = aux + 1
-                self.get_while(i, aux, arq)
-                i = aux - 1
-
-            elif len(self.instructions[i]) == 1 and self.instructions[i][0].token_type == 'IDENTIFIER':
-                arq.write(f"{self.instructions[i][0].value} = undefined\n")
-
-            i += 1
-
-        arq.close()
-
-    def get_else(self, arq):
-        arq.write("entrei no if-else\n")
-
-    def get_while(self, instruction_begin, instruction_end, arq):
-        local_label = 0
-        params = []
-        i = 0
-
-        while i < len(self.instructions[instruction_begin]) and self.instructions[instruction_begin][
-            i].token_type != 'BEGINLOOP':
-            if self.instructions[instruction_begin][i].token_type not in ['RPAREN', 'LPAREN', 'WHILE']:
-                params.append(self.instructions[instruction_begin][i].value)
-            i += 1
-
-        params_str = " ".join(params)
-
-        start_while = self.labels  # Salva o valor atual dos rótulos
-        end_while = self.labels + 1
-
-        arq.write(f"\nL{start_while}:\n")
-        arq.write(f"t{local_label} = {params_str}\n")
-        arq.write(f"ifFalse t{local_label} go to L{end_while}\n")
-
-        j = instruction_begin + 1
-        while j < instruction_end:
-            if len(self.instructions[j]) > 1 and self.instructions[j][1].token_type == 'ASSIGN':
-                self.get_attribution(self.instructions[j], arq)
-
-            elif self.instructions[j][0].token_type == 'BREAK':
-                arq.write(f"go to L{end_while}\n")
-
-            elif self.instructions[j][0].token_type == 'CONTINUE':
-                arq.write(f"go to L{start_while}\n")
-
-            elif len(self.instructions[j]) > 1 and self.instructions[j][1].token_type == 'LPAREN' and self.instructions[j][0].token_type == 'IDENTIFIER':
-                self.get_declaration(self.instructions[j], arq)
-
-            elif self.instructions[j][0].token_type == 'PRINT':
-                self.get_print(self.instructions[j], arq)
-
-            elif len(self.instructions[j]) == 1 and self.instructions[j][0].token_type == 'IDENTIFIER':
-                arq.write(f"{self.instructions[j][0].value} = undefined\n")
-
-            elif self.instructions[j][0].token_type == 'IF':
-                aux = j
-                while aux < len(self.instructions) and self.instructions[aux][0].token_type != 'ENDIF':
-                    aux = aux + 1
-                self.get_if_while(j, aux, arq, start_while, end_while)
-                j = aux
-
-            elif self.instructions[j][0].token_type == 'WHILE':
-                while_scope = 1
-                aux = j
-                while while_scope != 0:
-                    if self.instructions[aux][0].token_type == 'BEGINLOOP':
-                        while_scope += 1
-                    elif self.instructions[aux][0].token_type == 'ENDLOOP':
-                        while_scope -= 1
-                    aux = aux + 1
-                self.get_while(j, aux, arq)
-                j = aux - 1
-
-            j += 1
-
-        arq.write(f"go to L{start_while}\n")
-        arq.write(f"L{end_while}:\n\n")
-
-    def get_if_while(self, instruction_begin, instruction_end, arq, start_while, end_while):
-        local_label = 0
-        params = []
-        i = 0
-
-        while i < len(self.instructions[instruction_begin]) and self.instructions[instruction_begin][i].token_type != 'RPAREN':
-            if self.instructions[instruction_begin][i].token_type not in ['RPAREN', 'LPAREN', 'IF']:
-                params.append(self.instructions[instruction_begin][i].value)
-            i += 1
-
-        params_str = " ".join(params)
-
-        end_if = end_while + 1
-
-        arq.write(f"t{local_label} = {params_str}\n")
-        end_else = 0
-
-        if len(self.instructions[instruction_end]) > 1 and self.instructions[instruction_end][1].token_type == 'ELSE':
-            end_else_loop = end_if
-            end_if += 1
-            arq.write(f"ifFalse t{local_label} go to L{end_else_loop}\n")
-
-            end_else = instruction_end
-            while end_else < len(self.instructions) and self.instructions[end_else][0].token_type != 'ENDELSE':
-                end_else += 1
-        else:
-            arq.write(f"ifTrue t{local_label} go to L{end_if}\n")
-            arq.write(f"go to L{start_while}\n")
-            arq.write(f"L{end_if}:\n")
-
-        teste = instruction_begin + 1
-
-        self.labels = end_if + 1
-
-        while teste < instruction_end:
-            if len(self.instructions[teste]) > 1 and self.instructions[teste][1].token_type == 'ASSIGN':
-                self.get_attribution(self.instructions[teste], arq)
-
-            elif len(self.instructions[teste]) > 1 and self.instructions[teste][1].token_type == 'LPAREN' and \
-                    self.instructions[teste][0].token_type == 'IDENTIFIER':
-                self.get_declaration(self.instructions[teste], arq)
-
-            elif self.instructions[teste][0].token_type == 'PRINT':
-                self.get_print(self.instructions[teste], arq)
-
-            elif self.instructions[teste][0].token_type == 'BREAK':
-                arq.write(f"go to L{end_while}\n")
-
-            elif self.instructions[teste][0].token_type == 'CONTINUE':
-                arq.write(f"go to L{start_while}\n")
-
-            elif self.instructions[teste][0].token_type == 'IF':
-                aux = teste
-                while aux < len(self.instructions) and self.instructions[aux][0].token_type != 'ENDIF':
-                    aux = aux + 1
-                self.get_if_while(teste, aux, arq, start_while, end_while)
-
-            elif len(self.instructions[teste]) == 1 and self.instructions[teste][0].token_type == 'IDENTIFIER':
-                arq.write(f"{self.instructions[teste][0].value} = undefined\n")
-
-            elif self.instructions[teste][0].token_type == 'WHILE':
-                while_scope = 1
-                aux = teste
-                while while_scope != 0:
-                    if self.instructions[aux][0].token_type == 'BEGINLOOP':
-                        while_scope += 1
-                    elif self.instructions[aux][0].token_type == 'ENDLOOP':
-                        while_scope -= 1
-                    aux = aux + 1
-                self.get_while(i, aux, arq)
-                teste = aux - 1
-
-            teste += 1
-
-        arq.write(f"go to L{start_while}\n")
-
-        if end_else != 0:
-            if end_else > instruction_end:
-                arq.write(f"L{end_else_loop}:\n")
-
-                teste1 = end_else
-
-                while teste1 <= end_else:
-                    if len(self.instructions[teste1]) > 1 and self.instructions[teste1][1].token_type == 'ASSIGN':
-                        self.get_attribution(self.instructions[teste1], arq)
-
-                    elif len(self.instructions[teste1]) > 1 and self.instructions[teste1][1].token_type == 'LPAREN' and \
-                            self.instructions[teste1][0].token_type == 'IDENTIFIER':
-                        self.get_declaration(self.instructions[teste1], arq)
-
-                    elif self.instructions[teste1][0].token_type == 'PRINT':
-                        self.get_print(self.instructions[teste1], arq)
-
-                    elif len(self.instructions[teste1]) == 1 and self.instructions[teste1][
-                        0].token_type == 'IDENTIFIER':
-                        arq.write(f"{self.instructions[teste1][0].value} = undefined\n")
-
-                    elif self.instructions[teste1][0].token_type == 'WHILE':
-                        while_scope = 1
-                        aux = teste1
-                        while while_scope != 0:
-                            if self.instructions[aux][0].token_type == 'BEGINLOOP':
-                                while_scope += 1
-                            elif self.instructions[aux][0].token_type == 'ENDLOOP':
-                                while_scope -= 1
-                            aux = aux + 1
-                        self.get_while(teste1, aux, arq)
-                        teste1 = aux - 1
-
-                    teste1 += 1
-
-    def get_if(self, instruction_begin, instruction_end, arq):
-        local_label = 0
-        params = []
-        i = 0
-
-        while i < len(self.instructions[instruction_begin]) and self.instructions[instruction_begin][i].token_type != 'RPAREN':
-            if self.instructions[instruction_begin][i].token_type not in ['RPAREN', 'LPAREN', 'IF']:
-                params.append(self.instructions[instruction_begin][i].value)
-            i += 1
-
-        params_str = " ".join(params)
-
-        start_if = self.labels
-        end_if = self.labels - 1
-
-        arq.write(f"\nt{local_label} = {params_str}\n")
-
-        end_else = 0
-
-        self.labels = end_if + 1
-
-        if len(self.instructions[instruction_end]) > 1 and self.instructions[instruction_end][1].token_type == 'ELSE':
-            end_else_loop = self.labels
-            end_if += 1
-            arq.write(f"ifFalse t{local_label} go to L{end_else_loop}\n")
-
-            end_else = instruction_end
-            while end_else < len(self.instructions) and self.instructions[end_else][0].token_type != 'ENDELSE':
-                end_else += 1
+    def start(self, tree: Program, sink: Optional[OutputSink] = None):
+        self.generate(tree)
+        if sink is None:
+            with FileSink("output.txt") as sink:
+                sink.writelines(render(self.code))
         else:
-            arq.write(f"ifFalse t{local_label} go to L{end_if}\n")
-
-        j = instruction_begin
-        while j < instruction_end:
-            if len(self.instructions[j]) > 1 and self.instructions[j][1].token_type == 'ASSIGN':
-                self.get_attribution(self.instructions[j], arq)
-
-            elif len(self.instructions[j]) > 1 and self.instructions[j][1].token_type == 'LPAREN' and self.instructions[j][0].token_type == 'IDENTIFIER':
-                self.get_declaration(self.instructions[j], arq)
-
-            elif self.instructions[j][0].token_type == 'PRINT':
-                self.get_print(self.instructions[j], arq)
-
-            elif len(self.instructions[j]) == 1 and self.instructions[j][0].token_type == 'IDENTIFIER':
-                arq.write(f"{self.instructions[j][0].value} = undefined\n")
-
-            elif self.instructions[j][0].token_type == 'WHILE':
-                while_scope = 1
-                aux = j
-                while while_scope != 0:
-                    if self.instructions[aux][0].token_type == 'BEGINLOOP':
-                        while_scope += 1
-                    elif self.instructions[aux][0].token_type == 'ENDLOOP':
-                        while_scope -= 1
-                    aux = aux + 1
-                self.get_while(j, aux, arq)
-                j = aux - 1
-
-            j += 1
-
-        arq.write(f"go to L{end_if+1}\n")
-
-        if end_else > instruction_end:
-
-            arq.write(f"L{end_else_loop}:\n")
-
-            teste1 = end_else -1
-
-            while teste1 <= end_else:
-                if len(self.instructions[teste1]) > 1 and self.instructions[teste1][1].token_type == 'ASSIGN':
-                    self.get_attribution(self.instructions[teste1], arq)
-
-                elif len(self.instructions[teste1]) > 1 and self.instructions[teste1][1].token_type == 'LPAREN' and \
-                        self.instructions[teste1][0].token_type == 'IDENTIFIER':
-                    self.get_declaration(self.instructions[teste1], arq)
-
-                elif self.instructions[teste1][0].token_type == 'PRINT':
-                    self.get_print(self.instructions[teste1], arq)
-
-                elif len(self.instructions[teste1]) == 1 and self.instructions[teste1][0].token_type == 'IDENTIFIER':
-                    arq.write(f"{self.instructions[teste1][0].value} = undefined\n")
-
-                elif self.instructions[teste1][0].token_type == 'WHILE':
-                    while_scope = 1
-                    aux = teste1
-                    while while_scope != 0:
-                        if self.instructions[aux][0].token_type == 'BEGINLOOP':
-                            while_scope += 1
-                        elif self.instructions[aux][0].token_type == 'ENDLOOP':
-                            while_scope -= 1
-                        aux = aux + 1
-                    self.get_while(teste1, aux, arq)
-                    teste1 = aux - 1
-
-                teste1 += 1
-
-            arq.write(f"go to L{end_if+1}\n")
-
-        arq.write(f"L{end_if+1}:\n")
-
-        self.labels = end_if + 2
-
-    def get_attribution(self, instruction, arq):
-        if len(instruction) == 3:
-            for item in instruction:
-                arq.write(item.value + " ")
-            arq.write("\n")
-
+            sink.writelines(render(self.code))
+
+    def generate(self, tree: Program) -> list[Quad]:
+        self.get_block(tree.body)
+        return self.code
+
+    def emit(self, op: int, dest=None, arg1=None, arg2=None):
+        self.code.append(Quad(op, dest, arg1, arg2))
+
+    def name(self, name: str) -> Var:
+        var = self.names.get(name)
+        if var is None:
+            var = self.names[name] = Var(name)
+        return var
+
+    def constant(self, value) -> Const:
+        # True == 1, so the type is part of the key
+        key = (type(value), value)
+        constant = self.constants.get(key)
+        if constant is None:
+            constant = self.constants[key] = Const(value)
+        return constant
+
+    def new_label(self) -> Label:
+        label = Label(self.labels)
+        self.labels += 1
+        return label
+
+    def new_temporary(self) -> Temp:
+        temporary = Temp(self.temporaries)
+        self.temporaries += 1
+        return temporary
+
+    def get_block(self, statements: list[Statement]):
+        for statement in statements:
+            self.temporaries = 0
+            self.statements[type(statement)](statement)
+
+    def get_declaration(self, statement: VarDecl):
+        if statement.value is None:
+            self.emit(Op.COPY, self.name(statement.name), self.constant(None))
         else:
-            if instruction[3].token_type == "LPAREN":
-                params = []
-                i = 4
-                while i < len(instruction) and instruction[i].token_type != "RPAREN":
-                    if instruction[i].token_type not in ["COLON", "RPAREN", "LPAREN"]:
-                        params.append(instruction[i].value)
-                    i += 1
-
-                params_str = ", ".join(params)
-                arq.write(f"{instruction[0].value} = call {instruction[2].value}({params_str})\n")
-
-            else:
-                arq.write("t0 = {0} {1} {2}".format(instruction[2].value, instruction[3].value, instruction[4].value) + "\n")
-                anterior = 0
-                i = 5
-                while i < len(instruction):
-                    arq.write("t{0} = t{1} {2} {3}".format(anterior + 1, anterior, instruction[i].value, instruction[i + 1].value) + "\n")
-                    anterior += 1
-                    i += 2
-                arq.write("{0} = t{1}".format(instruction[0].value, anterior) + "\n")
-
-    def get_return(self, instruction, arq):
-        if len(instruction) == 2:
-            for item in instruction:
-                arq.write(item.value + " ")
-            arq.write("\n")
+            self.get_attribution(statement)
 
+    def get_attribution(self, statement):
+        if isinstance(statement.value, Call):
+            self.get_call(statement.value, self.name(statement.name))
         else:
-            if instruction[2].token_type == "LPAREN":
-                params = []
-                i = 3
-                while i < len(instruction) and instruction[i].token_type != "RPAREN":
-                    if instruction[i].token_type not in ["COLON", "RPAREN", "LPAREN"]:
-                        params.append(instruction[i].value)
-                    i += 1
-
-                params_str = ", ".join(params)
-                arq.write(f"{instruction[0].value} call {instruction[1].value}({params_str})\n")
-
-            else:
-                arq.write("t0 = {0} {1} {2}".format(instruction[1].value, instruction[2].value, instruction[3].value) + "\n")
-                anterior = 0
-                i = 4
-                while i < len(instruction):
-                    arq.write("t{0} = t{1} {2} {3}".format(anterior + 1, anterior, instruction[i].value, instruction[i + 1].value) + "\n")
-                    anterior += 1
-                    i += 2
-
-                arq.write("{0} = t{1}".format(instruction[0].value, anterior) + "\n")
-
-    def get_declaration(self, instruction, arq):
-        params = []
-        i = 1
-        while i < len(instruction) and instruction[i].token_type != "RPAREN":
-            if instruction[i].token_type not in ["COLON", "RPAREN", "LPAREN"]:
-                params.append(instruction[i].value)
-            i += 1
-
-        params_str = ", ".join(params)
-        arq.write(f"call {instruction[0].value}({params_str})\n")
-
-    def get_function(self, instruction, arq):
-        params = []
-        i = 2
-        while i < len(instruction) and instruction[i].token_type != "RPAREN":
-            if instruction[i].token_type not in ["COLON", "RPAREN", "LPAREN", "BEGINFUNCTION", "BEGINPROCEDURE"]:
-                params.append(instruction[i].value)
-            i += 1
-
-        params_str = ", ".join(params)
-        arq.write(f"\n{instruction[0].value} {instruction[1].value}({params_str}):\n")
-
-    def get_print(self, instruction, arq):
-        if len(instruction) == 4:
-            for item in instruction:
-                arq.write(item.value + " ")
-            arq.write("\n")
+            self.emit(Op.COPY, self.name(statement.name), self.get_operand(statement.value))
 
+    def get_expression_statement(self, statement: ExprStatement):
+        if isinstance(statement.expression, Call):
+            self.get_call(statement.expression, None)
         else:
-            if instruction[3].token_type == "LPAREN":
-                params = []
-                i = 3
-
-                while i < len(instruction) and instruction[i].token_type != "RPAREN":
-                    if instruction[i].token_type not in ["COLON", "RPAREN", "LPAREN"]:
-                        params.append(instruction[i].value)
-                    i += 1
-
-                params_str = ", ".join(params)
-                arq.write(f"{instruction[0].value} (call {instruction[2].value}({params_str}))\n")
-
+            self.get_operand(statement.expression)
+
+    def get_print(self, statement: Print):
+        self.emit(Op.PRINT, None, tuple(self.get_operand(argument) for argument in statement.arguments))
+
+    def get_return(self, statement: Return):
+        self.emit(Op.RETURN, None, self.get_operand(statement.value))
+
+    def get_break(self, statement: Break):
+        self.emit(Op.GOTO, None, self.loops[-1][1])
+
+    def get_continue(self, statement: Continue):
+        self.emit(Op.GOTO, None, self.loops[-1][0])
+
+    def get_if(self, statement: If):
+        condition = self.get_operand(statement.condition)
+        else_label = self.new_label() if statement.orelse is not None else None
+        end_label = self.new_label()
+
+        self.emit(Op.IF_FALSE, None, condition, else_label or end_label)
+        self.get_block(statement.body)
+        self.emit(Op.GOTO, None, end_label)
+
+        if else_label is not None:
+            self.emit(Op.LABEL, None, else_label)
+            self.get_block(statement.orelse)
+            self.emit(Op.GOTO, None, end_label)
+
+        self.emit(Op.LABEL, None, end_label)
+
+    def get_while(self, statement: While):
+        start_label = self.new_label()
+        end_label = self.new_label()
+
+        self.emit(Op.LABEL, None, start_label)
+        condition = self.get_operand(statement.condition)
+        self.emit(Op.IF_FALSE, None, condition, end_label)
+
+        self.loops.append((start_label, end_label))
+        self.get_block(statement.body)
+        self.loops.pop()
+
+        self.emit(Op.GOTO, None, start_label)
+        self.emit(Op.LABEL, None, end_label)
+
+    def get_function(self, statement):
+        function = isinstance(statement, FunctionDecl)
+        parameters = tuple(self.name(parameter.name) for parameter in statement.parameters)
+
+        # loops around the declaration can't be the target of a break or continue inside it
+        loops, self.loops = self.loops, []
+        self.emit(Op.FUNCTION if function else Op.PROCEDURE, None, self.name(statement.name), parameters)
+        self.get_block(statement.body)
+        if function:
+            self.get_block([statement.return_statement])
+        self.emit(Op.END_FUNCTION if function else Op.END_PROCEDURE)
+        self.loops = loops
+
+    def get_call(self, expression: Call, dest: Optional[Operand]):
+        arguments = tuple(self.get_operand(argument) for argument in expression.arguments)
+        self.emit(Op.CALL, dest, self.name(expression.name), arguments)
+
+    def get_operand(self, expression: Expression) -> Operand:
+        """
+        Emit the instructions that evaluate the expression and return the operand holding its value.
+        """
+        # post-order walk with an explicit stack so deeply nested expressions don't overflow the Python one
+        operands = []
+        pending = [(expression, False)]
+        while pending:
+            node, visited = pending.pop()
+            if isinstance(node, Name):
+                operands.append(self.name(node.name))
+            elif isinstance(node, Literal):
+                operands.append(self.constant(node.value))
+            elif isinstance(node, BinOp):
+                if visited:
+                    right = operands.pop()
+                    left = operands.pop()
+                    temporary = self.new_temporary()
+                    self.emit(BINARY_OPERATORS[node.operator], temporary, left, right)
+                    operands.append(temporary)
+                else:
+                    pending.append((node, True))
+                    pending.append((node.right, False))
+                    pending.append((node.left, False))
+            elif isinstance(node, UnaryOp):
+                if visited:
+                    temporary = self.new_temporary()
+                    self.emit(Op.NOT, temporary, operands.pop())
+                    operands.append(temporary)
+                else:
+                    pending.append((node, True))
+                    pending.append((node.operand, False))
+            elif isinstance(node, Call):
+                arguments = tuple(self.get_operand(argument) for argument in node.arguments)
+                temporary = self.new_temporary()
+                self.emit(Op.CALL, temporary, self.name(node.name), arguments)
+                operands.append(temporary)
             else:
-                arq.write("t0 = {0} {1} {2}".format(instruction[2].value, instruction[3].value, instruction[4].value) + "\n")
-                anterior = 0
-                i = 5
-
-                while i < len(instruction) - 1:
-                    arq.write("t{0} = t{1} {2} {3}".format(anterior + 1, anterior, instruction[i].value, instruction[i + 1].value) + "\n")
-                    anterior += 1
-                    i += 2
-
-                arq.write("{0} = t{1}".format(instruction[0].value, anterior) + "\n")
+                self.error(node)
 
-    def get_endfunction(self, instruction, arq):
-        arq.write(f"{instruction[0].value}\n\n")
+        return operands[0]
 
-    def error(self):
-        raise SyntaxError(f"Unexpected token at line {self.current_token.line} on token {self.current_token}")
+    def error(self, node):
+        raise SyntaxError(f"Unexpected node at line {node.line}: {node}")
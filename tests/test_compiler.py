@@ -1,6 +1,25 @@
+import io
+import operator
+
 import pytest
 
+from cache import CompileCache
+from cfg import (
+    build_blocks,
+    dominator_tree,
+    join_procedures,
+    natural_loops,
+    post_dominator_tree,
+    split_procedures,
+)
 from compiler import Compiler
+from incremental import IncrementalCompiler
+from ir import Const, Label, Op, Quad, Temp, Var, render
+from lexer import Lexer, TextEdit, TokenKind
+from parser import ParseError, Parser, SemanticError
+from optimizer import optimize
+from ssa import from_ssa, to_ssa
+from syntax_tree import Assign, Break, If, Print, VarDecl, While
 
 
 class TestCompiler:
@@ -11,43 +30,132 @@ class TestCompiler:
         assert len(compiler.lexer.tokens) == tokens_length
         assert len(compiler.lexer.symbol_table.values()) == symbol_table_length
 
+    @staticmethod
+    def execute(code):
+        """
+        Run the quadruples and return the values printed. Reading a name that was never assigned raises KeyError.
+        """
+        operations = {
+            Op.ADD: operator.add,
+            Op.SUBTRACT: operator.sub,
+            Op.MULTIPLY: operator.mul,
+            Op.DIVIDE: lambda a, b: int(a / b),
+            Op.MODULE: lambda a, b: a - b * int(a / b),
+            Op.EQUAL: operator.eq,
+            Op.DIFFERENT: operator.ne,
+            Op.GREATER: operator.gt,
+            Op.GREATER_OR_EQUAL: operator.ge,
+            Op.LESS: operator.lt,
+            Op.LESS_OR_EQUAL: operator.le,
+            Op.AND: lambda a, b: a and b,
+            Op.OR: lambda a, b: a or b,
+            Op.SHIFT_LEFT: operator.lshift,
+        }
+        labels = {str(quad.arg1): index for index, quad in enumerate(code) if quad.op == Op.LABEL}
+        headers, ends, opened = {}, {}, []
+        for index, quad in enumerate(code):
+            if quad.op in (Op.FUNCTION, Op.PROCEDURE):
+                headers[str(quad.arg1)] = index
+                opened.append(index)
+            elif quad.op in (Op.END_FUNCTION, Op.END_PROCEDURE):
+                ends[opened.pop()] = index
+        global_values = {}
+        printed = []
+
+        def run(index, parameters):
+            temporaries = {}
+
+            def location(operand):
+                if not isinstance(operand, Var):
+                    return temporaries, (type(operand), operand.index)
+                return parameters if operand.name in parameters else global_values, operand.name
+
+            def read(operand):
+                if isinstance(operand, Const):
+                    return operand.value
+                table, key = location(operand)
+                return table[key]
+
+            def write(operand, value):
+                table, key = location(operand)
+                table[key] = value
+
+            while index < len(code):
+                quad = code[index]
+                if quad.op in (Op.FUNCTION, Op.PROCEDURE):
+                    index = ends[index]
+                elif quad.op in (Op.END_FUNCTION, Op.END_PROCEDURE):
+                    return None
+                elif quad.op == Op.RETURN:
+                    return read(quad.arg1)
+                elif quad.op == Op.COPY:
+                    write(quad.dest, read(quad.arg1))
+                elif quad.op == Op.NOT:
+                    write(quad.dest, not read(quad.arg1))
+                elif quad.op in operations:
+                    write(quad.dest, operations[quad.op](read(quad.arg1), read(quad.arg2)))
+                elif quad.op == Op.PRINT:
+                    printed.append(tuple(read(operand) for operand in quad.arg1))
+                elif quad.op == Op.GOTO:
+                    index = labels[str(quad.arg1)]
+                elif quad.op in (Op.IF_FALSE, Op.IF_TRUE) and read(quad.arg1) == (quad.op == Op.IF_TRUE):
+                    index = labels[str(quad.arg2)]
+                elif quad.op == Op.CALL:
+                    header = headers[str(quad.arg1)]
+                    arguments = [read(argument) for argument in quad.arg2]
+                    result = run(header + 1, dict(zip(map(str, code[header].arg2), arguments)))
+                    if quad.dest is not None:
+                        write(quad.dest, result)
+                index += 1
+
+        run(0, {})
+        return printed
+
+    @classmethod
+    def check_optimized_run(cls, code, passes=None):
+        compiler = Compiler(code, output=io.StringIO(), dump_instructions=False)
+        compiler.compile()
+        expected = cls.execute(compiler.tac_generator.code)
+        compiler = Compiler(code, output=io.StringIO(), dump_instructions=False)
+        compiler.compile()
+        assert cls.execute(optimize(compiler.tac_generator.code, passes)) == expected
+        return expected
+
     def test_successful_function(self):
         code = """
         function sum(int a, int b) -> int {
             return a + b;
         }
         """
-        compiler = Compiler(code)
+        compiler = Compiler(code, output=io.StringIO())
         compiler.compile()
 
         # Testing lexer
-        self.check_tokens_and_symbol_table_length(compiler, 18, 5)
+        self.check_tokens_and_symbol_table_length(compiler, 18, 3)
 
-        variables_in_string = [token.value for token in compiler.lexer.symbol_table]
+        variables_in_string = [symbol.name for symbol in compiler.lexer.symbol_table]
 
         assert "a" in variables_in_string
         assert "b" in variables_in_string
         assert "sum" in variables_in_string
 
         # Testing parser
-        self.check_tokens_and_symbol_table_length(compiler, 18, 5)
+        self.check_tokens_and_symbol_table_length(compiler, 18, 3)
 
-        variables_tokens = [token for token in compiler.parser.symbol_table]
-        for token in variables_tokens:
-            if token.value == "sum" and token.line == 0:
-                symbols = compiler.parser.symbol_table[token]
-                assert symbols["variable_type"] == "INT"
-                assert symbols["variable_value"] is None
+        for symbol in compiler.parser.symbol_table:
+            if symbol.name == "sum":
+                assert symbol.variable_type == "INT"
+                assert symbol.scope == 0
+                assert symbol.variable_value is None
 
-            if token.value == "a" and token.line == 0:
-                symbols = compiler.parser.symbol_table[token]
-                assert symbols["variable_type"] == "INT"
-                assert symbols["variable_value"] is None
+            if symbol.name == "a":
+                assert symbol.variable_type == "INT"
+                assert symbol.variable_value is None
+                assert list(symbol.occurrences) == [2, 3]
 
-            if token.value == "b" and token.line == 0:
-                symbols = compiler.parser.symbol_table[token]
-                assert symbols["variable_type"] == "INT"
-                assert symbols["variable_value"] is None
+            if symbol.name == "b":
+                assert symbol.variable_type == "INT"
+                assert symbol.variable_value is None
 
     def test_unsuccessful_function(self):
         code = """
@@ -102,4 +210,667 @@ class TestCompiler:
         """
         compiler = Compiler(code)
         with pytest.raises(SyntaxError):
-            compiler.compile()
\ No newline at end of file
+            compiler.compile()
+
+    def test_lexer_keywords_and_lines(self):
+        lexer = Lexer("int if_x = 10;\nwhile(if_x>=2){\n  if_x = if_x - 1;}")
+        lexer.lex()
+
+        assert [token.token_type for token in lexer.tokens[:5]] == [
+            "INT",
+            "IDENTIFIER",
+            "ASSIGN",
+            "INTEGER",
+            "SEMICOLON",
+        ]
+        assert lexer.tokens[8].token_type == "GREATER_OR_EQUAL"
+        assert [token.line for token in lexer.tokens][-7:] == [3] * 7
+
+    def test_lexer_invalid_syntax(self):
+        lexer = Lexer("int x = 1;\nint y = 2ab;")
+        with pytest.raises(ValueError, match="line 2"):
+            lexer.lex()
+
+    def test_streaming_from_file(self, tmp_path):
+        source = tmp_path / "program.in"
+        source.write_text("int x = 10;\nwhile (x < 20) {\n    x = x + 1;\n}\n")
+
+        lexer = Lexer("")
+        tokens = lexer.stream_file(str(source))
+        first = next(tokens)
+        assert (first.token_type, first.value, first.line) == ("INT", "int", 1)
+        assert len(lexer.symbol_table) == 0
+
+        eager = Lexer(source.read_text())
+        eager.lex()
+        assert [(t.token_type, t.value, t.line) for t in [first, *tokens]] == [
+            (t.token_type, t.value, t.line) for t in eager.tokens
+        ]
+
+        compiler = Compiler.from_file(str(source))
+        compiler.output = io.StringIO()
+        compiler.compile()
+        assert len(compiler.lexer.symbol_table) == 1
+        assert len(compiler.lexer.symbol_table.lookup("x").occurrences) == 4
+
+    def test_token_buffer_columns(self):
+        lexer = Lexer("int x = 10;\n  x = x + 10;")
+        lexer.lex()
+        tokens = lexer.tokens
+
+        assert len(tokens) == 11
+        assert tokens[5].kind == TokenKind.IDENTIFIER
+        assert (tokens[5].value, tokens[5].line, tokens.columns[5]) == ("x", 2, 2)
+        assert tokens[-2].token_type == "INTEGER"
+        assert tokens.value_ids[3] == tokens.value_ids[9]
+        assert len(tokens.values) == 6
+        assert tokens.symbol_ids[1] == tokens.symbol_ids[5] == tokens.symbol_ids[7]
+        assert tokens.symbol_ids[0] == -1
+
+    def test_relex_edited_lines(self):
+        code = "int x = 10;\nint y = x;\nwhile (x < 20) {\n    x = x + 1;\n}\n"
+        lexer = Lexer(code)
+        lexer.lex()
+
+        # replace "int y = x;" by two lines, shifting the while loop down by one line
+        tokens = lexer.relex(lexer.tokens, TextEdit(2, 0, 2, 10, "int y = x;\nint z = y;"))
+
+        expected = Lexer(lexer.code)
+        expected.lex()
+        assert lexer.code.split("\n")[2] == "int z = y;"
+        assert [(t.token_type, t.value, t.line) for t in tokens] == [
+            (t.token_type, t.value, t.line) for t in expected.tokens
+        ]
+        assert sorted(lexer.symbol_table.lookup("x").occurrences) == [1, 2, 4, 5, 5]
+        assert list(lexer.symbol_table.lookup("z").occurrences) == [3]
+
+    def test_parallel_lexing_matches_serial(self):
+        code = "int x = 10;\nbool flag = true;\n" + "x = x + 1;\nflag = not flag;\n" * 50
+
+        serial = Lexer(code)
+        serial.lex()
+        parallel = Lexer(code)
+        parallel.lex_parallel(workers=2, chunk_size=64)
+
+        assert [(t.token_type, t.value, t.line, t.symbol_id) for t in parallel.tokens] == [
+            (t.token_type, t.value, t.line, t.symbol_id) for t in serial.tokens
+        ]
+        assert list(parallel.tokens.columns) == list(serial.tokens.columns)
+        assert [(s.name, list(s.occurrences)) for s in parallel.symbol_table] == [
+            (s.name, list(s.occurrences)) for s in serial.symbol_table
+        ]
+
+    def test_parallel_lexing_reports_global_line(self):
+        lexer = Lexer("int x = 1;\n" * 20 + "int y = 2ab;\n")
+        with pytest.raises(ValueError, match="line 21"):
+            lexer.lex_parallel(workers=2, chunk_size=32)
+
+    def test_scopes_are_closed(self):
+        code = """
+        while (true) {
+            int y = 2;
+        }
+        while (true) {
+            int y = 3;
+        }
+        """
+        Compiler(code, output=io.StringIO()).compile()
+
+        code = """
+        while (true) {
+            int y = 2;
+        }
+        y = 3;
+        """
+        with pytest.raises(SemanticError, match="used before declaration"):
+            Compiler(code, output=io.StringIO()).compile()
+
+    def test_syntax_tree(self):
+        code = """
+        int x = 0;
+        while (x < 10) {
+            if (x == 5) {
+                break;
+            }
+            x = x + 1;
+        }
+        """
+        output = io.StringIO()
+        compiler = Compiler(code, output=output)
+        compiler.compile()
+
+        declaration, loop = compiler.parser.tree.body
+        assert isinstance(declaration, VarDecl)
+        assert declaration.value.value == 0
+        assert isinstance(loop, While)
+        assert (loop.condition.operator, loop.condition.type, loop.line) == ("<", "BOOL", 3)
+
+        branch, assignment = loop.body
+        assert isinstance(branch, If) and branch.orelse is None
+        assert isinstance(branch.body[0], Break)
+        assert isinstance(assignment, Assign)
+        assert assignment.value.left.name == "x" and assignment.value.type == "INT"
+
+        assert output.getvalue().splitlines() == [
+            "x = 0",
+            "L0:",
+            "t0 = x < 10",
+            "ifFalse t0 go to L1",
+            "t0 = x == 5",
+            "ifFalse t0 go to L2",
+            "go to L1",
+            "go to L2",
+            "L2:",
+            "t0 = x + 1",
+            "x = t0",
+            "go to L0",
+            "L1:",
+        ]
+
+    def test_instruction_listing(self):
+        code = (
+            "function f(int a, int b) -> int { return a - (b - 1); }\n"
+            "int x = 1;\n"
+            "while (x < 3) {\n"
+            "  x = (x + 1) * 2;\n"
+            "  if (not (x == 4)) { break; } else { x = f(x, 1); }\n"
+            "}"
+        )
+        compiler = Compiler(code, output=io.StringIO())
+        compiler.compile()
+        assert not hasattr(compiler.parser, "instructions")
+
+        listing = [" ".join(token.value for token in line) for line in compiler.tac_generator.instructions]
+        assert listing == [
+            "function f ( a , b ) begin_function return a - ( b - 1 ) end_function",
+            "x = 1",
+            "while ( x < 3 ) begin_loop",
+            "x = ( x + 1 ) * 2",
+            "if ( not ( x == 4 ) ) begin_if break end_if else begin_else x = f ( x , 1 ) end_else",
+            "end_loop",
+        ]
+
+        # nothing is listed unless asked for
+        compiler = Compiler(code, output=io.StringIO(), dump_instructions=False)
+        compiler.compile()
+        assert compiler.tac_generator.instructions == []
+
+    def test_break_only_inside_loops(self):
+        code = "while (true) { if (true) { if (false) { continue; } else { break; } } }"
+        Compiler(code, output=io.StringIO()).compile()
+
+        with pytest.raises(SyntaxError):
+            Compiler("if (true) { break; }", output=io.StringIO()).compile()
+
+        with pytest.raises(SyntaxError):
+            Compiler("while (true) { procedure p() { break; } }", output=io.StringIO()).compile()
+
+    def test_unexpected_eof(self):
+        for code, expected in [
+            ("while (true) { int y = 1;", "RBRACE"),
+            ("if (true) { print(1); } else {", "RBRACE"),
+            ("function f() -> int { int a = 1;", "RETURN"),
+            ("int x = (1 +", "expression"),
+            ("print(1", "RPAREN"),
+        ]:
+            with pytest.raises(ParseError, match=f"Expected {expected}, found EOF"):
+                Compiler(code, output=io.StringIO()).compile()
+
+    def test_recovery_reports_every_error(self):
+        code = """
+        int x = true;
+        int y = z + 1;
+        if (x + ) { x = 1; }
+        while (x) { print(x); }
+        int w = y +;
+        print(w);
+        """
+        lexer = Lexer(code)
+        lexer.lex()
+        parser = Parser(recover=True)
+        tree = parser.parse(lexer.tokens, lexer.symbol_table)
+
+        assert [(d.kind, d.line, d.expected, d.found) for d in parser.diagnostics] == [
+            ("semantic", 2, "INT", "BOOL"),
+            ("semantic", 3, None, None),
+            ("syntax", 4, None, "RPAREN"),
+            ("semantic", 5, "BOOL", "INT"),
+            ("syntax", 6, None, "SEMICOLON"),
+        ]
+        assert [type(statement) for statement in tree.body] == [VarDecl, VarDecl, While, Print]
+
+        with pytest.raises(SemanticError):
+            Parser().parse(lexer.tokens, lexer.symbol_table)
+
+        # a block left open reports the missing brace
+        lexer = Lexer("int x = 1;\nwhile (true) { x = x + 1;")
+        lexer.lex()
+        parser = Parser(recover=True)
+        parser.parse(lexer.tokens, lexer.symbol_table)
+        assert [(d.kind, d.line, d.expected, d.found) for d in parser.diagnostics] == [("syntax", 2, "RBRACE", "EOF")]
+
+    def test_operator_precedence(self):
+        output = io.StringIO()
+        compiler = Compiler("int y = 1 + 2 * 3; bool z = y < 2 and not true or y == 7;", output=output)
+        compiler.compile()
+
+        y, z = compiler.parser.tree.body
+        assert (y.value.operator, y.value.right.operator) == ("+", "*")
+        assert (z.value.operator, z.value.left.operator, z.value.right.operator) == ("or", "and", "==")
+        assert z.value.left.right.operator == "not"
+
+        assert output.getvalue().splitlines()[:3] == ["t0 = 2 * 3", "t1 = 1 + t0", "y = t1"]
+
+    def test_deeply_nested_expression(self):
+        depth = 20000
+        code = "bool b = " + "not (" * depth + "true" + ")" * depth + ";\n"
+        code += "int x = " + "(" * depth + "1" + " + 1)" * depth + ";"
+        output = io.StringIO()
+        Compiler(code, output=output).compile()
+
+        lines = output.getvalue().splitlines()
+        assert lines[depth] == f"b = t{depth - 1}"
+        assert lines[-1] == f"x = t{depth - 1}"
+
+    def test_compile_cache(self, tmp_path, capsys):
+        cache = CompileCache(str(tmp_path / "cache"))
+        code = "int x = 1; print(x + 2);"
+        output = tmp_path / "output.txt"
+
+        Compiler(code, cache=cache, output=str(output)).compile()
+        expected = output.read_text()
+        first_run = capsys.readouterr().out
+
+        output.unlink()
+        compiler = Compiler(code, cache=cache, output=str(output))
+        compiler.compile()
+        assert compiler.parser.tree is None
+        assert capsys.readouterr().out == first_run
+        assert output.read_text() == expected
+
+        Compiler("int y = 2;", cache=cache, output=io.StringIO()).compile()
+        assert len(list((tmp_path / "cache").iterdir())) == 2
+        assert cache.size == sum(path.stat().st_size for path in (tmp_path / "cache").iterdir())
+
+        # an entry that doesn't fit evicts the least recently used ones
+        cache.max_size = cache.size
+        Compiler("int z = 3;", cache=cache, output=io.StringIO()).compile()
+        sizes = [path.stat().st_size for path in (tmp_path / "cache").iterdir()]
+        assert len(sizes) < 3 and cache.size == sum(sizes) <= cache.max_size
+
+        cache.max_size = 0
+        cache.evict()
+        assert list((tmp_path / "cache").iterdir()) == []
+
+    def test_incremental_compile(self, tmp_path):
+        code = """int a = 1;
+function f(int x) -> int {
+    return x + a;
+}
+int b = f(2);
+while (b < 10) { b = b + 1; }
+"""
+        output = tmp_path / "output.txt"
+        compiler = IncrementalCompiler(code, output=str(output))
+        compiler.compile()
+        assert compiler.reused == 0
+
+        # only the function changes
+        compiler.edit(TextEdit(3, 11, 3, 16, "x"))
+        compiler.compile()
+        assert compiler.reused == 3
+        assert "return x" in output.read_text().splitlines()
+
+        # the call in b depends on the parameters of f, so it is checked again
+        compiler.edit(TextEdit(2, 11, 2, 16, "bool x"))
+        with pytest.raises(SemanticError, match="parameter in function 'f'"):
+            compiler.compile()
+
+        compiler.edit(TextEdit(1, 0, 1, 0, "\n"))
+        compiler.edit(TextEdit(3, 11, 3, 17, "int x"))
+        tree = compiler.compile()
+        assert compiler.reused == 4
+        assert [statement.line for statement in tree.body] == [2, 3, 6, 7]
+        assert tree.body[1].end_line == 5 and tree.body[3].end_line == 7
+
+        compiler.edit(TextEdit(8, 0, 8, 0, "int b = 3;"))
+        with pytest.raises(SemanticError, match="'b' in line 8 already declared in line 6"):
+            compiler.compile()
+
+    def test_quadruples(self):
+        compiler = Compiler("int x = 1 + 2; x = x * 3;", output=io.StringIO())
+        compiler.compile()
+
+        first, copy, second, assignment = compiler.tac_generator.code
+        assert (first.op, second.op, copy.op, assignment.op) == (Op.ADD, Op.MULTIPLY, Op.COPY, Op.COPY)
+        assert isinstance(first.dest, Temp) and first.dest is not second.dest
+        assert str(first.dest) == str(second.dest) == "t0"
+        assert isinstance(copy.dest, Var) and copy.dest is second.arg1 is assignment.dest
+        assert first.arg1.value == 1 and second.arg2.value == 3
+
+        assert "".join(render(compiler.tac_generator.code)) == "t0 = 1 + 2\nx = t0\nt0 = x * 3\nx = t0\n"
+
+    def test_output_sinks(self, tmp_path, capsys):
+        code = "int x = 1; print(x);"
+
+        stream = io.StringIO()
+        Compiler(code, output=stream, dump_instructions=False).compile()
+        assert stream.getvalue() == "x = 1\nprint x\n"
+        assert capsys.readouterr().out == "Successfully compiled!\n"
+
+        path = tmp_path / "program.tac"
+        Compiler(code, output=path).compile()
+        assert path.read_text() == stream.getvalue()
+        assert "Instrução 1:" in capsys.readouterr().out
+
+        def collect(lines):
+            while True:
+                lines.append((yield))
+
+        lines = []
+        consumer = collect(lines)
+        next(consumer)
+        Compiler(code, output=consumer).compile()
+        assert lines == ["x = 1", "print x"]
+
+    def test_temporary_allocation(self):
+        code = "int a = 1; int b = (a + 1) * (a + 2) - (a + 3) * a;"
+
+        output = io.StringIO()
+        Compiler(code, output=output, dump_instructions=False, reuse_temporaries=True).compile()
+        assert output.getvalue().splitlines()[1:] == [
+            "t0 = a + 1",
+            "t1 = a + 2",
+            "t0 = t0 * t1",
+            "t1 = a + 3",
+            "t1 = t1 * a",
+            "t0 = t0 - t1",
+            "b = t0",
+        ]
+
+        output = io.StringIO()
+        Compiler(code, output=output, dump_instructions=False, registers=1).compile()
+        lines = output.getvalue().splitlines()
+        assert lines[3] == "s1 = r0 * s0"
+        assert not any(f"r{index}" in line for line in lines for index in range(1, 10))
+
+    def test_control_flow_graph(self):
+        code = "int x = 0; while (x < 3) { if (x == 1) { break; } x = x + 1; } print(x);"
+        compiler = Compiler(code, output=io.StringIO())
+        compiler.compile()
+
+        code = compiler.tac_generator.code
+        (procedure,) = split_procedures(code)
+        assert [[successor.index for successor in block.successors] for block in procedure.blocks] == [
+            [1], [2, 6], [3, 5], [6], [5], [1], [],
+        ]
+        assert join_procedures([procedure]) == code
+
+    def test_constant_propagation(self):
+        output = io.StringIO()
+        code = "int x = 10; x = 1000; int y = x; bool b = y == 1000 and true; if (not b) { print(x); } print(y, b);"
+        Compiler(code, output=output, dump_instructions=False, optimize=["constants"]).compile()
+        lines = output.getvalue().splitlines()
+        assert "y = 1000" in lines and "b = true" in lines
+        assert lines[-1] == "print 1000, true"
+        assert not any(line.startswith("ifFalse") for line in lines)
+
+        # a call can change any named variable
+        output = io.StringIO()
+        code = "int x = 1; procedure p() { x = 2; } p(); print(x + 1);"
+        Compiler(code, output=output, dump_instructions=False, optimize=True).compile()
+        assert output.getvalue().splitlines()[-2:] == ["t0 = x + 1", "print t0"]
+
+        with pytest.raises(ValueError):
+            Compiler(code, optimize=["unknown"]).compile()
+
+    def test_dead_code_elimination(self):
+        output = io.StringIO()
+        code = (
+            "int x = 0; int unused = 5; while (x < 3) { x = x + 1; if (x == 2) { continue; } else { break; } "
+            "int y = x * 2; print(x); } unused = 6;"
+        )
+        Compiler(code, output=output, dump_instructions=False, optimize=["dead_code"]).compile()
+        assert output.getvalue().splitlines() == [
+            "x = 0",
+            "L0:",
+            "t0 = x < 3",
+            "ifFalse t0 go to L1",
+            "t0 = x + 1",
+            "x = t0",
+            "t0 = x == 2",
+            "ifFalse t0 go to L2",
+            "go to L0",
+            "L2:",
+            "go to L1",
+            "L1:",
+        ]
+
+        # the procedure can read the variable, and the function's caller can read what it assigns
+        output = io.StringIO()
+        code = "int x = 1; procedure p() { print(x); } function f() -> int { x = 3; return 1; } p(); x = 2; p();"
+        Compiler(code, output=output, dump_instructions=False, optimize=["dead_code"]).compile()
+        lines = output.getvalue().splitlines()
+        assert "x = 1" in lines and "x = 2" in lines and "x = 3" in lines
+
+    def test_jump_threading(self):
+        output = io.StringIO()
+        code = (
+            "int x = 0; while (x < 3) { x = x + 1; if (x == 2) { continue; } "
+            "if (x > 5) { print(x); } else { x = x + 2; } } print(x);"
+        )
+        Compiler(code, output=output, dump_instructions=False, optimize=["jumps"]).compile()
+        assert output.getvalue().splitlines() == [
+            "x = 0",
+            "L0:",
+            "t0 = x < 3",
+            "ifFalse t0 go to L1",
+            "t0 = x + 1",
+            "x = t0",
+            "t0 = x == 2",
+            "ifTrue t0 go to L0",
+            "t0 = x > 5",
+            "ifFalse t0 go to L3",
+            "print x",
+            "go to L0",
+            "L3:",
+            "t0 = x + 2",
+            "x = t0",
+            "go to L0",
+            "L1:",
+            "print x",
+        ]
+
+    def test_value_numbering(self):
+        output = io.StringIO()
+        code = (
+            "int x = 1; int z = 2; int i = 3; int a = z + i; int b = (i + z) * 2; "
+            "print(a, b, z + i, x < 10, 10 > x); i = 4; print(z + i);"
+        )
+        Compiler(code, output=output, dump_instructions=False, optimize=["values", "dead_code"]).compile()
+        assert output.getvalue().splitlines()[3:] == [
+            "t0 = z + i",
+            "a = t0",
+            "t1 = t0 * 2",
+            "b = t1",
+            "t1 = x < 10",
+            "print a, b, t0, t1, t1",
+            "i = 4",
+            "t0 = z + i",
+            "print t0",
+        ]
+
+        # the procedure can change z
+        output = io.StringIO()
+        code = "int z = 2; int i = 3; procedure p() { z = 1; } int a = z + i; p(); int d = z + i; print(a, d);"
+        Compiler(code, output=output, dump_instructions=False, optimize=["values"]).compile()
+        assert output.getvalue().count("t0 = z + i") == 2
+
+    def test_dominators_and_loops(self):
+        compiler = Compiler(
+            "int x = 0; while (x < 3) { int y = 0; while (y < x) { y = y + 1; } if (x == 1) { break; } x = x + 1; } "
+            "print(x);",
+            output=io.StringIO(),
+        )
+        compiler.compile()
+
+        (procedure,) = split_procedures(compiler.tac_generator.code)
+        blocks = procedure.blocks
+        dominators = dominator_tree(blocks)
+        # block 7 is the go to after the break, which is never reached
+        assert dominators.parents == [None, 0, 1, 2, 3, 3, 5, None, 5, 1]
+        assert dominators.dominates(blocks[1], blocks[8]) and not dominators.dominates(blocks[8], blocks[1])
+        assert not dominators.reaches(blocks[7])
+        assert post_dominator_tree(blocks).parents == [1, 9, 3, 5, 3, 9, 9, 8, 1, None]
+
+        # block 1 goes to two returns, so only the virtual exit after them post-dominates it
+        x, loop, end = Var("x"), Label(0), Label(1)
+        exits = build_blocks(
+            [
+                Quad(Op.COPY, x, Const(1)),
+                Quad(Op.GOTO, arg1=loop),
+                Quad(Op.LABEL, arg1=loop),
+                Quad(Op.IF_FALSE, arg1=x, arg2=end),
+                Quad(Op.RETURN, arg1=x),
+                Quad(Op.LABEL, arg1=end),
+                Quad(Op.RETURN, arg1=Const(0)),
+            ]
+        )
+        post_dominators = post_dominator_tree(exits)
+        assert post_dominators.parents == [1, None, None, None]
+        assert all(post_dominators.reaches(block) for block in exits)
+        assert post_dominators.dominates(exits[1], exits[0]) and not post_dominators.dominates(exits[2], exits[0])
+
+        inner, outer = natural_loops(blocks, dominators)
+        assert (inner.header, inner.latches, inner.parent) == (blocks[3], [blocks[4]], outer)
+        assert [block.index for block in outer.blocks] == [1, 2, 3, 4, 5, 8]
+        assert outer.latches == [blocks[8]] and outer.parent is None
+        assert blocks[6] not in outer
+
+    def test_ssa(self):
+        compiler = Compiler(
+            "int x = 0; int s = 0; while (x < 3) { x = x + 1; if (x == 2) { s = s + x; } else { s = s * 2; } } "
+            "print(x, s);",
+            output=io.StringIO(),
+            dump_instructions=False,
+        )
+        compiler.compile()
+        original = "".join(render(compiler.tac_generator.code))
+
+        (procedure,) = split_procedures(compiler.tac_generator.code)
+        variables = to_ssa(procedure)
+        lines = "".join(render(procedure.quads)).splitlines()
+        assert lines[:5] == ["x.1 = 0", "s.1 = 0", "L0:", "x.2 = phi(x.1, x.3)", "s.2 = phi(s.1, s.5)"]
+        assert "s.5 = phi(s.3, s.4)" in lines and lines[-1] == "print x.2, s.2"
+
+        # the copies of the phis and of the temporaries to the variables coalesce away
+        from_ssa(procedure, variables)
+        lines = "".join(render(join_procedures([procedure]))).splitlines()
+        assert "x = x + 1" in lines and "s = s + x" in lines and "s = s * 2" in lines
+        assert len(lines) == len(original.splitlines()) - 3
+
+        # the value a variable is read with before it is assigned is version 0, and the caller sees the last one
+        code = "function f(int n) -> int { int m = 2; n = n + m; return n; }"
+        compiler = Compiler(code, output=io.StringIO(), dump_instructions=False)
+        compiler.compile()
+        procedure = split_procedures(compiler.tac_generator.code)[1]
+        to_ssa(procedure)
+        assert "".join(render(procedure.quads)).splitlines() == [
+            "n.0 = n",
+            "m.1 = 2",
+            "t0.1 = n.0 + m.1",
+            "n.1 = t0.1",
+            "m = m.1",
+            "n = n.1",
+            "return n.1",
+        ]
+
+        # a procedure with a call keeps its variables, whose values the callee can use
+        output = io.StringIO()
+        code = "int x = 1; procedure p() { print(x); } x = 2; int y = x; p(); print(y);"
+        Compiler(code, output=output, dump_instructions=False, optimize=["copies"]).compile()
+        assert output.getvalue().splitlines()[-4:] == ["x = 2", "y = x", "call p()", "print y"]
+
+    def test_loop_invariant_code_motion(self):
+        output = io.StringIO()
+        code = (
+            "int a = 3; int b = 4; int i = 0; int s = 0; while (i < 10) { i = i + 1; int j = 0; "
+            "while (j < i) { j = j + 1; s = s + a * b + j * (a - b) + i * 2; } if (s > 100) { break; } } print(s, i);"
+        )
+        Compiler(code, output=output, dump_instructions=False, optimize=["loops"]).compile()
+        lines = output.getvalue().splitlines()
+        # out of both loops, and out of the inner one
+        assert lines[4:7] == ["t0 = a * b", "t1 = a - b", "L0:"]
+        assert lines[lines.index("j = 0") + 1 : lines.index("L2:")] == ["t2 = i * 2"]
+        assert "s = s + a * b" not in output.getvalue()
+
+        # the procedure can change a, and i is used after the loop
+        output = io.StringIO()
+        code = (
+            "int a = 3; procedure p() { a = a + 1; } int i = 0; int x = 0; "
+            "while (i < 3) { i = 5; x = a * 2; p(); } print(x, i);"
+        )
+        Compiler(code, output=output, dump_instructions=False, optimize=["loops"]).compile()
+        lines = output.getvalue().splitlines()
+        assert lines.index("i = 5") > lines.index("L0:") and lines.index("t0 = a * 2") > lines.index("L0:")
+
+    def test_strength_reduction(self):
+        output = io.StringIO()
+        code = "int i = 0; int s = 0; while (i < 10) { s = s + i * 3; i = i + 2; } print(s);"
+        Compiler(code, output=output, dump_instructions=False, optimize=["induction"]).compile()
+        lines = output.getvalue().splitlines()
+        # the product is computed before the loop and increased with i
+        assert lines[lines.index("t0 = i * 3") + 1] == "L0:"
+        assert lines[lines.index("i = t1") + 1] == "t0 = t0 + 6"
+        assert "t1 = t0" in lines
+
+        output = io.StringIO()
+        code = (
+            "int x = 5; bool b = x > 2; "
+            "print(x * 1 + 0, x * 8, x - x, x / 1, x % 1, x <= x, b == true, b != true, not not b);"
+        )
+        Compiler(code, output=output, dump_instructions=False, optimize=["algebra", "dead_code"]).compile()
+        lines = output.getvalue().splitlines()
+        assert lines[lines.index("b = t0") + 1 :] == [
+            "t0 = x",
+            "t1 = x << 3",
+            "t2 = 0",
+            "t3 = x",
+            "t4 = 0",
+            "t5 = true",
+            "t6 = b",
+            "t7 = not b",
+            "t8 = b",
+            "print t0, t1, t2, t3, t4, t5, t6, t7, t8",
+        ]
+
+    def test_optimized_code_prints_the_same(self):
+        # y holds the value x had on entry, not the one x is given before the return
+        code = "function f(int x) -> int { int y = x; x = x + 1; return y; } print(f(1));"
+        assert self.check_optimized_run(code, ["copies"]) == [(1,)]
+
+        # the copies of the phi of g can't read v, which is only assigned on the other path
+        code = (
+            "int g = 4; procedure p(bool c) { if (c) { int v = g; g = 1; } else { g = g * 8; } } "
+            "p(false); print(g); p(true); print(g);"
+        )
+        assert self.check_optimized_run(code, ["copies"]) == [(32,), (1,)]
+
+        # b and c are assigned before they are read, so nothing copies their values from before the call
+        code = (
+            "bool g = true; procedure f(int p) { if (g) { int c = 0; while (c < 2) { c = c + 1; bool b = p == c; } } } "
+            "f(1); print(1);"
+        )
+        assert self.check_optimized_run(code, ["copies"]) == [(1,)]
+        output = io.StringIO()
+        Compiler(code, output=output, dump_instructions=False, optimize=["copies"]).compile()
+        lines = output.getvalue().splitlines()
+        assert lines[lines.index("procedure f(p):") + 1 : lines.index("L1:")] == ["ifFalse g go to L0", "c = 0"]
+
+        code = (
+            "int a = 3; int b = 0; int i = 0; function f(int n) -> int { int r = n; n = n * 2; return r + n; } "
+            "while (i < 6) { int c = a; a = b; b = c; if (i % 2 == 0) { b = f(b) - i * 4; } i = i + 1; } "
+            "print(a, b, i);"
+        )
+        expected = self.check_optimized_run(code, ["copies"])
+        assert self.check_optimized_run(code) == expected